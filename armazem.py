@@ -0,0 +1,248 @@
+import argparse
+import calendar
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+from dataclasses import fields
+
+import metricas
+from dados_nfse import DadosNFSe
+from modelos import extrair_dados, gravar_linhas_excel
+
+# Armazém local das notas extraídas (SQLite), para consultas entre execuções sem reabrir planilhas:
+# "todas as notas do CNPJ X em julho", "esta Chave de acesso já foi lançada?". Cada execução de
+# modelos.py excel --armazem (ou ingestao.py --armazem) grava as notas em lotes, uma transação por lote;
+# `exportar` gera o Excel ou o arquivo colunar de qualquer filtro sem extrair os PDFs de novo.
+#
+# Os campos ficam com o texto exato da extração (o Excel regenerado é igual ao original); CNPJ (só dígitos)
+# e data de emissão (ISO, AAAA-MM-DD) ganham colunas próprias, indexadas junto com o número do documento
+# e a Chave de acesso. Uma nota é identificada pela Chave de acesso ou, sem ela, pelo caminho completo do
+# arquivo (dois nota.pdf em pastas diferentes são notas diferentes): gravar de novo a mesma nota substitui
+# a anterior. Documentos dos quais nada foi extraído (falha de leitura, PDF sem texto) não são gravados.
+#
+#   python armazem.py consultar --cnpj 43.035.146/0061-16 --mes 2024-07
+#   python armazem.py exportar julho.xlsx --modelo modelo.xlsx --mes 2024-07
+
+logger = logging.getLogger(__name__)
+
+ARMAZEM_PADRAO = os.environ.get('NFSE_ARMAZEM', os.path.join(os.path.expanduser('~'), 'nfs', 'notas.sqlite'))
+TAMANHO_LOTE = 500  # notas por transação
+
+CAMPOS = tuple(campo.name for campo in fields(DadosNFSe))
+
+_REGEX_DATA = re.compile(r'(\d{2})/(\d{2})/(\d{4})')
+_REGEX_MES = re.compile(r'(?:(\d{4})-(\d{2})|(\d{2})/(\d{4}))')
+
+_SQL_INSERIR = (f"INSERT OR REPLACE INTO notas (identificador, arquivo, cnpj, data_emissao, gravado_em, {', '.join(CAMPOS)}) "
+                f"VALUES ({', '.join('?' * (len(CAMPOS) + 5))})")
+
+
+def _conectar(caminho):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    conexao = sqlite3.connect(caminho, timeout=30)
+    conexao.execute('PRAGMA journal_mode=WAL')
+    # Com WAL, NORMAL não corrompe o banco numa queda; no máximo perde o último lote
+    conexao.execute('PRAGMA synchronous=NORMAL')
+    colunas = ',\n'.join(f"            {campo} TEXT NOT NULL" for campo in CAMPOS)
+    conexao.execute(f'''
+        CREATE TABLE IF NOT EXISTS notas (
+            identificador TEXT PRIMARY KEY,
+            arquivo TEXT NOT NULL,
+            cnpj TEXT,
+            data_emissao TEXT,
+            gravado_em REAL NOT NULL,
+{colunas}
+        )''')
+    conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_cnpj ON notas (cnpj, data_emissao)')
+    conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_data ON notas (data_emissao)')
+    conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_numero ON notas (numero_documento)')
+    conexao.execute('CREATE INDEX IF NOT EXISTS idx_notas_chave ON notas (chave_acesso)')
+    return conexao
+
+def somente_digitos(texto):
+    return re.sub(r'\D', '', texto or '')
+
+def data_iso(texto):
+    """
+    Converte DD/MM/AAAA (formato da nota) em AAAA-MM-DD; devolve None se o texto não tiver uma data.
+    Uma data já em ISO é devolvida como está.
+    """
+    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', texto or ''):
+        return texto
+    match = _REGEX_DATA.search(texto or '')
+    return f"{match.group(3)}-{match.group(2)}-{match.group(1)}" if match else None
+
+def _linha(arquivo, caminho_completo, dados, agora):
+    cnpj = somente_digitos(dados.cpf_cnpj)
+    return ((dados.chave_acesso or caminho_completo), arquivo, cnpj if len(cnpj) in (11, 14) else None,
+            data_iso(dados.data), agora) + tuple(getattr(dados, campo) for campo in CAMPOS)
+
+def armazenar(registros, caminho, tamanho_lote=TAMANHO_LOTE, diretorio=None):
+    """
+    Repassa os pares de `registros` sem alterá-los e grava cada nota no armazém, em lotes de
+    `tamanho_lote` notas por transação. Os pares podem ser (arquivo, DadosNFSe) ou (arquivo, texto),
+    como os de modelos.iter_pdfs; os campos do texto ficam no cache de extrair_dados e não são extraídos
+    de novo para o Excel. O que já passou é gravado mesmo se a execução parar no meio.
+    `diretorio` é a pasta dos arquivos quando os pares trazem só o nome (como os de iter_pdfs).
+    """
+    conexao = _conectar(caminho)
+    lote = []
+    try:
+        for registro in registros:
+            arquivo, dados = registro
+            if isinstance(dados, str):
+                with metricas.etapa('campos'):
+                    dados = extrair_dados(dados)
+            if dados == DadosNFSe():
+                metricas.contar('notas_sem_dados')
+                logger.warning("Nada extraído de %s; a nota não foi gravada no armazém", arquivo)
+                yield registro
+                continue
+            caminho_completo = os.path.abspath(os.path.join(diretorio, arquivo) if diretorio else arquivo)
+            lote.append(_linha(arquivo, caminho_completo, dados, time.time()))
+            if len(lote) >= tamanho_lote:
+                _gravar_lote(conexao, lote)
+                lote = []
+            yield registro
+    finally:
+        if lote:
+            _gravar_lote(conexao, lote)
+        conexao.close()
+
+def _gravar_lote(conexao, lote):
+    with metricas.etapa('armazem'):
+        with conexao:
+            conexao.executemany(_SQL_INSERIR, lote)
+    metricas.contar('notas_armazenadas', len(lote))
+    logger.debug("%d notas gravadas no armazém", len(lote))
+
+def intervalo_do_mes(mes):
+    """
+    Devolve (primeiro dia, último dia) em ISO para um mês 'AAAA-MM' ou 'MM/AAAA'.
+    """
+    match = _REGEX_MES.fullmatch(mes.strip())
+    if match:
+        ano, numero = (match.group(1), match.group(2)) if match.group(1) else (match.group(4), match.group(3))
+    if not match or not 1 <= int(numero) <= 12:
+        raise ValueError(f"Mês inválido: {mes} (use AAAA-MM ou MM/AAAA)")
+    ultimo_dia = calendar.monthrange(int(ano), int(numero))[1]
+    return f"{ano}-{numero}-01", f"{ano}-{numero}-{ultimo_dia:02d}"
+
+def _filtros(cnpj=None, inicio=None, fim=None, numero=None, chave=None):
+    condicoes, parametros = [], []
+    if cnpj:
+        condicoes.append('cnpj = ?')
+        parametros.append(somente_digitos(cnpj))
+    for condicao, data in (('data_emissao >= ?', inicio), ('data_emissao <= ?', fim)):
+        if data:
+            iso = data_iso(data)
+            if iso is None:
+                raise ValueError(f"Data inválida: {data} (use AAAA-MM-DD ou DD/MM/AAAA)")
+            condicoes.append(condicao)
+            parametros.append(iso)
+    if numero:
+        condicoes.append('numero_documento = ?')
+        parametros.append(numero)
+    if chave:
+        condicoes.append('chave_acesso = ?')
+        parametros.append(somente_digitos(chave))
+    return (' WHERE ' + ' AND '.join(condicoes) if condicoes else ''), parametros
+
+def consultar(caminho, cnpj=None, inicio=None, fim=None, numero=None, chave=None):
+    """
+    Gera (arquivo, DadosNFSe) das notas do armazém que atendem a todos os filtros, por data de emissão
+    e arquivo. `cnpj` e `chave` aceitam pontuação; `inicio` e `fim` (inclusive) em AAAA-MM-DD ou DD/MM/AAAA.
+    """
+    onde, parametros = _filtros(cnpj, inicio, fim, numero, chave)
+    conexao = _conectar(caminho)
+    try:
+        cursor = conexao.execute(f"SELECT arquivo, {', '.join(CAMPOS)} FROM notas{onde} "
+                                 "ORDER BY data_emissao, arquivo", parametros)
+        for linha in cursor:
+            yield linha[0], DadosNFSe(*linha[1:])
+    finally:
+        conexao.close()
+
+def exportar_do_armazem(caminho, output, template_excel_path=None, **filtros):
+    """
+    Grava as notas filtradas (ver consultar) em `output`: .xlsx a partir de `template_excel_path`,
+    ou .parquet/.csv/.jsonl (ver exportacao.py). Devolve quantas notas foram gravadas.
+    """
+    gravadas = 0
+
+    def notas():
+        nonlocal gravadas
+        for arquivo, dados in consultar(caminho, **filtros):
+            gravadas += 1
+            yield arquivo, dados
+
+    if output.lower().endswith('.xlsx'):
+        if not template_excel_path:
+            raise ValueError("A saída em Excel precisa do modelo (--modelo)")
+        gravar_linhas_excel((dados.linha_excel() for _, dados in notas()), template_excel_path, output)
+    else:
+        # O pandas só é necessário para as saídas colunares
+        from exportacao import dataframe_de_registros, exportar, normalizar_dataframe
+        exportar(normalizar_dataframe(dataframe_de_registros(notas())), output)
+    logger.info("%d notas do armazém exportadas em %s", gravadas, output)
+    return gravadas
+
+def resumo_armazem(caminho):
+    conexao = _conectar(caminho)
+    try:
+        notas, cnpjs, primeira, ultima = conexao.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT cnpj), MIN(data_emissao), MAX(data_emissao) FROM notas').fetchone()
+        return {'notas': notas, 'cnpjs': cnpjs, 'primeira': primeira, 'ultima': ultima}
+    finally:
+        conexao.close()
+
+def _argumentos_de_filtro(parser):
+    parser.add_argument('--cnpj', default=None, help="CPF/CNPJ do prestador (com ou sem pontuação)")
+    parser.add_argument('--de', default=None, help="data de emissão inicial (AAAA-MM-DD ou DD/MM/AAAA)")
+    parser.add_argument('--ate', default=None, help="data de emissão final, inclusive")
+    parser.add_argument('--mes', default=None, help="mês de emissão (AAAA-MM ou MM/AAAA); substitui --de e --ate")
+    parser.add_argument('--numero', default=None, help="número do documento")
+    parser.add_argument('--chave', default=None, help="Chave de acesso")
+
+def _filtros_dos_argumentos(args):
+    inicio, fim = intervalo_do_mes(args.mes) if args.mes else (args.de, args.ate)
+    return {'cnpj': args.cnpj, 'inicio': inicio, 'fim': fim, 'numero': args.numero, 'chave': args.chave}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta e exporta as notas guardadas no armazém local.")
+    parser.add_argument('--armazem', default=ARMAZEM_PADRAO, help="arquivo SQLite do armazém")
+    parser.add_argument('-v', '--verbose', action='store_true', help="mostra o andamento")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    subcomandos.add_parser('status', help="mostra quantas notas e CNPJs estão guardados")
+    consulta = subcomandos.add_parser('consultar', help="lista as notas que atendem aos filtros (código 1 se nenhuma)")
+    _argumentos_de_filtro(consulta)
+    exportacao = subcomandos.add_parser('exportar', help="grava as notas filtradas no Excel ou em um arquivo colunar")
+    exportacao.add_argument('output', help="arquivo de saída (.xlsx, .parquet, .csv ou .jsonl)")
+    exportacao.add_argument('--modelo', default=None, help="modelo Excel (obrigatório para .xlsx)")
+    _argumentos_de_filtro(exportacao)
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    try:
+        if args.comando == 'status':
+            resumo = resumo_armazem(args.armazem)
+            print(f"{resumo['notas']} notas de {resumo['cnpjs']} CNPJs, emitidas de {resumo['primeira']} "
+                  f"a {resumo['ultima']}, em {args.armazem}")
+        elif args.comando == 'consultar':
+            encontradas = 0
+            for arquivo, dados in consultar(args.armazem, **_filtros_dos_argumentos(args)):
+                encontradas += 1
+                print('\t'.join((arquivo, dados.cpf_cnpj, dados.data, dados.numero_documento,
+                                 dados.valor_dos_servicos, dados.chave_acesso)))
+            sys.exit(0 if encontradas else 1)
+        else:
+            exportar_do_armazem(args.armazem, args.output, args.modelo, **_filtros_dos_argumentos(args))
+    except ValueError as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        sys.exit(2)
@@ -0,0 +1,305 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+
+from dados_nfse import COLUNAS_EXCEL
+from modelos import OCR_CONFIG, OCR_DPI, extrair_campos, extrair_dados, main
+from ocr import ocr_disponivel
+from run import executar_tarefas
+
+# Benchmark reprodutível do pipeline com NFS-e sintéticas geradas localmente pelo PyMuPDF.
+# Cada cenário roda o próprio pipeline (modelos.main: iter_pdfs, extract_text_from_pdf e o Excel) sobre
+# um diretório de PDFs; os tempos de abertura, camada de texto, OCR, leitura dos campos e gravação do Excel
+# são os das métricas do pipeline (ver metricas.py), e o resultado sai em JSON para comparar execuções.
+# Cada cenário roda em um processo próprio (ver run.py), de modo que o pico de memória residente de um
+# cenário não herda o dos anteriores:
+#
+#   python benchmark.py --saida base.json
+#   python benchmark.py --comparar base.json        (sai com erro se alguma etapa piorar além da tolerância)
+
+# (tipo, páginas por documento); 'texto' tem camada de texto, 'digitalizado' só imagens,
+# 'misto' é a nota com texto seguida de anexos digitalizados
+CENARIOS = [
+    ('texto', 1), ('texto', 5), ('texto', 20),
+    ('digitalizado', 1), ('digitalizado', 5),
+    ('misto', 5), ('misto', 20),
+]
+DOCUMENTOS_POR_CENARIO = 10
+SEMENTE = 2024
+DPI_DIGITALIZACAO = 150  # resolução das páginas "escaneadas" geradas
+# Partida a frio: cada comando roda em um interpretador novo, como um worker ou uma chamada da linha de comando
+PARTIDAS = {
+    'import_modelos': ['-c', 'import modelos'],
+    'modelos_ajuda': ['modelos.py', '--help'],
+    'import_incremental': ['-c', 'import incremental'],
+}
+REPETICOES_PARTIDA = 5
+
+
+def texto_nfse(rng, numero):
+    """
+    Monta o texto de uma NFS-e no leiaute do BH ISS Digital com valores aleatórios (reprodutíveis pela semente).
+    """
+    valor = rng.randint(10000, 999999) / 100
+    aliquota = rng.choice([2, 3, 5])
+    iss = round(valor * aliquota / 100, 2)
+    cnpj = f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}"
+    data = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"
+    chave = ''.join(rng.choice('0123456789') for _ in range(50))
+
+    def brl(numero_real):
+        return f"{numero_real:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+
+    return (
+        f"NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/{numero} Emitida em: {data} às 09:23:12\n"
+        f"Competência: {data} Código de Verificação: {rng.getrandbits(32):08x}\n"
+        f"EMPRESA SINTETICA {numero} SERVICOS LTDA\n"
+        f"CPF/CNPJ: {cnpj} Inscrição Municipal: 0827308/002-X\n"
+        f"AVE PRESIDENTE CARLOS LUZ, {rng.randint(1, 2000)}, Caiçaras - Cep: 31230-000 Belo Horizonte MG\n"
+        f"Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52\n"
+        f"Discriminação do(s) Serviço(s) Servicos de processamento de numerario\n"
+        f"Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte\n"
+        f"Valor dos serviços: R$ {brl(valor)} (-) Descontos: R$ 0,00\n"
+        f"(-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ {brl(valor)}\n"
+        f"(=) Base de Cálculo: R$ {brl(valor)} (x) Alíquota: {aliquota}% (=)Valor do ISS: R$ {brl(iss)}\n"
+        f"Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00\n"
+        f"Chave de acesso no Ambiente de Dados Nacional: {chave}.\n"
+    )
+
+def texto_anexo(rng, pagina):
+    palavras = ['recibo', 'pagamento', 'comprovante', 'boleto', 'anexo', 'referente', 'servico', 'valor']
+    linhas = [' '.join(rng.choice(palavras) for _ in range(12)) for _ in range(30)]
+    return f"ANEXO {pagina}\n" + "\n".join(linhas)
+
+def _pagina_texto(documento, texto):
+    pagina = documento.new_page()
+    pagina.insert_textbox(fitz.Rect(36, 36, pagina.rect.width - 36, pagina.rect.height - 36), texto, fontsize=9)
+
+def _pagina_digitalizada(documento, texto):
+    # Renderiza uma página de texto e insere só a imagem, como faria um scanner
+    rascunho = fitz.open()
+    _pagina_texto(rascunho, texto)
+    pix = rascunho[0].get_pixmap(dpi=DPI_DIGITALIZACAO, colorspace=fitz.csGRAY)
+    rascunho.close()
+    pagina = documento.new_page()
+    pagina.insert_image(pagina.rect, pixmap=pix)
+
+def gerar_pdf(caminho, tipo, paginas, rng, numero):
+    documento = fitz.open()
+    for indice in range(paginas):
+        texto = texto_nfse(rng, numero) if indice == 0 else texto_anexo(rng, indice)
+        if tipo == 'texto' or (tipo == 'misto' and indice == 0):
+            _pagina_texto(documento, texto)
+        else:
+            _pagina_digitalizada(documento, texto)
+    documento.save(caminho)
+    documento.close()
+
+def gerar_corpus(diretorio, tipo, paginas, documentos, semente):
+    rng = random.Random(f"{semente}-{tipo}-{paginas}")
+    caminhos = []
+    for numero in range(documentos):
+        caminho = os.path.join(diretorio, f"{tipo}_{paginas:03d}_{numero:03d}.pdf")
+        gerar_pdf(caminho, tipo, paginas, rng, numero)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def medir_cenario(diretorio_pdfs, modelo_excel, saida_excel, medir_memoria, workers=1):
+    """
+    Executa modelos.main sobre o diretório do cenário, sem cache, e devolve os tempos de cada etapa
+    registrados pelo pipeline. Com workers=1 a extração roda neste processo e entra no pico de memória Python.
+    """
+    extrair_campos.cache_clear()
+    extrair_dados.cache_clear()
+    if medir_memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resumo = main(diretorio_pdfs, modelo_excel, saida_excel, workers=workers, cache=None)
+    finally:
+        total = time.perf_counter() - inicio
+        if medir_memoria:
+            pico_python = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    contadores = resumo['contadores']
+    documentos = contadores.get('documentos', 0)
+    paginas = contadores.get('paginas_texto', 0) + contadores.get('paginas_ocr', 0)
+    resultado = {
+        'documentos': documentos,
+        'paginas_texto': contadores.get('paginas_texto', 0),
+        'paginas_ocr': contadores.get('paginas_ocr', 0),
+        'erros': contadores.get('erros', 0),
+        'segundos': {etapa: dados['segundos'] for etapa, dados in resumo['etapas'].items()},
+        'segundos_total': round(total, 6),
+        'paginas_por_segundo': round(paginas / total, 2) if total else None,
+        'documentos_por_segundo': round(documentos / total, 2) if total else None,
+    }
+    if medir_memoria:
+        resultado['pico_python_mb'] = round(pico_python / 1e6, 2)
+    return resultado
+
+def medir_cenario_em_processo(nome, diretorio_pdfs, modelo_excel, saida_excel, medir_memoria, workers=1):
+    """
+    Executa medir_cenario em um interpretador novo e acrescenta o pico de memória residente do processo
+    (e dos workers que ele criou), lido pelo os.wait4 de run.py; None onde ele não existe, como no Windows.
+    """
+    arquivo_json = os.path.splitext(saida_excel)[0] + '.json'
+    comando = [sys.executable, os.path.abspath(__file__), '--medir-cenario', diretorio_pdfs, modelo_excel, saida_excel,
+               arquivo_json, '--workers', str(workers)]
+    if medir_memoria:
+        comando.append('--memoria')
+    # A saída do processo do cenário (avisos, andamento) vai para a saída de erros, prefixada pelo nome
+    processo, = executar_tarefas([(nome, comando)], saida=sys.stderr)
+    if processo.codigo != 0:
+        raise RuntimeError(f"O cenário {nome} terminou com o código {processo.codigo}")
+    with open(arquivo_json, encoding='utf-8') as arquivo:
+        resultado = json.load(arquivo)
+    resultado['pico_rss_mb'] = round(processo.pico_rss_kb / 1024, 1) if processo.pico_rss_kb is not None else None
+    return resultado
+
+def medir_partida(repeticoes=REPETICOES_PARTIDA):
+    """
+    Mede o tempo de cada comando de PARTIDAS do início do processo até o fim, em interpretadores novos.
+    """
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    resultado = {}
+    for nome, argumentos in PARTIDAS.items():
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            subprocess.run([sys.executable] + argumentos, cwd=pasta, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=True)
+            tempos.append(time.perf_counter() - inicio)
+        resultado[nome] = {'mediana': round(statistics.median(tempos), 4), 'minimo': round(min(tempos), 4)}
+    return resultado
+
+def _criar_modelo_excel(caminho):
+    import openpyxl
+    wb = openpyxl.Workbook()
+    sheet = wb.active
+    sheet.append(['Benchmark NFS-e'])
+    sheet.append(list(COLUNAS_EXCEL))
+    wb.save(caminho)
+
+def executar(documentos=DOCUMENTOS_POR_CENARIO, semente=SEMENTE, com_ocr=True, medir_memoria=False, diretorio=None):
+    """
+    Gera o corpus sintético, mede cada cenário e devolve o relatório (dicionário serializável em JSON).
+    """
+    com_ocr = com_ocr and ocr_disponivel(OCR_CONFIG)
+    relatorio = {
+        'ambiente': {
+            'python': platform.python_version(),
+            'pymupdf': fitz.VersionBind,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'ocr': com_ocr,
+            'ocr_dpi': OCR_DPI,
+        },
+        'semente': semente,
+        'documentos_por_cenario': documentos,
+        'cenarios': {},
+    }
+    print("Medindo a partida a frio...", file=sys.stderr)
+    relatorio['partida'] = medir_partida()
+
+    with tempfile.TemporaryDirectory() as temporario:
+        diretorio = diretorio or temporario
+        os.makedirs(diretorio, exist_ok=True)
+        modelo_excel = os.path.join(diretorio, 'modelo.xlsx')
+        _criar_modelo_excel(modelo_excel)
+
+        for tipo, paginas in CENARIOS:
+            if tipo != 'texto' and not com_ocr:
+                continue
+            nome = f"{tipo}_{paginas}p"
+            # Um diretório por cenário: é a entrada de modelos.main
+            diretorio_pdfs = os.path.join(diretorio, nome)
+            os.makedirs(diretorio_pdfs, exist_ok=True)
+            gerar_corpus(diretorio_pdfs, tipo, paginas, documentos, semente)
+            print(f"Medindo {nome}...", file=sys.stderr)
+            relatorio['cenarios'][nome] = medir_cenario_em_processo(nome, diretorio_pdfs, modelo_excel,
+                                                                    os.path.join(diretorio, f"{nome}.xlsx"),
+                                                                    medir_memoria)
+
+    return relatorio
+
+def comparar(atual, base, tolerancia):
+    """
+    Compara o tempo de cada etapa com um relatório anterior (mesma semente e cenários) e devolve as
+    regressões acima da tolerância.
+    """
+    regressoes = []
+    for nome, cenario in atual['cenarios'].items():
+        anterior = base['cenarios'].get(nome)
+        if not anterior:
+            continue
+        for etapa, segundos in cenario['segundos'].items():
+            segundos_base = anterior['segundos'].get(etapa)
+            if not segundos_base:
+                continue
+            razao = segundos / segundos_base
+            print(f"{nome:16} {etapa:8} {segundos_base:10.4f}s -> {segundos:10.4f}s  x{razao:.2f}", file=sys.stderr)
+            if razao > 1 + tolerancia:
+                regressoes.append((nome, etapa, razao))
+    for nome, partida in atual.get('partida', {}).items():
+        anterior = base.get('partida', {}).get(nome)
+        if not anterior:
+            continue
+        razao = partida['mediana'] / anterior['mediana']
+        print(f"{'partida':16} {nome:8} {anterior['mediana']:10.4f}s -> {partida['mediana']:10.4f}s  x{razao:.2f}",
+              file=sys.stderr)
+        if razao > 1 + tolerancia:
+            regressoes.append(('partida', nome, razao))
+    return regressoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de NFS-e com PDFs sintéticos.")
+    parser.add_argument('--documentos', type=int, default=DOCUMENTOS_POR_CENARIO, help="documentos por cenário")
+    parser.add_argument('--semente', type=int, default=SEMENTE)
+    parser.add_argument('--sem-ocr', action='store_true', help="pula os cenários com páginas digitalizadas")
+    parser.add_argument('--memoria', action='store_true',
+                        help="mede o pico de memória Python de cada cenário (tracemalloc deixa a execução mais lenta)")
+    parser.add_argument('--diretorio', help="mantém os PDFs gerados neste diretório")
+    parser.add_argument('--saida', default='bench_output.json', help="arquivo do relatório JSON ('-' para a saída padrão)")
+    parser.add_argument('--comparar', help="relatório JSON anterior para detectar regressões")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="piora relativa aceita por etapa (padrão: 0.2)")
+    # Uso interno: o processo de um cenário (ver medir_cenario_em_processo)
+    parser.add_argument('--medir-cenario', nargs=4, metavar=('PDFS', 'MODELO', 'EXCEL', 'JSON'), help=argparse.SUPPRESS)
+    parser.add_argument('--workers', type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir_cenario:
+        diretorio_pdfs, modelo_excel, saida_excel, arquivo_json = args.medir_cenario
+        resultado = medir_cenario(diretorio_pdfs, modelo_excel, saida_excel, args.memoria, args.workers)
+        with open(arquivo_json, 'w', encoding='utf-8') as arquivo:
+            json.dump(resultado, arquivo, ensure_ascii=False)
+        sys.exit(0)
+
+    relatorio = executar(args.documentos, args.semente, not args.sem_ocr, args.memoria, args.diretorio)
+    conteudo = json.dumps(relatorio, ensure_ascii=False, indent=2)
+    if args.saida == '-':
+        print(conteudo)
+    else:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(conteudo)
+        print(f"Relatório salvo em {args.saida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            regressoes = comparar(relatorio, json.load(arquivo), args.tolerancia)
+        for nome, etapa, razao in regressoes:
+            print(f"Regressão: {nome} / {etapa} ficou {razao:.2f}x mais lento", file=sys.stderr)
+        sys.exit(1 if regressoes else 0)
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+
+# Cache em disco do texto extraído dos PDFs, endereçado pelo conteúdo do arquivo.
+# Cada página é guardada pela chave (SHA-256 do PDF, configuração de extração, índice da página),
+# de modo que um PDF renomeado ou copiado reaproveita o texto e um PDF alterado gera chave nova.
+
+CACHE_PADRAO = os.environ.get('NFSE_CACHE', os.path.join(os.path.expanduser('~'), 'nfs', 'cache_texto.sqlite'))
+TAMANHO_MAXIMO = 512 * 1024 * 1024  # bytes de texto mantidos antes de descartar os documentos menos usados
+
+
+def hash_arquivo(pdf_path):
+    """
+    Calcula o SHA-256 do arquivo lendo em blocos, sem carregar o PDF inteiro em memória.
+    Um PDF já em memória (bytes, bytearray ou memoryview) é resumido diretamente.
+    """
+    if not isinstance(pdf_path, (str, os.PathLike)):
+        return hashlib.sha256(pdf_path).hexdigest()
+    sha = hashlib.sha256()
+    with open(pdf_path, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def _conectar(caminho):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    # Vários workers do pool usam o mesmo arquivo: WAL permite leitura enquanto outro processo grava
+    conexao = sqlite3.connect(caminho, timeout=30)
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.execute('''
+        CREATE TABLE IF NOT EXISTS documentos (
+            sha256 TEXT NOT NULL,
+            config TEXT NOT NULL,
+            paginas INTEGER NOT NULL,
+            tamanho INTEGER NOT NULL,
+            acessado_em REAL NOT NULL,
+            PRIMARY KEY (sha256, config)
+        )''')
+    conexao.execute('''
+        CREATE TABLE IF NOT EXISTS paginas (
+            sha256 TEXT NOT NULL,
+            config TEXT NOT NULL,
+            pagina INTEGER NOT NULL,
+            texto TEXT NOT NULL,
+            PRIMARY KEY (sha256, config, pagina)
+        )''')
+    conexao.execute('CREATE INDEX IF NOT EXISTS idx_documentos_acesso ON documentos (acessado_em)')
+    return conexao
+
+def ler_cache(caminho, sha256, config):
+    """
+    Retorna a lista com o texto de cada página do PDF, ou None se o documento não estiver completo no cache.
+    """
+    conexao = _conectar(caminho)
+    try:
+        documento = conexao.execute(
+            'SELECT paginas FROM documentos WHERE sha256 = ? AND config = ?', (sha256, config)).fetchone()
+        if documento is None:
+            return None
+        linhas = conexao.execute(
+            'SELECT texto FROM paginas WHERE sha256 = ? AND config = ? ORDER BY pagina', (sha256, config)).fetchall()
+        if len(linhas) != documento[0]:
+            return None
+        with conexao:
+            conexao.execute('UPDATE documentos SET acessado_em = ? WHERE sha256 = ? AND config = ?',
+                            (time.time(), sha256, config))
+        return [linha[0] for linha in linhas]
+    finally:
+        conexao.close()
+
+def gravar_cache(caminho, sha256, config, paginas, tamanho_maximo=TAMANHO_MAXIMO):
+    """
+    Grava o texto de todas as páginas do PDF e descarta os documentos menos usados se o cache passar do limite.
+    """
+    tamanho = sum(len(texto.encode('utf-8')) for texto in paginas)
+    conexao = _conectar(caminho)
+    try:
+        with conexao:
+            conexao.execute('DELETE FROM paginas WHERE sha256 = ? AND config = ?', (sha256, config))
+            conexao.executemany(
+                'INSERT INTO paginas (sha256, config, pagina, texto) VALUES (?, ?, ?, ?)',
+                [(sha256, config, indice, texto) for indice, texto in enumerate(paginas)])
+            conexao.execute(
+                'INSERT OR REPLACE INTO documentos (sha256, config, paginas, tamanho, acessado_em) VALUES (?, ?, ?, ?, ?)',
+                (sha256, config, len(paginas), tamanho, time.time()))
+        _descartar_excesso(conexao, tamanho_maximo)
+    finally:
+        conexao.close()
+
+def _descartar_excesso(conexao, tamanho_maximo):
+    total = conexao.execute('SELECT COALESCE(SUM(tamanho), 0) FROM documentos').fetchone()[0]
+    if total <= tamanho_maximo:
+        return
+    # Remove os documentos acessados há mais tempo até ficar em 90% do limite
+    alvo = tamanho_maximo * 0.9
+    removidos = []
+    for sha256, config, tamanho in conexao.execute(
+            'SELECT sha256, config, tamanho FROM documentos ORDER BY acessado_em'):
+        if total <= alvo:
+            break
+        removidos.append((sha256, config))
+        total -= tamanho
+    with conexao:
+        conexao.executemany('DELETE FROM paginas WHERE sha256 = ? AND config = ?', removidos)
+        conexao.executemany('DELETE FROM documentos WHERE sha256 = ? AND config = ?', removidos)
+
+def invalidar_cache(caminho, sha256=None):
+    """
+    Remove do cache um documento (pelo SHA-256) ou, sem argumento, todo o conteúdo. Retorna quantos documentos saíram.
+    """
+    conexao = _conectar(caminho)
+    try:
+        with conexao:
+            if sha256 is None:
+                removidos = conexao.execute('DELETE FROM documentos').rowcount
+                conexao.execute('DELETE FROM paginas')
+            else:
+                removidos = conexao.execute('DELETE FROM documentos WHERE sha256 = ?', (sha256,)).rowcount
+                conexao.execute('DELETE FROM paginas WHERE sha256 = ?', (sha256,))
+        conexao.execute('VACUUM')
+        return removidos
+    finally:
+        conexao.close()
+
+def resumo_cache(caminho):
+    conexao = _conectar(caminho)
+    try:
+        documentos, paginas, tamanho = conexao.execute(
+            'SELECT COUNT(*), COALESCE(SUM(paginas), 0), COALESCE(SUM(tamanho), 0) FROM documentos').fetchone()
+        return {'documentos': documentos, 'paginas': paginas, 'tamanho': tamanho}
+    finally:
+        conexao.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerencia o cache de texto extraído dos PDFs.")
+    parser.add_argument('--cache', default=CACHE_PADRAO, help="arquivo SQLite do cache")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    subcomandos.add_parser('status', help="mostra documentos, páginas e bytes guardados")
+    limpar = subcomandos.add_parser('limpar', help="invalida o cache inteiro ou apenas alguns PDFs")
+    limpar.add_argument('pdfs', nargs='*', help="PDFs a invalidar (pelo conteúdo atual)")
+    limpar.add_argument('--sha256', action='append', default=[], help="SHA-256 de um documento a invalidar")
+    args = parser.parse_args()
+
+    if args.comando == 'status':
+        resumo = resumo_cache(args.cache)
+        print(f"{resumo['documentos']} documentos, {resumo['paginas']} páginas, {resumo['tamanho']} bytes em {args.cache}")
+    else:
+        alvos = args.sha256 + [hash_arquivo(pdf) for pdf in args.pdfs]
+        if alvos:
+            removidos = sum(invalidar_cache(args.cache, sha256) for sha256 in alvos)
+        else:
+            removidos = invalidar_cache(args.cache)
+        print(f"{removidos} documentos removidos do cache")
@@ -0,0 +1,59 @@
+from dataclasses import dataclass, fields
+
+# Tipos comuns ao motor de extração (modelos.py) e aos leiautes (leiautes.py): os campos de uma NFS-e,
+# as colunas do Excel e os valores de "não encontrado". Este módulo não importa nenhum dos dois.
+
+# Colunas do modelo Excel (A, B, C, ...) na ordem em que são preenchidas
+COLUNAS_EXCEL = (
+    'cpf_cnpj', 'razao_social', 'uf', 'municipio', 'endereco', 'numero_documento', 'serie',
+    'data', 'situacao', 'acumulador', 'cfop', 'valor_dos_servicos', 'valor_descontos',
+    'valor_contabil', 'base_calculo', 'aliquota_iss', 'valor_iss_normal', 'valor_iss_retido',
+    'valor_irrf', 'valor_pis', 'valor_cofins', 'valor_csll',
+)
+
+
+@dataclass(frozen=True)
+class DadosNFSe:
+    """
+    Campos de uma NFS-e, como o extrator de cada leiaute os devolve (ver leiautes.py). Os valores padrão
+    são os textos que cada extract_* de modelos.py devolve quando o campo não é encontrado.
+    """
+    cpf_cnpj: str = "Não Encontrado"
+    razao_social: str = "CNPJ NÃO ENCONTRADO NO TEXTO."
+    uf: str = "Não Encontrado"
+    municipio: str = "Município não encontrado."
+    endereco: str = "Endereço não encontrado."
+    numero_documento: str = "Número do documento não encontrado."
+    serie: str = ""
+    data: str = "Não Encontrado"
+    situacao: str = "0"
+    acumulador: str = ""
+    cfop: str = ""
+    valor_dos_servicos: str = "Não Encontrado"
+    valor_descontos: str = "Não Encontrado"
+    valor_contabil: str = "Não Encontrado"
+    base_calculo: str = "Não Encontrado"
+    aliquota_iss: str = ""
+    valor_iss_normal: str = ""
+    valor_iss_retido: str = ""
+    valor_irrf: str = ""
+    valor_pis: str = ""
+    valor_cofins: str = ""
+    valor_csll: str = ""
+    # Chave de acesso da nota (44 dígitos ou mais); identifica a mesma nota em PDFs diferentes
+    chave_acesso: str = ""
+
+    def linha_excel(self):
+        return [getattr(self, coluna) for coluna in COLUNAS_EXCEL]
+
+    def campos_encontrados(self):
+        """
+        Devolve {campo: True/False} para as colunas do Excel, False quando o campo ficou com o valor padrão.
+        """
+        return {coluna: getattr(self, coluna) != PADROES_NFSE[coluna] for coluna in COLUNAS_EXCEL}
+
+PADROES_NFSE = {campo.name: campo.default for campo in fields(DadosNFSe)}
+
+# Campos que toda NFS-e preenche; a leitura sob demanda para quando todos eles são encontrados.
+# Os campos cujo padrão é vazio (alíquota, retenções) podem faltar na própria nota e não entram aqui.
+CAMPOS_OBRIGATORIOS = tuple(coluna for coluna in COLUNAS_EXCEL if PADROES_NFSE[coluna] not in ('', '0'))
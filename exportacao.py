@@ -0,0 +1,171 @@
+import argparse
+import logging
+import os
+from functools import partial
+
+import pandas as pd
+
+import metricas
+from cache_texto import CACHE_PADRAO
+from dados_nfse import CAMPOS_OBRIGATORIOS, COLUNAS_EXCEL, PADROES_NFSE
+from modelos import (MAX_PAGINAS, OCR_DPI_ALTO, adicionar_opcoes_de_execucao, extract_text_from_pdf, extrair_dados,
+                     gravar_linhas_excel, iterar_em_pool, listar_pdfs)
+
+# Exportação colunar das notas (Parquet, CSV ou JSON lines) com tipos de verdade, para que os processos
+# seguintes não precisem reinterpretar o Excel. Os campos saem do motor de extração como texto no formato
+# do documento ("2.921,54", "5%", "15/07/2024"); aqui cada coluna é convertida de uma vez, com operações
+# vetorizadas do pandas, e os textos de "não encontrado" viram valores ausentes.
+
+logger = logging.getLogger(__name__)
+
+COLUNAS_MONETARIAS = (
+    'valor_dos_servicos', 'valor_descontos', 'valor_contabil', 'base_calculo', 'valor_iss_normal',
+    'valor_iss_retido', 'valor_irrf', 'valor_pis', 'valor_cofins', 'valor_csll',
+)
+COLUNAS_PERCENTUAIS = ('aliquota_iss',)
+COLUNAS_DATA = ('data',)
+COLUNAS_DOCUMENTO = ('cpf_cnpj',)
+COLUNAS = ('arquivo',) + COLUNAS_EXCEL + ('chave_acesso',)
+
+# Formatos aceitos antes da conversão; o resto (capturas erradas do texto) vira ausente em vez de um número falso
+_FORMATO_MONETARIO = r'(?:R\$\s*)?-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d{1,2})?'
+_FORMATO_PERCENTUAL = r'\d+(?:,\d+)?\s*%'
+# Campos cujo valor padrão é um valor de verdade, não a falta dele
+_PADRAO_E_VALOR = {'situacao'}
+FORMATOS_SAIDA = {'.parquet': 'parquet', '.csv': 'csv', '.jsonl': 'jsonl', '.json': 'jsonl'}
+
+
+def dataframe_de_registros(registros):
+    """
+    Monta o DataFrame (ainda só com textos) a partir de pares (arquivo, DadosNFSe), coluna por coluna.
+    """
+    colunas = {coluna: [] for coluna in COLUNAS}
+    for arquivo, dados in registros:
+        colunas['arquivo'].append(arquivo)
+        for coluna in COLUNAS[1:]:
+            colunas[coluna].append(getattr(dados, coluna))
+    return pd.DataFrame(colunas, columns=list(COLUNAS), dtype='string')
+
+def normalizar_dataframe(df):
+    """
+    Converte as colunas em tipos adequados, cada uma em uma única operação vetorizada:
+    valores em reais -> float, alíquota -> fração (5% -> 0.05), data -> datetime64, CPF/CNPJ -> só os dígitos.
+    Os textos padrão de campo não encontrado viram ausentes (NA/NaN/NaT).
+    """
+    df = df.copy()
+    for coluna in df.columns:
+        padrao = PADROES_NFSE.get(coluna)
+        if padrao is not None and coluna not in _PADRAO_E_VALOR:
+            df[coluna] = df[coluna].astype('string').str.strip().mask(lambda serie: serie.isin([padrao, '']))
+
+    for coluna in COLUNAS_MONETARIAS:
+        if coluna in df:
+            df[coluna] = _converter_monetario(df[coluna])
+    for coluna in COLUNAS_PERCENTUAIS:
+        if coluna in df:
+            serie = df[coluna].where(df[coluna].str.fullmatch(_FORMATO_PERCENTUAL).fillna(False))
+            df[coluna] = pd.to_numeric(serie.str.replace(r'\s*%', '', regex=True).str.replace(',', '.', regex=False),
+                                       errors='coerce').astype('float64') / 100
+    for coluna in COLUNAS_DATA:
+        if coluna in df:
+            df[coluna] = pd.to_datetime(df[coluna], format='%d/%m/%Y', errors='coerce')
+    for coluna in COLUNAS_DOCUMENTO:
+        if coluna in df:
+            digitos = df[coluna].str.replace(r'\D', '', regex=True)
+            # 14 dígitos (CNPJ) ou 11 (CPF); o texto fica para não perder zeros à esquerda
+            df[coluna] = digitos.where(digitos.str.len().isin([11, 14]))
+    return df
+
+def _converter_monetario(serie):
+    valida = serie.str.fullmatch(_FORMATO_MONETARIO).fillna(False)
+    numeros = (serie.where(valida)
+               .str.replace(r'R\$\s*', '', regex=True)
+               .str.replace('.', '', regex=False)
+               .str.replace(',', '.', regex=False))
+    return pd.to_numeric(numeros, errors='coerce').astype('float64')
+
+def exportar(df, caminho, formato=None):
+    """
+    Grava o DataFrame em Parquet, CSV ou JSON lines, pelo `formato` ou pela extensão do `caminho`.
+    Datas saem em ISO 8601 no CSV e no JSON lines.
+    """
+    formato = formato or FORMATOS_SAIDA.get(os.path.splitext(caminho)[1].lower())
+    with metricas.etapa('exportacao'):
+        if formato == 'parquet':
+            # Requer pyarrow (ou fastparquet)
+            df.to_parquet(caminho, index=False)
+        elif formato == 'csv':
+            df.to_csv(caminho, index=False, date_format='%Y-%m-%d')
+        elif formato == 'jsonl':
+            df.to_json(caminho, orient='records', lines=True, date_format='iso', force_ascii=False)
+        else:
+            raise ValueError(f"Formato de saída desconhecido para {caminho}: use .parquet, .csv ou .jsonl")
+    logger.info("%d notas exportadas em %s", len(df), caminho)
+
+def iter_registros(input_directory, workers=None, cache=None, campos=None, max_paginas=MAX_PAGINAS,
+                   dpi_alto=OCR_DPI_ALTO):
+    """
+    Gera (arquivo, DadosNFSe) em ordem alfabética, extraindo cada PDF em um processo do pool.
+    """
+    pdf_files = listar_pdfs(input_directory)
+    pdf_paths = [os.path.join(input_directory, filename) for filename in pdf_files]
+    extrair = partial(extract_text_from_pdf, cache=cache, campos=campos, max_paginas=max_paginas, dpi_alto=dpi_alto)
+    textos = iterar_em_pool(extrair, pdf_paths, workers, padrao="")
+    for filename, texto in zip(pdf_files, textos):
+        with metricas.etapa('campos'):
+            dados = extrair_dados(texto)
+        metricas.registrar_campos(filename, dados.campos_encontrados())
+        yield filename, dados
+
+def main_exportacao(input_directory, saidas, template_excel_path=None, output_excel_path=None, workers=None,
+                    cache=CACHE_PADRAO, metricas_jsonl=None, sob_demanda=False, max_paginas=MAX_PAGINAS,
+                    dpi_alto=OCR_DPI_ALTO, perfil=None):
+    """
+    Extrai os PDFs e grava cada arquivo de `saidas` (.parquet, .csv, .jsonl) com as colunas tipadas.
+    Com `template_excel_path` e `output_excel_path`, o Excel do modelo é gravado na mesma passagem.
+    `metricas_jsonl` e `perfil` funcionam como em modelos.main.
+    """
+    with metricas.execucao(metricas_jsonl, perfil):
+        return _exportar_pdfs(input_directory, saidas, template_excel_path, output_excel_path, workers, cache,
+                              sob_demanda, max_paginas, dpi_alto)
+
+def _exportar_pdfs(input_directory, saidas, template_excel_path, output_excel_path, workers, cache, sob_demanda,
+                   max_paginas, dpi_alto):
+    registros = []
+    campos = CAMPOS_OBRIGATORIOS if sob_demanda else None
+
+    def coletar():
+        for filename, dados in iter_registros(input_directory, workers, cache, campos, max_paginas, dpi_alto):
+            registros.append((filename, dados))
+            yield dados.linha_excel()
+
+    if output_excel_path:
+        gravar_linhas_excel(coletar(), template_excel_path, output_excel_path)
+    else:
+        for _ in coletar():
+            pass
+
+    with metricas.etapa('normalizacao'):
+        df = normalizar_dataframe(dataframe_de_registros(registros))
+    for caminho in saidas:
+        exportar(df, caminho)
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrai as NFS-e e exporta em Parquet, CSV ou JSON lines com tipos.")
+    parser.add_argument('input_directory')
+    parser.add_argument('saidas', nargs='+', help="arquivos de saída (.parquet, .csv, .jsonl)")
+    parser.add_argument('--excel', nargs=2, metavar=('MODELO', 'SAIDA'), default=(None, None),
+                        help="também grava o Excel a partir do modelo")
+    parser.add_argument('--sob-demanda', action='store_true',
+                        help="para de ler cada PDF quando os campos obrigatórios são encontrados")
+    parser.add_argument('--max-paginas', type=int, default=MAX_PAGINAS, help="páginas lidas no máximo por PDF")
+    parser.add_argument('--dpi-alto', type=int, default=OCR_DPI_ALTO,
+                        help="reconhece de novo nesta resolução as páginas digitalizadas em que faltaram campos")
+    adicionar_opcoes_de_execucao(parser)
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    main_exportacao(args.input_directory, args.saidas, args.excel[0], args.excel[1], args.workers, args.cache,
+                    args.metricas, args.sob_demanda, args.max_paginas, args.dpi_alto, args.perfil)
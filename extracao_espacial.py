@@ -0,0 +1,367 @@
+import argparse
+import logging
+import os
+import re
+from dataclasses import replace
+from functools import partial
+
+import fitz  # PyMuPDF
+
+import metricas
+from cache_texto import CACHE_PADRAO
+from dados_nfse import PADROES_NFSE, DadosNFSe
+from modelos import (adicionar_opcoes_de_execucao, extract_text_from_pdf, extrair_dados, gravar_linhas_excel,
+                     iterar_em_pool, listar_pdfs)
+
+# Extração de campos pela posição das palavras na página, para o que as expressões sobre o texto achatado
+# não encontram (leiautes de tabela, valor abaixo do rótulo). As palavras vêm de page.get_text("words")
+# com suas caixas; cada página é agrupada em linhas visuais e os rótulos são localizados uma única vez,
+# na ordem de leitura (um rótulo quebrado entre duas linhas também é reconhecido). O valor de cada campo
+# é a primeira palavra válida à direita do rótulo na mesma linha (até o próximo rótulo) ou, em leiautes
+# de tabela, logo abaixo dele.
+# O extrator do leiaute da nota (modelos.extrair_dados) continua valendo para os campos que encontra: a
+# posição das palavras preenche os que ele deixou sem valor e só substitui um valor encontrado quando este não tem o
+# formato do campo (ex.: "MG Telefone" como UF) e o da posição tem. Nos campos de texto livre (razão
+# social, endereço, município) o motor de texto sempre prevalece.
+
+logger = logging.getLogger(__name__)
+
+_VALOR = r'\d{1,3}(?:\.\d{3})*,\d{2}'
+
+# campo -> (rótulos possíveis, padrão do valor, modo)
+# Modos: 'direita' procura só na linha do rótulo; 'direita_ou_abaixo' também na linha logo abaixo;
+# 'resto_da_linha' junta as palavras até o próximo rótulo e aplica o padrão (grupo 1, se houver).
+CAMPOS_ESPACIAIS = {
+    'cpf_cnpj': (['CPF/CNPJ'], r'[\d./-]{11,}', 'direita_ou_abaixo'),
+    'uf': (['Belo Horizonte'], r'[A-Z]{2}', 'direita'),
+    'municipio': (['Cod/Município da incidência do ISSQN'], r'\d{7}\s*/\s*([^/]+)', 'resto_da_linha'),
+    'numero_documento': (['Nº'], r'\d+/[\d/]+', 'direita_ou_abaixo'),
+    'serie': (['Série'], r'\d+', 'direita_ou_abaixo'),
+    'data': (['Emitida em'], r'\d{2}/\d{2}/\d{4}', 'direita_ou_abaixo'),
+    'situacao': (['Situação', 'Situacao'], r'\d', 'direita_ou_abaixo'),
+    'acumulador': (['Acumulador'], r'\w[\w ]*', 'resto_da_linha'),
+    'cfop': (['CFOP'], r'\d+', 'direita_ou_abaixo'),
+    'valor_dos_servicos': (['Valor dos serviços'], _VALOR, 'direita_ou_abaixo'),
+    'valor_descontos': (['Descontos'], _VALOR, 'direita_ou_abaixo'),
+    'valor_contabil': (['Valor Líquido'], _VALOR, 'direita_ou_abaixo'),
+    'base_calculo': (['Base de Cálculo'], _VALOR, 'direita_ou_abaixo'),
+    'aliquota_iss': (['Alíquota'], r'\d+(?:,\d+)?%', 'direita_ou_abaixo'),
+    'valor_iss_normal': (['Valor do ISS'], _VALOR, 'direita_ou_abaixo'),
+    'valor_iss_retido': (['ISS Retido na Fonte'], _VALOR, 'direita_ou_abaixo'),
+    'valor_irrf': (['IR', 'IRRF'], _VALOR, 'direita_ou_abaixo'),
+    'valor_pis': (['PIS'], _VALOR, 'direita_ou_abaixo'),
+    'valor_cofins': (['COFINS'], _VALOR, 'direita_ou_abaixo'),
+    'valor_csll': (['CSLL'], _VALOR, 'direita_ou_abaixo'),
+    'chave_acesso': (['Chave de acesso'], r'\d{44,}', 'direita'),
+    'razao_social': (['Nome/Razão Social'], r'\S.*', 'resto_da_linha'),
+}
+# Rótulos usados só como referência de posição (endereço e razão social no leiaute do BH ISS Digital);
+# "Tomador" marca o início dos dados do tomador, que não entram no endereço do prestador
+_ROTULOS_AUXILIARES = {'cep': ['Cep'], 'codigo_verificacao': ['Código de Verificação'],
+                       'inscricao_municipal': ['Inscrição Municipal'], 'tomador': ['Tomador']}
+# Rótulos que também aparecem como texto comum ("Belo Horizonte") e por isso não encerram o valor de outro campo
+_ROTULOS_LIVRES = {'uf'}
+
+_REGEX_BORDAS = re.compile(r'^\W+|\W+$')
+_REGEX_CODIGO = re.compile(r'[\w\d]+')
+_REGEX_INSCRICAO = re.compile(r'\d+[\w/-]*')
+# Distância máxima até a linha de baixo, em alturas do rótulo
+_ALCANCE_ABAIXO = 2.5
+
+
+def _chave(palavra):
+    """
+    Forma de comparação de uma palavra: sem pontuação nas pontas e sem diferença de maiúsculas.
+    Uma palavra com valor colado ao rótulo ("Nº:2024/9918") é comparada só pela parte antes dos dois-pontos.
+    """
+    return _REGEX_BORDAS.sub('', palavra.split(':', 1)[0]).casefold()
+
+def _indexar_rotulos():
+    # primeira palavra do rótulo -> [(nome, palavras do rótulo)], os rótulos mais longos primeiro
+    por_inicio = {}
+    todos = {campo: rotulos for campo, (rotulos, _, _) in CAMPOS_ESPACIAIS.items()}
+    todos.update(_ROTULOS_AUXILIARES)
+    for nome, rotulos in todos.items():
+        for rotulo in rotulos:
+            palavras = tuple(_chave(palavra) for palavra in rotulo.split())
+            por_inicio.setdefault(palavras[0], []).append((nome, palavras))
+    for candidatos in por_inicio.values():
+        candidatos.sort(key=lambda candidato: -len(candidato[1]))
+    return por_inicio
+
+_ROTULOS_POR_INICIO = _indexar_rotulos()
+_PADROES = {campo: re.compile(padrao) for campo, (_, padrao, _) in CAMPOS_ESPACIAIS.items()}
+
+
+class IndicePagina:
+    """
+    Palavras de uma página agrupadas em linhas visuais, com a posição de cada rótulo conhecido.
+    `palavras` é a lista de page.get_text("words"): (x0, y0, x1, y1, texto, bloco, linha, palavra).
+    """
+
+    def __init__(self, palavras):
+        self.linhas = _agrupar_linhas(palavras)
+        # (índice da linha, índice da palavra) de todas as palavras, na ordem de leitura
+        self.ordem = [(indice_linha, posicao) for indice_linha, linha in enumerate(self.linhas)
+                      for posicao in range(len(linha))]
+        # nome -> [(índice da linha, primeira palavra, última palavra)] na ordem de leitura; para um rótulo
+        # quebrado entre linhas, a linha é a da última palavra e a primeira palavra é 0
+        self.rotulos = {}
+        # nome -> [(primeira, última)] das mesmas ocorrências, como índices em `ordem`
+        self.rotulos_na_ordem = {}
+        # (índice da linha, índice da palavra) ocupados por algum rótulo
+        self.ocupadas = set()
+        # Os rótulos são procurados na sequência de todas as palavras, sem parar no fim da linha
+        chaves = [_chave(self.linhas[indice_linha][posicao][4]) for indice_linha, posicao in self.ordem]
+        inicio = 0
+        while inicio < len(chaves):
+            for nome, rotulo in _ROTULOS_POR_INICIO.get(chaves[inicio], ()):
+                fim = inicio + len(rotulo) - 1
+                if tuple(chaves[inicio:fim + 1]) == rotulo:
+                    self._registrar_rotulo(nome, inicio, fim)
+                    inicio = fim
+                    break
+            inicio += 1
+
+    def _registrar_rotulo(self, nome, inicio, fim):
+        linha_inicio, posicao_inicio = self.ordem[inicio]
+        linha_fim, posicao_fim = self.ordem[fim]
+        self.rotulos.setdefault(nome, []).append(
+            (linha_fim, posicao_inicio if linha_inicio == linha_fim else 0, posicao_fim))
+        self.rotulos_na_ordem.setdefault(nome, []).append((inicio, fim))
+        if nome not in _ROTULOS_LIVRES:
+            self.ocupadas.update(self.ordem[inicio:fim + 1])
+
+    def buscar(self, campo):
+        """
+        Devolve o valor do campo na primeira ocorrência do rótulo que tem um valor válido, ou None.
+        """
+        if campo == 'razao_social' and 'razao_social' not in self.rotulos:
+            return self._razao_social_acima_do_cnpj()
+        _, _, modo = CAMPOS_ESPACIAIS[campo]
+        padrao = _PADROES[campo]
+        for ocorrencia in self.rotulos.get(campo, ()):
+            if modo == 'resto_da_linha':
+                valor = self._resto_da_linha(ocorrencia, padrao)
+            else:
+                valor = self._a_direita(ocorrencia, padrao)
+                if valor is None and modo == 'direita_ou_abaixo':
+                    valor = self._abaixo(ocorrencia, padrao)
+            if valor is not None:
+                return valor
+        return None
+
+    def endereco(self):
+        """
+        Endereço do prestador: as palavras entre o número da primeira Inscrição Municipal e o "Cep" seguinte,
+        mesmo quebradas entre linhas. Não há endereço se outro rótulo (CPF/CNPJ, Tomador) vier antes do Cep.
+        """
+        inscricoes = self.rotulos_na_ordem.get('inscricao_municipal')
+        if not inscricoes:
+            return None
+        _, fim = inscricoes[0]
+        ceps = [inicio for inicio, _ in self.rotulos_na_ordem.get('cep', ()) if inicio > fim]
+        if not ceps:
+            return None
+        palavras = self._entre(fim, ceps[0], _REGEX_INSCRICAO)
+        texto = ' '.join(palavras or ()).rstrip(' -')
+        return texto or None
+
+    def _texto(self, indice):
+        indice_linha, posicao = self.ordem[indice]
+        return self.linhas[indice_linha][posicao][4]
+
+    def _entre(self, fim_rotulo, inicio_seguinte, padrao_valor):
+        """
+        Palavras depois do rótulo que termina em `fim_rotulo` (sem o valor dele, que casa com `padrao_valor`)
+        até a palavra `inicio_seguinte`, na ordem de leitura; None se houver outro rótulo no caminho.
+        """
+        palavras = [self._texto(indice) for indice in range(fim_rotulo + 1, inicio_seguinte)]
+        if any(self.ordem[indice] in self.ocupadas for indice in range(fim_rotulo + 1, inicio_seguinte)):
+            return None
+        colado = self._texto(fim_rotulo).split(':', 1)
+        if not (len(colado) == 2 and colado[1]) and palavras and padrao_valor.fullmatch(palavras[0]):
+            palavras = palavras[1:]
+        return palavras
+
+    def _palavras_seguintes(self, ocorrencia):
+        # Palavras à direita do rótulo até o próximo rótulo; um valor colado ao rótulo vem primeiro
+        indice_linha, _, fim = ocorrencia
+        linha = self.linhas[indice_linha]
+        colado = linha[fim][4].split(':', 1)
+        if len(colado) == 2 and colado[1]:
+            yield colado[1]
+        for posicao in range(fim + 1, len(linha)):
+            if (indice_linha, posicao) in self.ocupadas:
+                return
+            yield linha[posicao][4]
+
+    def _a_direita(self, ocorrencia, padrao):
+        for palavra in self._palavras_seguintes(ocorrencia):
+            palavra = palavra.rstrip('.;')
+            if padrao.fullmatch(palavra):
+                return palavra
+        return None
+
+    def _resto_da_linha(self, ocorrencia, padrao):
+        texto = ' '.join(self._palavras_seguintes(ocorrencia)).strip()
+        match = padrao.match(texto)
+        if not match:
+            return None
+        return (match.group(1) if padrao.groups else match.group(0)).strip()
+
+    def _abaixo(self, ocorrencia, padrao):
+        # Leiaute de tabela: valor na linha seguinte, alinhado com o rótulo
+        indice_linha, inicio, fim = ocorrencia
+        linha = self.linhas[indice_linha]
+        x0, x1 = linha[inicio][0], linha[fim][2]
+        base, altura = linha[inicio][3], linha[inicio][3] - linha[inicio][1]
+        for indice_abaixo in range(indice_linha + 1, len(self.linhas)):
+            abaixo = self.linhas[indice_abaixo]
+            if abaixo[0][1] - base > _ALCANCE_ABAIXO * altura:
+                return None
+            for posicao, palavra in enumerate(abaixo):
+                if (indice_abaixo, posicao) in self.ocupadas or palavra[2] < x0 or palavra[0] > x1:
+                    continue
+                texto = palavra[4].rstrip('.;')
+                if padrao.fullmatch(texto):
+                    return texto
+        return None
+
+    def _razao_social_acima_do_cnpj(self):
+        # No BH ISS Digital o nome do prestador vem entre o Código de Verificação e o primeiro CPF/CNPJ
+        cnpjs = self.rotulos_na_ordem.get('cpf_cnpj')
+        codigos = self.rotulos_na_ordem.get('codigo_verificacao')
+        if cnpjs and codigos and codigos[0][1] < cnpjs[0][0]:
+            palavras = self._entre(codigos[0][1], cnpjs[0][0], _REGEX_CODIGO)
+            return ' '.join(palavras) if palavras else None
+        # Sem o Código de Verificação: a linha acima do primeiro CPF/CNPJ, se não tiver rótulos
+        for indice_linha, _, _ in self.rotulos.get('cpf_cnpj', ())[:1]:
+            if indice_linha == 0:
+                return None
+            acima = indice_linha - 1
+            if any((acima, posicao) in self.ocupadas for posicao in range(len(self.linhas[acima]))):
+                return None
+            return ' '.join(palavra[4] for palavra in self.linhas[acima])
+        return None
+
+
+def _agrupar_linhas(palavras):
+    """
+    Agrupa as palavras em linhas visuais pelo centro vertical (palavras cujo centro fica dentro da metade
+    da altura da linha atual) e ordena cada linha da esquerda para a direita.
+    """
+    linhas = []
+    for palavra in sorted(palavras, key=lambda palavra: (palavra[1] + palavra[3], palavra[0])):
+        centro = (palavra[1] + palavra[3]) / 2
+        if linhas and abs(centro - linhas[-1][0]) <= (palavra[3] - palavra[1]) / 2:
+            linhas[-1][1].append(palavra)
+        else:
+            linhas.append((centro, [palavra]))
+    return [sorted(linha, key=lambda palavra: palavra[0]) for _, linha in linhas]
+
+def extrair_campos_espaciais(indices):
+    """
+    Procura cada campo nas páginas em ordem e devolve {campo: valor} só com os encontrados.
+    Os textos são normalizados como no motor de texto (razão social, município e endereço em maiúsculas).
+    """
+    campos = {}
+    for campo in CAMPOS_ESPACIAIS:
+        for indice in indices:
+            valor = indice.buscar(campo)
+            if valor is not None:
+                campos[campo] = valor
+                break
+    for indice in indices:
+        endereco = indice.endereco()
+        if endereco:
+            campos['endereco'] = endereco
+            break
+    # Como no motor de texto, o município só é aceito quando a UF aparece
+    if 'municipio' in campos and not any(indice.buscar('uf') is not None for indice in indices):
+        campos.pop('municipio')
+    for campo in ('razao_social', 'municipio', 'endereco'):
+        if campo in campos:
+            campos[campo] = campos[campo].upper()
+    return campos
+
+def extrair_dados_pdf_espacial(pdf_path, cache=None):
+    """
+    Extrai os campos da NFS-e pelo extrator do leiaute (com o OCR das páginas digitalizadas) e procura
+    pela posição das palavras só os campos que ele não encontrou. Devolve um DadosNFSe.
+    """
+    with metricas.etapa('palavras'):
+        with fitz.open(pdf_path) as pdf_document:
+            paginas = [page.get_text("words") for page in pdf_document]
+    if all(paginas):
+        # As palavras na ordem do PyMuPDF equivalem ao texto normalizado da página, sem reler o PDF
+        texto = " ".join(palavra[4] for palavras in paginas for palavra in palavras)
+    else:
+        # Há páginas digitalizadas: o texto completo passa pelo OCR (e pelo cache, se houver)
+        texto = extract_text_from_pdf(pdf_path, cache=cache)
+    with metricas.etapa('campos'):
+        dados = extrair_dados(texto)
+        espaciais = extrair_campos_espaciais([IndicePagina(palavras) for palavras in paginas if palavras])
+        return combinar_campos(dados, espaciais)
+
+def _tem_formato(campo, valor):
+    # Só os campos de valor curto (não 'resto_da_linha') têm um formato que permite julgar o valor
+    especificacao = CAMPOS_ESPACIAIS.get(campo)
+    return bool(especificacao and especificacao[2] != 'resto_da_linha' and _PADROES[campo].fullmatch(valor))
+
+def combinar_campos(dados, espaciais):
+    """
+    Completa o DadosNFSe do motor de texto com os campos achados pela posição ({campo: valor}): um campo
+    sem valor no texto recebe o da posição; um campo encontrado só é trocado se o valor do texto não tem
+    o formato do campo e o da posição tem. As demais divergências ficam com o texto e são contadas.
+    """
+    campos = {}
+    for campo, valor in espaciais.items():
+        texto = getattr(dados, campo)
+        if texto == valor:
+            continue
+        if texto == PADROES_NFSE[campo] or (_tem_formato(campo, valor) and not _tem_formato(campo, texto)):
+            campos[campo] = valor
+        else:
+            metricas.contar('campos_divergentes')
+            logger.debug("%s: texto %r, posição %r; mantido o do texto", campo, texto, valor)
+    if campos:
+        metricas.contar('campos_pela_posicao', len(campos))
+    return replace(dados, **campos)
+
+def iter_dados_pdfs(input_directory, workers=None, cache=None):
+    """
+    Gera (nome do arquivo, DadosNFSe) em ordem alfabética, cada PDF extraído em um processo do pool.
+    """
+    pdf_files = listar_pdfs(input_directory)
+    pdf_paths = [os.path.join(input_directory, filename) for filename in pdf_files]
+    dados = iterar_em_pool(partial(extrair_dados_pdf_espacial, cache=cache), pdf_paths, workers, padrao=DadosNFSe())
+    yield from zip(pdf_files, dados)
+
+def main_espacial(input_directory, template_excel_path, output_excel_path, workers=None, cache=CACHE_PADRAO,
+                  metricas_jsonl=None, perfil=None):
+    """
+    Como modelos.main, mas lendo os campos pela posição das palavras.
+    """
+    def linhas(registros):
+        for filename, dados in registros:
+            metricas.registrar_campos(filename, dados.campos_encontrados())
+            yield dados.linha_excel()
+
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        gravar_linhas_excel(linhas(iter_dados_pdfs(input_directory, workers, cache)), template_excel_path,
+                            output_excel_path)
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrai as NFS-e pela posição das palavras e grava o Excel.")
+    parser.add_argument('input_directory')
+    parser.add_argument('template_excel_path')
+    parser.add_argument('output_excel_path')
+    adicionar_opcoes_de_execucao(parser)
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    main_espacial(args.input_directory, args.template_excel_path, args.output_excel_path, args.workers, args.cache,
+                  args.metricas, args.perfil)
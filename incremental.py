@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import os
+from functools import partial
+
+import metricas
+from cache_texto import CACHE_PADRAO, hash_arquivo
+from dados_nfse import COLUNAS_EXCEL
+from modelos import (LINHA_INICIAL, adicionar_opcoes_de_execucao, extract_text_from_pdf, extrair_dados, gravar_linhas_excel,
+                     iterar_em_pool, listar_pdfs)
+
+# Modo incremental: só os PDFs novos ou alterados desde a última execução são extraídos.
+# O manifesto ao lado do Excel de saída guarda, para cada PDF, tamanho, data de modificação,
+# SHA-256, Chave de acesso e a linha que ele ocupa no Excel com os valores gravados.
+
+logger = logging.getLogger(__name__)
+
+def caminho_manifesto(output_excel_path):
+    return output_excel_path + '.manifesto.json'
+
+def carregar_manifesto(caminho):
+    if not os.path.exists(caminho):
+        return {'arquivos': {}, 'proxima_linha': LINHA_INICIAL}
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+def salvar_manifesto(caminho, manifesto):
+    # Grava em um arquivo temporário e substitui, para nunca deixar um manifesto pela metade
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, caminho)
+
+def listar_alterados(input_directory, manifesto):
+    """
+    Compara os PDFs do diretório com o manifesto e devolve [(arquivo, caminho, stat, sha256)] dos
+    novos ou alterados. Tamanho e data iguais bastam para considerar o arquivo inalterado; se só a
+    data mudou e o SHA-256 é o mesmo, o manifesto é atualizado sem reprocessar.
+    """
+    alterados = []
+    for filename in listar_pdfs(input_directory):
+        alterado = verificar_arquivo(filename, os.path.join(input_directory, filename), manifesto)
+        if alterado:
+            alterados.append(alterado)
+    return alterados
+
+def verificar_arquivo(filename, pdf_path, manifesto):
+    """
+    Devolve (arquivo, caminho, stat, sha256) se o PDF é novo ou mudou desde o manifesto, senão None.
+    """
+    stat = os.stat(pdf_path)
+    entrada = manifesto['arquivos'].get(filename)
+    if entrada and entrada['tamanho'] == stat.st_size and entrada['mtime'] == stat.st_mtime:
+        return None
+    sha256 = hash_arquivo(pdf_path)
+    if entrada and entrada['sha256'] == sha256:
+        entrada['mtime'] = stat.st_mtime
+        return None
+    return filename, pdf_path, stat, sha256
+
+def linhas_alteradas(alterados, textos, manifesto):
+    """
+    Gera (número da linha, valores) para cada PDF extraído, atualizando o manifesto.
+    Notas cuja Chave de acesso já pertence a outro arquivo são registradas como duplicadas e não geram linha;
+    se o arquivo ocupava uma linha, ela é esvaziada e continua reservada para ele.
+    """
+    arquivos = manifesto['arquivos']
+    chaves = {entrada['chave']: nome for nome, entrada in arquivos.items() if entrada.get('chave')}
+
+    for (filename, pdf_path, stat, sha256), texto in zip(alterados, textos):
+        if not texto:
+            # Falha de extração: fica fora do manifesto para ser tentada de novo na próxima execução
+            logger.warning("Nenhum texto extraído de %s; o arquivo será reprocessado na próxima execução", pdf_path)
+            continue
+
+        with metricas.etapa('campos'):
+            dados = extrair_dados(texto)
+        metricas.registrar_campos(filename, dados.campos_encontrados())
+        chave = dados.chave_acesso
+        entrada = {'caminho': pdf_path, 'tamanho': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256,
+                   'chave': chave}
+        anterior = arquivos.get(filename)
+        if anterior and anterior.get('chave') and chaves.get(anterior['chave']) == filename:
+            # A chave antiga deste arquivo deixa de ser dele
+            del chaves[anterior['chave']]
+        original = chaves.get(chave) if chave else None
+        if original and original != filename:
+            logger.warning("%s: nota duplicada de %s (Chave de acesso %s), ignorada", filename, original, chave)
+            arquivos[filename] = dict(entrada, chave="", duplicada_de=original)
+            if anterior and anterior.get('linha'):
+                # A linha com os valores da nota anterior deste arquivo não vale mais
+                arquivos[filename]['linha'] = anterior['linha']
+                yield anterior['linha'], [None] * len(COLUNAS_EXCEL)
+            continue
+
+        if anterior and anterior.get('linha'):
+            linha = anterior['linha']
+        else:
+            linha = manifesto['proxima_linha']
+            manifesto['proxima_linha'] += 1
+        valores = dados.linha_excel()
+        arquivos[filename] = dict(entrada, linha=linha, valores=valores)
+        if chave:
+            chaves[chave] = filename
+        yield linha, valores
+
+def main_incremental(input_directory, template_excel_path, output_excel_path, workers=None, cache=CACHE_PADRAO,
+                     metricas_jsonl=None, perfil=None):
+    """
+    Extrai apenas os PDFs novos ou alterados e mescla suas linhas no Excel de saída existente,
+    sem alterar as linhas dos demais. Na primeira execução (sem Excel ou manifesto) gera o Excel completo.
+    `metricas_jsonl` e `perfil` funcionam como em modelos.main.
+    """
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        _executar_incremental(input_directory, template_excel_path, output_excel_path, workers, cache)
+    return resumo
+
+def _executar_incremental(input_directory, template_excel_path, output_excel_path, workers, cache):
+    manifesto_path = caminho_manifesto(output_excel_path)
+    manifesto = carregar_manifesto(manifesto_path)
+    primeira_execucao = not os.path.exists(output_excel_path) or not manifesto['arquivos']
+    if primeira_execucao:
+        manifesto = {'arquivos': {}, 'proxima_linha': LINHA_INICIAL}
+
+    alterados = listar_alterados(input_directory, manifesto)
+    logger.info("%d PDFs novos ou alterados", len(alterados))
+    if not alterados and not primeira_execucao:
+        salvar_manifesto(manifesto_path, manifesto)
+        return
+
+    pdf_paths = [pdf_path for _, pdf_path, _, _ in alterados]
+    textos = iterar_em_pool(partial(extract_text_from_pdf, cache=cache), pdf_paths, workers, padrao="")
+    mesclar_linhas_excel(linhas_alteradas(alterados, textos, manifesto), template_excel_path, output_excel_path,
+                         primeira_execucao)
+    salvar_manifesto(manifesto_path, manifesto)
+
+def mesclar_linhas_excel(linhas, template_excel_path, output_excel_path, primeira_execucao):
+    """
+    Grava as linhas (número da linha, valores) no Excel de saída: na primeira execução cria o arquivo
+    em fluxo a partir do modelo, nas seguintes altera só as linhas recebidas.
+    """
+    if primeira_execucao:
+        # As linhas saem em sequência a partir de LINHA_INICIAL, então o Excel é gravado em fluxo
+        gravar_linhas_excel((valores for _, valores in linhas), template_excel_path, output_excel_path)
+        return
+    import openpyxl
+
+    wb = openpyxl.load_workbook(output_excel_path)
+    sheet = wb.active
+    for linha, valores in linhas:
+        with metricas.etapa('excel'):
+            for col, valor in enumerate(valores, start=1):
+                # Atribuído à célula: sheet.cell(..., value=None) não apaga o valor anterior
+                sheet.cell(row=linha, column=col).value = valor
+    with metricas.etapa('excel'):
+        wb.save(output_excel_path)
+    logger.info("Excel atualizado salvo em %s", output_excel_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processa apenas os PDFs novos ou alterados desde a última execução.")
+    parser.add_argument('input_directory')
+    parser.add_argument('template_excel_path')
+    parser.add_argument('output_excel_path')
+    adicionar_opcoes_de_execucao(parser)
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    main_incremental(args.input_directory, args.template_excel_path, args.output_excel_path, args.workers, args.cache,
+                     args.metricas, args.perfil)
@@ -0,0 +1,219 @@
+import argparse
+import io
+import logging
+import mmap
+import os
+import sys
+import tarfile
+import zipfile
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from itertools import tee
+
+import metricas
+from cache_texto import CACHE_PADRAO
+from modelos import (adicionar_opcoes_de_execucao, extract_text_from_pdf, extrair_dados, gravar_linhas_excel,
+                     iterar_em_pool, listar_pdfs)
+
+# Entrada dos PDFs direto de arquivos zip/tar e de conteúdo em memória, sem descompactar em disco.
+# O processo principal só lista os membros; cada worker lê o seu PDF direto do arquivo e o abre com
+# fitz.open(stream=...):
+#
+# - tar sem compressão: o PDF é uma fatia do arquivo mapeado em memória (mmap), sem cópia;
+# - zip: o worker descompacta só o seu membro (o índice do zip é lido uma vez por worker);
+# - tar compactado (.tar.gz, .tar.bz2, .tar.xz) e fluxos (entrada padrão, anexos já em memória): não
+#   há acesso direto, então o conteúdo é lido em sequência e segue junto com a tarefa para o worker.
+#
+#   python ingestao.py notas.zip portal.tar.gz pasta/ --saida notas.xlsx --modelo modelo.xlsx
+#   cat notas.zip | python ingestao.py - --saida notas.parquet
+
+logger = logging.getLogger(__name__)
+
+# Nome usado para a entrada padrão
+ENTRADA_PADRAO = '-'
+
+
+@dataclass(frozen=True)
+class Membro:
+    """
+    Um PDF dentro de um arquivo compactado ou de um fluxo. Com `dados`, o conteúdo vai junto;
+    sem, o worker lê o membro de `origem`: por `deslocamento` e `tamanho` no mmap (tar sem
+    compressão) ou pelo `nome` (zip).
+    """
+    origem: str
+    nome: str
+    deslocamento: int = None
+    tamanho: int = None
+    dados: bytes = field(default=None, repr=False)
+
+    def __str__(self):
+        return f"{self.origem}!{self.nome}"
+
+
+@lru_cache(maxsize=8)
+def _mapear(caminho):
+    # Um mapeamento por arquivo e processo; as páginas ficam no cache do sistema, compartilhadas entre os workers
+    with open(caminho, 'rb') as arquivo:
+        return mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+
+@lru_cache(maxsize=8)
+def _zip_aberto(caminho):
+    # O zipfile exige um arquivo com seek (o mmap não serve); aberto uma vez por arquivo e processo
+    return zipfile.ZipFile(open(caminho, 'rb'))
+
+def ler_membro(membro):
+    """
+    Devolve o conteúdo do PDF: os próprios `dados`, uma memoryview do mapeamento (tar sem compressão)
+    ou os bytes descompactados do zip.
+    """
+    if membro.dados is not None:
+        return membro.dados
+    if membro.deslocamento is not None:
+        return memoryview(_mapear(membro.origem))[membro.deslocamento:membro.deslocamento + membro.tamanho]
+    return _zip_aberto(membro.origem).read(membro.nome)
+
+def _eh_pdf(nome):
+    # Ignora pastas e os metadados que o macOS inclui nos zips
+    return nome.lower().endswith('.pdf') and not nome.startswith('__MACOSX/')
+
+def listar_fonte(fonte):
+    """
+    Gera os documentos de uma fonte, na ordem em que aparecem: caminhos de PDF (um PDF ou um diretório)
+    ou Membros (zip, tar ou a entrada padrão).
+    """
+    if fonte == ENTRADA_PADRAO:
+        yield from membros_de_bytes(sys.stdin.buffer.read(), ENTRADA_PADRAO)
+    elif os.path.isdir(fonte):
+        for filename in listar_pdfs(fonte):
+            yield os.path.join(fonte, filename)
+    elif fonte.lower().endswith('.pdf'):
+        yield fonte
+    elif os.path.getsize(fonte) == 0:
+        logger.warning("%s está vazio", fonte)
+    elif zipfile.is_zipfile(fonte):
+        yield from _membros_zip(fonte)
+    elif tarfile.is_tarfile(fonte):
+        yield from _membros_tar(fonte)
+    else:
+        logger.warning("%s não é PDF, zip nem tar; ignorado", fonte)
+
+def _membros_zip(caminho):
+    # A listagem lê só o índice do fim do arquivo
+    with zipfile.ZipFile(caminho) as arquivo_zip:
+        infos = arquivo_zip.infolist()
+    for info in infos:
+        if info.is_dir() or not _eh_pdf(info.filename):
+            continue
+        if info.flag_bits & 0x1:
+            logger.warning("%s!%s está protegido por senha; ignorado", caminho, info.filename)
+            continue
+        yield Membro(caminho, info.filename)
+
+def _membros_tar(caminho):
+    try:
+        # Sem compressão: cada membro é uma faixa contínua do arquivo; a listagem lê só os cabeçalhos
+        with tarfile.open(caminho, mode='r:') as tar:
+            membros = [(info.name, info.offset_data, info.size) for info in tar if info.isfile() and _eh_pdf(info.name)]
+    except tarfile.ReadError:
+        membros = None
+    if membros is not None:
+        for nome, deslocamento, tamanho in membros:
+            yield Membro(caminho, nome, deslocamento, tamanho)
+        return
+    # Compactado: lido em sequência, um membro por vez
+    with tarfile.open(caminho, mode='r|*') as tar:
+        for info in tar:
+            if info.isfile() and _eh_pdf(info.name):
+                with metricas.etapa('ler'):
+                    dados = tar.extractfile(info).read()
+                yield Membro(caminho, info.name, dados=dados)
+
+def membros_de_bytes(dados, origem='memoria'):
+    """
+    Gera os Membros de um conteúdo em memória (um anexo de e-mail, a entrada padrão): um PDF, um zip ou um tar.
+    """
+    if dados[:5] == b'%PDF-':
+        yield Membro(origem, 'documento.pdf', dados=dados)
+    elif dados[:4] == b'PK\x03\x04':
+        with zipfile.ZipFile(io.BytesIO(dados)) as arquivo_zip:
+            for info in arquivo_zip.infolist():
+                if not info.is_dir() and _eh_pdf(info.filename):
+                    yield Membro(origem, info.filename, dados=arquivo_zip.read(info))
+    else:
+        try:
+            with tarfile.open(fileobj=io.BytesIO(dados), mode='r:*') as tar:
+                for info in tar:
+                    if info.isfile() and _eh_pdf(info.name):
+                        yield Membro(origem, info.name, dados=tar.extractfile(info).read())
+        except tarfile.ReadError:
+            logger.warning("Conteúdo de %s não é PDF, zip nem tar; ignorado", origem)
+
+def extrair_documento(documento, cache=None):
+    """
+    Extrai o texto de um documento de listar_fonte (caminho ou Membro). É o que roda nos workers do pool.
+    """
+    if not isinstance(documento, Membro):
+        return extract_text_from_pdf(documento, cache=cache)
+    with metricas.etapa('ler'):
+        dados = ler_membro(documento)
+    return extract_text_from_pdf(dados, cache=cache, nome=str(documento))
+
+def iter_textos(fontes, workers=None, cache=None):
+    """
+    Gera (nome, texto) de todos os documentos das `fontes`, na ordem das fontes e dos membros.
+    Os membros são listados à medida que o pool pede novos documentos; só a janela do pool fica em memória.
+    """
+    documentos = (documento for fonte in fontes for documento in listar_fonte(fonte))
+    para_pool, para_nomes = tee(documentos)
+    textos = iterar_em_pool(partial(extrair_documento, cache=cache), para_pool, workers, padrao="")
+    for documento, texto in zip(para_nomes, textos):
+        yield str(documento), texto
+
+def main_ingestao(fontes, output, template_excel_path=None, workers=None, cache=CACHE_PADRAO, metricas_jsonl=None,
+                  armazem=None, perfil=None):
+    """
+    Extrai os PDFs das `fontes` (zip, tar, PDFs, diretórios ou '-' para a entrada padrão) e grava
+    `output`: .xlsx a partir de `template_excel_path`, ou .parquet/.csv/.jsonl (ver exportacao.py).
+    Com `armazem`, as notas também são gravadas no armazém local (ver armazem.py).
+    `metricas_jsonl` e `perfil` funcionam como em modelos.main.
+    """
+    if output.lower().endswith('.xlsx') and not template_excel_path:
+        raise ValueError("A saída em Excel precisa do modelo (--modelo)")
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        _gravar_notas(fontes, output, template_excel_path, workers, cache, armazem)
+    return resumo
+
+def _gravar_notas(fontes, output, template_excel_path, workers, cache, armazem):
+    def notas():
+        for nome, texto in iter_textos(fontes, workers, cache):
+            with metricas.etapa('campos'):
+                dados = extrair_dados(texto)
+            metricas.registrar_campos(nome, dados.campos_encontrados())
+            yield nome, dados
+
+    registros = notas()
+    if armazem:
+        from armazem import armazenar
+        registros = armazenar(registros, armazem)
+    if output.lower().endswith('.xlsx'):
+        gravar_linhas_excel((dados.linha_excel() for _, dados in registros), template_excel_path, output)
+    else:
+        # O pandas só é necessário para as saídas colunares
+        from exportacao import dataframe_de_registros, exportar, normalizar_dataframe
+        exportar(normalizar_dataframe(dataframe_de_registros(registros)), output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extrai NFS-e de arquivos zip/tar, PDFs ou da entrada padrão, sem descompactar.")
+    parser.add_argument('fontes', nargs='+', help="arquivos .zip/.tar(.gz), PDFs, diretórios ou '-' (entrada padrão)")
+    parser.add_argument('--saida', required=True, help="arquivo de saída (.xlsx, .parquet, .csv ou .jsonl)")
+    parser.add_argument('--modelo', default=None, help="modelo Excel (obrigatório para .xlsx)")
+    parser.add_argument('--armazem', default=None, help="também grava as notas neste armazém SQLite (ver armazem.py)")
+    adicionar_opcoes_de_execucao(parser)
+    args = parser.parse_args()
+    if args.saida.lower().endswith('.xlsx') and not args.modelo:
+        parser.error("a saída em Excel precisa do modelo (--modelo)")
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    main_ingestao(args.fontes, args.saida, args.modelo, args.workers, args.cache, args.metricas, args.armazem,
+                  args.perfil)
@@ -0,0 +1,205 @@
+import re
+from dataclasses import dataclass
+
+import metricas
+from dados_nfse import CAMPOS_OBRIGATORIOS, COLUNAS_EXCEL, DadosNFSe
+
+# Registro de leiautes de NFS-e. Cada leiaute tem marcadores (expressões procuradas no cabeçalho e,
+# opcionalmente, no produtor do PDF) e um extrator especializado texto -> DadosNFSe. É o que
+# modelos.extrair_dados usa para todas as saídas (Excel, armazém, exportação): o cabeçalho é o início
+# do texto já extraído, então o PDF não é aberto de novo. Uma impressão digital barata do cabeçalho
+# escolhe o leiaute e só o extrator dele é executado. O leiaute padrão (BH ISS Digital) é o motor de
+# extração de modelos.py, que se registra aqui ao ser importado; este módulo não importa modelos.
+# O leiaute escolhido fica guardado por CNPJ do emitente, de modo que as notas seguintes do mesmo
+# emitente não repetem a comparação; uma nota em que o leiaute guardado deixa campos obrigatórios sem
+# encontrar é comparada de novo com todos os leiautes (o emitente pode ter mudado de modelo).
+# Os campos obrigatórios de um leiaute são os CAMPOS_OBRIGATORIOS que ele tem (o domínio, por exemplo,
+# não traz a Base de Cálculo).
+
+# Caracteres do início do texto usados como cabeçalho (o topo da primeira página)
+TAMANHO_CABECALHO = 2000
+# Marcadores (o produtor vale 2) necessários para aceitar um leiaute; abaixo disso vale o LEIAUTE_PADRAO
+PONTUACAO_MINIMA = 2
+LEIAUTE_PADRAO = 'bh_iss_digital'
+# Emitentes guardados por processo antes de descartar o cache de impressões digitais
+MAXIMO_EMITENTES = 10000
+
+_REGEX_CNPJ_EMITENTE = re.compile(r'\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}')
+
+
+@dataclass(frozen=True)
+class Leiaute:
+    nome: str
+    marcadores: tuple
+    produtor: object
+    extrair: object
+    campos: tuple = COLUNAS_EXCEL
+
+    @property
+    def obrigatorios(self):
+        return tuple(campo for campo in CAMPOS_OBRIGATORIOS if campo in self.campos)
+
+    def pontuacao(self, cabecalho, produtor=''):
+        pontos = sum(1 for marcador in self.marcadores if marcador.search(cabecalho))
+        if self.produtor is not None and self.produtor.search(produtor):
+            pontos += 2
+        return pontos
+
+
+LEIAUTES = {}
+_leiautes_por_emitente = {}
+
+
+def registrar_leiaute(nome, marcadores, produtor=None, campos=COLUNAS_EXCEL):
+    """
+    Registra um extrator (função texto -> DadosNFSe) para o leiaute `nome`. Pode ser usado como decorador.
+    `campos` são as colunas que o leiaute traz (por padrão, todas). Os leiautes registrados primeiro têm
+    preferência em caso de empate.
+    """
+    def registrar(extrair):
+        LEIAUTES[nome] = Leiaute(nome, tuple(re.compile(marcador) for marcador in marcadores),
+                                 re.compile(produtor, re.IGNORECASE) if produtor else None, extrair, tuple(campos))
+        return extrair
+    return registrar
+
+def identificar_leiaute(cabecalho, produtor=''):
+    """
+    Devolve o Leiaute com mais marcadores presentes no cabeçalho, ou o LEIAUTE_PADRAO se nenhum chegar a PONTUACAO_MINIMA.
+    """
+    escolhido, melhor = LEIAUTES[LEIAUTE_PADRAO], PONTUACAO_MINIMA - 1
+    for leiaute in LEIAUTES.values():
+        pontos = leiaute.pontuacao(cabecalho, produtor)
+        if pontos > melhor:
+            escolhido, melhor = leiaute, pontos
+    return escolhido
+
+def leiaute_do_documento(cabecalho, produtor=''):
+    """
+    Como identificar_leiaute, consultando antes o leiaute já visto para o CNPJ do emitente
+    (o primeiro CNPJ do cabeçalho).
+    """
+    match = _REGEX_CNPJ_EMITENTE.search(cabecalho)
+    emitente = match.group(0) if match else None
+    if emitente in _leiautes_por_emitente:
+        metricas.contar('leiaute_em_cache')
+        return LEIAUTES[_leiautes_por_emitente[emitente]], emitente
+    leiaute = identificar_leiaute(cabecalho, produtor)
+    if emitente:
+        if len(_leiautes_por_emitente) >= MAXIMO_EMITENTES:
+            _leiautes_por_emitente.clear()
+        _leiautes_por_emitente[emitente] = leiaute.nome
+    return leiaute, emitente
+
+def esquecer_emitente(emitente):
+    _leiautes_por_emitente.pop(emitente, None)
+
+def _encontrados(dados):
+    return sum(dados.campos_encontrados().values())
+
+def _faltando(leiaute, dados, campos):
+    encontrados = dados.campos_encontrados()
+    return [campo for campo in campos if campo in leiaute.campos and not encontrados[campo]]
+
+def _cabecalho(text):
+    return " ".join(text[:TAMANHO_CABECALHO].split())
+
+def campos_faltando(text, campos):
+    """
+    Devolve os `campos` que o leiaute de `text` traz e que o extrator dele ainda não encontrou; os que o
+    leiaute não tem não são esperados. É o que a leitura sob demanda e o OCR adaptativo consultam a cada
+    página: usa o leiaute guardado para o emitente, se houver, sem alterá-lo nem contar nas métricas.
+    """
+    cabecalho = _cabecalho(text)
+    match = _REGEX_CNPJ_EMITENTE.search(cabecalho)
+    nome = _leiautes_por_emitente.get(match.group(0)) if match else None
+    leiaute = LEIAUTES[nome] if nome else identificar_leiaute(cabecalho)
+    return _faltando(leiaute, leiaute.extrair(text), campos)
+
+def extrair_pelo_leiaute(text, cabecalho=None, produtor=''):
+    """
+    Identifica o leiaute pelo cabeçalho (por padrão, o início de `text`) e extrai os campos só com o
+    extrator dele. Devolve (nome do leiaute, DadosNFSe).
+    Se o leiaute guardado para o emitente deixar algum dos obrigatórios dele sem encontrar, o cabeçalho
+    é comparado de novo com todos os leiautes; fica o extrator que encontrar mais campos, e ele passa a
+    ser o do emitente.
+    """
+    cabecalho = _cabecalho(text) if cabecalho is None else " ".join(cabecalho.split())
+    leiaute, emitente = leiaute_do_documento(cabecalho, produtor)
+    dados = leiaute.extrair(text)
+    if emitente and text and _faltando(leiaute, dados, leiaute.obrigatorios):
+        identificado = identificar_leiaute(cabecalho, produtor)
+        if identificado is not leiaute:
+            outros = identificado.extrair(text)
+            if _encontrados(outros) > _encontrados(dados):
+                metricas.contar('leiaute_trocado')
+                leiaute, dados = identificado, outros
+                _leiautes_por_emitente[emitente] = leiaute.nome
+    metricas.contar(f'leiaute_{leiaute.nome}')
+    return leiaute.nome, dados
+
+
+# Leiaute "nfse_dominio" (o do extrair_dados_nfse de modelos.py): pares "Rótulo: valor".
+# Os rótulos são localizados em uma só varredura; o valor de cada um é o trecho até o próximo rótulo,
+# o que funciona também no texto já normalizado em uma linha só.
+_ROTULOS_DOMINIO = {
+    'cpf_cnpj': r'CNPJ:',
+    'razao_social': r'Raz[ãa]o Social:',
+    'uf': r'UF:',
+    'municipio': r'Munic[íi]pio:',
+    'endereco': r'Endere[çc]o:',
+    'numero_documento': r'N[úu]mero do Documento:',
+    'serie': r'S[ée]rie:',
+    'data': r'Data:',
+    'situacao': r'Situa[çc][ãa]o:',
+    'cfop': r'CFOP:',
+    'valor_iss_retido': r'Valor ISS Retido:',
+    'valor_dos_servicos': r'Valor Servi[çc]os:',
+    'valor_descontos': r'Valor Descontos:',
+    'valor_contabil': r'Valor Cont[áa]bil:',
+    'valor_iss_normal': r'Valor ISS:',
+    'valor_irrf': r'Valor IRRF:',
+    'valor_pis': r'Valor PIS:',
+    'valor_cofins': r'Valor COFINS:',
+    'valor_csll': r'Valor CSLL:',
+}
+_REGEX_ROTULOS_DOMINIO = re.compile('|'.join(f'{padrao}(?P<{campo}>)' for campo, padrao in _ROTULOS_DOMINIO.items()))
+_VALOR_MONETARIO = r'R\$\s*([\d,.]+)'
+# Formato exigido de cada valor (grupo 1); campos ausentes daqui aceitam o trecho inteiro
+_FORMATOS_DOMINIO = {campo: re.compile(padrao) for campo, padrao in {
+    'cpf_cnpj': r'(\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2})',
+    'uf': r'([A-Z]{2})\b',
+    'numero_documento': r'(\d+)',
+    'serie': r'(\d+)',
+    'data': r'(\d{2}/\d{2}/\d{4})',
+    'situacao': r'(\d)',
+    'cfop': r'(\d+)',
+    **{campo: _VALOR_MONETARIO for campo in _ROTULOS_DOMINIO if campo.startswith('valor_')},
+}.items()}
+
+@registrar_leiaute('nfse_dominio', [
+    r'Raz[ãa]o Social:',
+    r'N[úu]mero do Documento:',
+    r'Valor (?:Servi[çc]os|Cont[áa]bil):',
+], produtor=r'dom[íi]nio', campos=_ROTULOS_DOMINIO)
+def extrair_campos_dominio(text):
+    """
+    Extrai os campos do leiaute nfse_dominio. Os valores monetários ficam no formato brasileiro do documento,
+    como no BH ISS Digital.
+    """
+    rotulos = list(_REGEX_ROTULOS_DOMINIO.finditer(text))
+    campos = {}
+    for indice, rotulo in enumerate(rotulos):
+        campo = rotulo.lastgroup
+        if campo in campos:
+            continue
+        fim = rotulos[indice + 1].start() if indice + 1 < len(rotulos) else len(text)
+        trecho = text[rotulo.end():fim].strip()
+        formato = _FORMATOS_DOMINIO.get(campo)
+        if formato is None:
+            if trecho:
+                campos[campo] = trecho.upper() if campo != 'cpf_cnpj' else trecho
+            continue
+        match = formato.match(trecho)
+        if match:
+            campos[campo] = match.group(1)
+    return DadosNFSe(**campos)
@@ -0,0 +1,189 @@
+import cProfile
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentação do pipeline: tempo por etapa, contagem de páginas (texto, OCR, cache), acertos e
+# faltas de cada campo e erros. Cada processo tem um coletor atual; os workers do pool medem cada
+# documento em um coletor próprio e devolvem o resumo junto com o resultado, e o processo principal
+# soma tudo e, se configurado, grava uma linha JSON por evento.
+#
+# Por padrão nada é impresso além de avisos e erros; configurar_log('INFO') mostra o andamento e o resumo
+# das etapas e 'DEBUG' também o texto de cada documento.
+
+logger = logging.getLogger(__name__)
+
+
+class Coletor:
+    """
+    Acumula segundos e chamadas por etapa, contadores e acertos/faltas por campo. Seguro entre threads
+    (o OCR das páginas roda em um pool de threads).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas = {}
+        self.contadores = {}
+        self.campos = {}
+
+    def adicionar_etapa(self, nome, segundos, chamadas=1):
+        with self._lock:
+            total, quantidade = self.etapas.get(nome, (0.0, 0))
+            self.etapas[nome] = (total + segundos, quantidade + chamadas)
+
+    def contar(self, nome, quantidade=1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def adicionar_campo(self, campo, encontrado):
+        with self._lock:
+            acertos, faltas = self.campos.get(campo, (0, 0))
+            self.campos[campo] = (acertos + 1, faltas) if encontrado else (acertos, faltas + 1)
+
+    def mesclar(self, resumo):
+        for nome, dados in resumo.get('etapas', {}).items():
+            self.adicionar_etapa(nome, dados['segundos'], dados['chamadas'])
+        for nome, quantidade in resumo.get('contadores', {}).items():
+            self.contar(nome, quantidade)
+
+    def resumo(self):
+        with self._lock:
+            resumo = {
+                'etapas': {nome: {'segundos': round(total, 6), 'chamadas': quantidade}
+                           for nome, (total, quantidade) in self.etapas.items()},
+                'contadores': dict(self.contadores),
+            }
+            if self.campos:
+                resumo['campos'] = {campo: {'acertos': acertos, 'faltas': faltas,
+                                            'taxa_acerto': round(acertos / (acertos + faltas), 4)}
+                                    for campo, (acertos, faltas) in self.campos.items()}
+            return resumo
+
+
+_coletor = Coletor()
+_saida_jsonl = None
+_lock_saida = threading.Lock()
+
+
+def configurar_log(nivel='WARNING'):
+    logging.basicConfig(level=nivel.upper() if isinstance(nivel, str) else nivel,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+def iniciar(jsonl=None):
+    """
+    Zera as métricas do processo e, com `jsonl`, passa a gravar um evento JSON por linha nesse arquivo.
+    """
+    global _coletor, _saida_jsonl
+    _coletor = Coletor()
+    if _saida_jsonl:
+        _saida_jsonl.close()
+    _saida_jsonl = open(jsonl, 'a', encoding='utf-8') if jsonl else None
+
+def _emitir(evento):
+    if _saida_jsonl is None:
+        return
+    linha = json.dumps(evento, ensure_ascii=False)
+    with _lock_saida:
+        _saida_jsonl.write(linha + '\n')
+
+@contextmanager
+def etapa(nome):
+    coletor = _coletor
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        coletor.adicionar_etapa(nome, time.perf_counter() - inicio)
+
+def contar(nome, quantidade=1):
+    _coletor.contar(nome, quantidade)
+
+def medir_documento(funcao, pdf_path):
+    """
+    Executa funcao(pdf_path) com um coletor exclusivo e devolve (resultado, métricas do documento).
+    É o que os workers do pool executam, para que as métricas voltem ao processo principal.
+    """
+    global _coletor
+    anterior = _coletor
+    _coletor = Coletor()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcao(pdf_path)
+        registro = _coletor.resumo()
+    finally:
+        _coletor = anterior
+    registro['arquivo'] = str(pdf_path)
+    registro['segundos_total'] = round(time.perf_counter() - inicio, 6)
+    return resultado, registro
+
+def registrar_documento(registro):
+    _coletor.mesclar(registro)
+    _coletor.contar('documentos')
+    _emitir(dict(registro, tipo='documento'))
+    logger.debug("%s processado em %.3fs", registro['arquivo'], registro['segundos_total'])
+
+def registrar_erro(pdf_path, erro):
+    _coletor.contar('erros')
+    _emitir({'tipo': 'erro', 'arquivo': str(pdf_path), 'erro': str(erro)})
+    logger.warning("Erro ao processar o arquivo %s: %s", pdf_path, erro)
+
+def registrar_campos(arquivo, encontrados):
+    """
+    Registra quais campos foram encontrados em um documento ({campo: bool}).
+    """
+    for campo, encontrado in encontrados.items():
+        _coletor.adicionar_campo(campo, encontrado)
+    faltando = [campo for campo, encontrado in encontrados.items() if not encontrado]
+    _emitir({'tipo': 'campos', 'arquivo': str(arquivo), 'faltando': faltando})
+
+def resumo():
+    return _coletor.resumo()
+
+def finalizar():
+    """
+    Grava o resumo da execução como último evento, fecha o arquivo JSONL e devolve o resumo.
+    """
+    global _saida_jsonl
+    dados = _coletor.resumo()
+    _emitir(dict(dados, tipo='resumo'))
+    if _saida_jsonl:
+        _saida_jsonl.close()
+        _saida_jsonl = None
+    for nome, etapa_resumo in sorted(dados['etapas'].items(), key=lambda item: -item[1]['segundos']):
+        logger.info("etapa %-8s %9.3fs em %d chamadas", nome, etapa_resumo['segundos'], etapa_resumo['chamadas'])
+    return dados
+
+@contextmanager
+def execucao(jsonl=None, perfil=None):
+    """
+    Mede uma execução inteira: zera as métricas (ver iniciar), roda o bloco sob perfilar(`perfil`) e, ao
+    final, preenche o dicionário devolvido pelo `with` com o resumo de finalizar. Se o bloco falhar, o
+    resumo do que foi medido até ali também é gravado e o arquivo JSONL é fechado.
+    """
+    resumo = {}
+    iniciar(jsonl)
+    try:
+        with perfilar(perfil):
+            yield resumo
+    finally:
+        resumo.update(finalizar())
+
+@contextmanager
+def perfilar(caminho):
+    """
+    Perfila com cProfile o processo atual e grava as estatísticas em `caminho` (abra com pstats ou snakeviz).
+    Os workers do pool rodam em outros processos; use workers=1 para incluir a extração no perfil.
+    """
+    if not caminho:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        perfil.dump_stats(caminho)
+        logger.info("Perfil salvo em %s", caminho)
@@ -1,420 +1,858 @@
-import subprocess
-
-# Seus códigos Python como strings
-codigo1 = ""
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
-import io
+import argparse
+import logging
 import os
-import openpyxl
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from dataclasses import asdict
+from functools import lru_cache, partial
+from itertools import islice
+
+import metricas
+from cache_texto import CACHE_PADRAO, gravar_cache, hash_arquivo, ler_cache
+from dados_nfse import CAMPOS_OBRIGATORIOS, DadosNFSe
+from leiautes import campos_faltando, extrair_pelo_leiaute, registrar_leiaute
+
+# Extração das NFS-e: texto dos PDFs (PyMuPDF, com OCR nas páginas digitalizadas), campos e Excel.
+# As dependências pesadas são importadas só no caminho que as usa: fitz ao abrir um PDF, o motor de
+# OCR (ocr.py: tesserocr ou pytesseract e PIL) na primeira página digitalizada, openpyxl ao gravar o
+# Excel, pandas só no leiaute "domínio" e o pool de processos só com mais de um worker. Importar o
+# módulo não lê arquivos nem inicia processos; a linha de comando é `python modelos.py --help`.
+
+# Configuração do OCR das páginas digitalizadas ('--psm 3' é a segmentação automática padrão do Tesseract)
+OCR_CONFIG = '--psm 3'
+# Resolução da renderização das páginas enviadas ao OCR (72 é o padrão do get_pixmap)
+OCR_DPI = 72
+# OCR adaptativo: resolução da segunda renderização das páginas digitalizadas em que faltou algum campo
+# obrigatório no OCR a OCR_DPI (ex.: 200 para digitalizações fracas). None reconhece cada página uma vez só.
+OCR_DPI_ALTO = None
+# Áreas da página enviadas ao OCR, em frações da largura e da altura: [(x0, y0, x1, y1), ...].
+# None reconhece a página inteira; ex.: [(0, 0, 1, 0.5)] lê só a metade de cima, onde ficam os campos da NFS-e.
+OCR_REGIOES = None
+# Páginas digitalizadas reconhecidas ao mesmo tempo dentro de um mesmo PDF
+OCR_WORKERS = min(4, os.cpu_count() or 1)
+# Limite de páginas lidas por PDF (None lê todas); as páginas seguintes não são abertas nem reconhecidas
+MAX_PAGINAS = None
+# Primeira linha de dados do modelo Excel; as linhas anteriores são o cabeçalho
+LINHA_INICIAL = 3
+
+_REGEX_ESPACOS = re.compile(r'[\r\n ]+')
+
+logger = logging.getLogger(__name__)
+
+
+def process_pdfs(input_directory, workers=None, cache=None):
+    """
+    Processa todos os arquivos PDF em um diretório, extraindo texto e retornando um dicionário com o nome do arquivo e o texto extraído.
+    Cada PDF é extraído em um processo separado (workers=None usa todos os núcleos, workers=1 processa em série).
+    O dicionário segue a ordem alfabética dos arquivos, qualquer que seja a ordem de conclusão.
+    Com `cache` (caminho do arquivo SQLite), PDFs inalterados desde a última execução não são reprocessados.
+    """
+    return dict(iter_pdfs(input_directory, workers, cache))
 
+def iter_pdfs(input_directory, workers=None, cache=None, campos=None, max_paginas=MAX_PAGINAS, dpi_alto=OCR_DPI_ALTO):
+    """
+    Versão em fluxo de process_pdfs: gera (nome do arquivo, texto) em ordem alfabética à medida que
+    os PDFs terminam, mantendo em memória apenas a janela de arquivos em andamento.
+    `campos`, `max_paginas` e `dpi_alto` seguem para extract_text_from_pdf.
+    """
+    pdf_files = listar_pdfs(input_directory)
+    pdf_paths = [os.path.join(input_directory, filename) for filename in pdf_files]
+    extrair = partial(extract_text_from_pdf, cache=cache, campos=campos, max_paginas=max_paginas, dpi_alto=dpi_alto)
+    textos = iterar_em_pool(extrair, pdf_paths, workers, padrao="")
+    yield from zip(pdf_files, textos)
 
-def process_pdfs(input_directory):
+def listar_pdfs(diretorio):
     """
-    Processa todos os arquivos PDF em um diretório, extraindo texto e retornando um dicionário com o nome do arquivo e o texto extraído.
+    Nomes dos PDFs de `diretorio`, em ordem alfabética (a ordem das linhas no Excel).
     """
-    pdf_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.pdf')]
-    extracted_text = {}
+    return sorted(f for f in os.listdir(diretorio) if f.lower().endswith('.pdf'))
 
-    for filename in pdf_files:
-        pdf_path = os.path.join(input_directory, filename)
-        print(f"Processando {pdf_path}...")
-        text = extract_text_from_pdf(pdf_path)
-        extracted_text[filename] = text
+def adicionar_opcoes_de_execucao(parser, verbose=True):
+    """
+    Acrescenta a `parser` as opções comuns às linhas de comando que extraem PDFs: --workers, --cache,
+    --metricas, --perfil e, com `verbose`, -v/--verbose.
+    """
+    parser.add_argument('--workers', type=int, default=None, help="processos do pool (padrão: todos os núcleos)")
+    parser.add_argument('--cache', default=CACHE_PADRAO, help="arquivo SQLite do cache de texto")
+    if verbose:
+        parser.add_argument('-v', '--verbose', action='store_true', help="mostra o andamento e o resumo das etapas")
+    parser.add_argument('--metricas', default=None, help="grava as métricas em JSON lines neste arquivo")
+    parser.add_argument('--perfil', default=None, help="salva as estatísticas do cProfile neste arquivo")
+
+def executar_em_pool(funcao, pdf_paths, workers=None, padrao=None):
+    """
+    Aplica `funcao` a cada PDF em um pool de processos e devolve os resultados na mesma ordem de `pdf_paths`.
+    Falhas são isoladas por arquivo: o PDF com erro recebe `padrao` e o restante do lote continua.
+    """
+    return list(iterar_em_pool(funcao, pdf_paths, workers, padrao))
 
-    return extracted_text
+def iterar_em_pool(funcao, pdf_paths, workers=None, padrao=None):
+    """
+    Gera os resultados de `funcao` para cada PDF na ordem de `pdf_paths`, com no máximo
+    4 arquivos por worker submetidos ao pool de cada vez.
+    Cada arquivo é medido no worker (ver metricas.medir_documento) e as métricas são somadas neste processo.
+    """
+    medir = partial(metricas.medir_documento, funcao)
+    if workers == 1:
+        for pdf_path in pdf_paths:
+            logger.info("Processando %s...", pdf_path)
+            try:
+                resultado, registro = medir(pdf_path)
+            except Exception as e:
+                metricas.registrar_erro(pdf_path, e)
+                yield padrao
+                continue
+            metricas.registrar_documento(registro)
+            yield resultado
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    janela = 4 * (workers or os.cpu_count() or 1)
+    caminhos = iter(pdf_paths)
+    pendentes = deque()
+    executor = ProcessPoolExecutor(max_workers=workers)
+
+    def submeter(pdf_path):
+        logger.info("Processando %s...", pdf_path)
+        pendentes.append((pdf_path, executor.submit(medir, pdf_path)))
 
-def extract_text_from_pdf(pdf_path):
+    try:
+        for pdf_path in islice(caminhos, janela):
+            submeter(pdf_path)
+        while pendentes:
+            pdf_path, future = pendentes.popleft()
+            try:
+                resultado, registro = future.result()
+                metricas.registrar_documento(registro)
+            except BrokenProcessPool:
+                # Um PDF que derruba o processo (ex.: falha nativa do MuPDF) quebra o pool inteiro.
+                # Este arquivo é refeito sozinho em um processo próprio e os demais pendentes
+                # voltam para um pool novo, de modo que só o arquivo defeituoso fica sem resultado.
+                executor.shutdown(wait=False)
+                resultado = _executar_isolado(medir, pdf_path, padrao)
+                executor = ProcessPoolExecutor(max_workers=workers)
+                for _ in range(len(pendentes)):
+                    pdf_path_pendente, _future = pendentes.popleft()
+                    pendentes.append((pdf_path_pendente, executor.submit(medir, pdf_path_pendente)))
+            except Exception as e:
+                metricas.registrar_erro(pdf_path, e)
+                resultado = padrao
+            for proximo in islice(caminhos, 1):
+                submeter(proximo)
+            yield resultado
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def _executar_isolado(medir, pdf_path, padrao):
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        try:
+            resultado, registro = executor.submit(medir, pdf_path).result()
+        except Exception as e:
+            metricas.registrar_erro(pdf_path, e)
+            return padrao
+    metricas.registrar_documento(registro)
+    return resultado
+
+def extract_text_from_pdf(pdf_path, ocr_workers=OCR_WORKERS, cache=None, dpi=OCR_DPI, regioes=OCR_REGIOES,
+                          campos=None, max_paginas=MAX_PAGINAS, dpi_alto=OCR_DPI_ALTO, nome=None):
     """
     Extrai texto de um arquivo PDF usando PyMuPDF e Tesseract OCR para páginas com imagens.
+    As páginas sem camada de texto são enviadas a um pool limitado de threads (cada chamada do
+    Tesseract roda em um processo próprio), enquanto as páginas com texto seguem sem esperar.
+    O texto final respeita a ordem das páginas.
+    Com `cache` (caminho do arquivo SQLite), um PDF já extraído com a mesma configuração é lido
+    do cache pelo SHA-256 do conteúdo, sem abrir o PDF nem repetir o OCR.
+    As páginas digitalizadas são renderizadas em tons de cinza a `dpi` pontos por polegada; com `regioes`
+    (ver OCR_REGIOES) só essas áreas da página passam pelo OCR.
+    Com `campos` (ex.: CAMPOS_OBRIGATORIOS), as páginas são lidas uma a uma e a leitura para assim que
+    todos esses campos forem encontrados no texto já lido: anexos no fim do PDF não são abertos nem
+    passam pelo OCR. `max_paginas` limita as páginas lidas em qualquer modo.
+    Com `dpi_alto`, o OCR é adaptativo: só as páginas digitalizadas em que ainda falta algum dos `campos`
+    (ou de CAMPOS_OBRIGATORIOS) são renderizadas de novo a `dpi_alto` e reconhecidas outra vez.
+    `pdf_path` também pode ser o conteúdo do PDF já em memória (bytes ou memoryview, ver ingestao.py);
+    `nome` identifica o documento nas mensagens de erro.
     """
     text = ""
     try:
-        pdf_document = fitz.open(pdf_path)
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            page_text = page.get_text()
-            if page_text.strip():
-                text += page_text
-            else:
-                pix = page.get_pixmap()
-                img = Image.open(io.BytesIO(pix.tobytes()))
-                ocr_text = pytesseract.image_to_string(img, config='--psm x')
-                text += ocr_text
-        pdf_document.close()
-        
-        # Limpeza do texto
-        text = text.replace('\n', ' ').replace('\r', ' ').strip()
-        text = re.sub(' +', ' ', text)  # Remove múltiplos espaços
+        # Sob demanda, nenhuma página é renderizada antes de a anterior ser examinada
+        paginas = iter_paginas_texto(pdf_path, ocr_workers, cache, dpi, regioes, max_paginas, antecipar=not campos,
+                                     dpi_alto=dpi_alto, campos=campos or CAMPOS_OBRIGATORIOS, parcial=bool(campos))
+        if campos:
+            text = _ler_ate_encontrar(paginas, campos)
+        else:
+            # As páginas chegam já limpas e o texto completo é montado uma única vez
+            text = " ".join(paginas)
     except Exception as e:
-        print(f"Erro ao processar o arquivo {pdf_path}: {e}")
+        # Roda no worker: o erro entra nas métricas do documento e o arquivo segue com texto vazio
+        metricas.contar('erros')
+        logger.warning("Erro ao processar o arquivo %s: %s", nome or _descrever_origem(pdf_path), e)
     return text
 
-def extract_data_from_text(text):
-    """
-    Extrai dados específicos do texto extraído do PDF usando expressões regulares.
-    """
-    data = {}
-
-    patterns = {
-        'cpf_cnpj': r'CPF/CNPJ[:\s]*([\d./-]+)',  # Ajustado para possível espaço após ':'.
-        'razao_social': r'\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b',  # Nome da empresa.
-        'uf': r'(?<=Belo Horizonte\s)([\w\s]+)',  # Ajustar se a UF estiver em uma posição específica.
-        'municipio': r'\bMunicípio\s*:\s*(\w+)\b',  # Município antes de 'MG'.
-        'endereco': r'(?<=RUA\s)([\w\s,]+)',  # Endereço começando com 'Rua'.
-        'numero_documento': r'Número Documento:\s*(\d+)',
-        'serie' : r'Série:\s*(\d+)',
-        'data': r'Emitida em[:\s]*([\d/]+)',  # Data da emissão.
-        'valor_dos_servicos': r'Valor dos serviços[:\s*R$ ]*([\d,.]+)',  # Valor dos serviços.
-        'valor_descontos': r'Descontos[:\s*R$ ]*([\d,.]+)',  # Descontos.
-        'valor_contabil': r'Valor Líquido[:\s*R$ ]*([\d,.]+)',  # Valor Líquido.
-        'base_calculo': r'Base de Cálculo[:\s*R$ ]*([\d,.]+)',  # Base de Cálculo.
-        'aliquota_iss': r'Alíquota[:\s]*([\d]+%)',  # Alíquota ISS.
-        'valor_iss_normal': r'Valor do ISS[:\s*R$ ]*([\d,.]+)',  # Valor ISS Normal.
-        'valor_iss_retido': r'ISS Retido na Fonte[:\s*R$ ]*([\d,.]+)',  # Valor ISS Retido.
-        'valor_irrf': r'IR[:\s*R$ ]*([\d,.]+)',  # Valor IRRF.
-        'valor_pis': r'PIS[:\s*R$ ]*([\d,.]+)',  # Valor PIS.
-        'valor_cofins': r'COFINS[:\s*R$ ]*([\d,.]+)',  # Valor COFINS.
-        'valor_csll': r'CSLL[:\s*R$ ]*([\d,.]+)',  # Valor CSLL.
-        
-        
-    }
+def _descrever_origem(pdf_path):
+    if isinstance(pdf_path, (str, os.PathLike)):
+        return pdf_path
+    return f"<PDF em memória, {len(pdf_path)} bytes>"
 
-    for key, pattern in patterns.items():
-        
-        match = re.search(pattern, text, re.IGNORECASE)
-        data[key] = match.group(1).strip() if match else "Não Encontrado"
+def _abrir_pdf(pdf_path):
+    import fitz  # PyMuPDF
 
-    return data
+    if isinstance(pdf_path, (str, os.PathLike)):
+        return fitz.open(pdf_path)
+    # Conteúdo em memória: o MuPDF lê direto do buffer, sem arquivo temporário
+    return fitz.open(stream=pdf_path, filetype='pdf')
 
-def fill_excel_with_text_updated(text, template_excel_path, output_excel_path):
-    wb = openpyxl.load_workbook(template_excel_path)
-    sheet = wb.active
+def _ler_ate_encontrar(paginas, campos):
+    """
+    Consome as páginas até o extrator do leiaute da nota encontrar todos os `campos` que esse leiaute tem
+    (ver leiautes.campos_faltando) e devolve o texto lido.
+    Fechar o gerador cancela o OCR pendente, fecha o PDF e grava no cache as páginas lidas (ver iter_paginas_texto).
+    """
+    lidas = []
+    for page_text in paginas:
+        lidas.append(page_text)
+        try:
+            with metricas.etapa('campos'):
+                faltando = campos_faltando(" ".join(lidas), campos)
+        except Exception as e:
+            # O erro é lançado dentro do gerador, e não como um fechamento: a leitura interrompida não vai para o cache
+            paginas.throw(e)
+        if not faltando:
+            metricas.contar('parada_antecipada')
+            break
+    paginas.close()
+    return " ".join(lidas)
+
+def iter_paginas_texto(pdf_path, ocr_workers=OCR_WORKERS, cache=None, dpi=OCR_DPI, regioes=OCR_REGIOES,
+                       max_paginas=MAX_PAGINAS, antecipar=True, dpi_alto=OCR_DPI_ALTO, campos=None, parcial=False):
+    """
+    Gera o texto limpo de cada página do PDF, em ordem, uma página por vez (páginas vazias são omitidas).
+    Sem cache, só a página atual e as que aguardam OCR ficam em memória.
+    Com antecipar=False cada página é entregue antes de a seguinte ser lida, para quem pode parar no meio.
+    `dpi_alto` e `campos` ativam o OCR adaptativo (ver _iterar_paginas).
+    O cache só é gravado quando o OCR de todas as páginas lidas deu certo (as páginas em que ele falhou são
+    omitidas) e, sem `parcial`, quando o consumidor lê o documento até o fim. Com `parcial` (leitura sob
+    demanda, ver _ler_ate_encontrar) as páginas lidas até o consumidor fechar o gerador são gravadas com
+    uma chave própria, que inclui os `campos`: a próxima leitura sob demanda para no mesmo ponto. Um
+    documento já completo no cache também serve à leitura sob demanda.
+    """
+    if not cache:
+        for page_text in _iterar_paginas(pdf_path, ocr_workers, dpi, regioes, max_paginas, antecipar, dpi_alto,
+                                         campos or CAMPOS_OBRIGATORIOS):
+            if page_text is None:
+                continue
+            page_text = normalizar_texto(page_text)
+            if page_text:
+                yield page_text
+        return
+
+    campos = campos or CAMPOS_OBRIGATORIOS
+    config = _config_extracao(dpi, regioes, max_paginas, dpi_alto)
+    with metricas.etapa('hash'):
+        sha256 = hash_arquivo(pdf_path)
+    with metricas.etapa('cache'):
+        paginas = ler_cache(cache, sha256, config)
+        if parcial:
+            config = _config_extracao(dpi, regioes, max_paginas, dpi_alto, campos)
+            if paginas is None:
+                paginas = ler_cache(cache, sha256, config)
+    if paginas is None:
+        # As páginas são guardadas já limpas
+        paginas = []
+        completo = True
+        try:
+            for page_text in _iterar_paginas(pdf_path, ocr_workers, dpi, regioes, max_paginas, antecipar, dpi_alto,
+                                             campos):
+                if page_text is None:
+                    completo = False
+                    continue
+                page_text = normalizar_texto(page_text)
+                paginas.append(page_text)
+                if page_text:
+                    yield page_text
+        except GeneratorExit:
+            # O consumidor parou no meio: só a leitura sob demanda aproveita as páginas lidas até aqui
+            if parcial and completo:
+                with metricas.etapa('cache'):
+                    gravar_cache(cache, sha256, config, paginas)
+            raise
+        if not completo:
+            # Sem o texto de alguma página, o documento é extraído de novo na próxima vez
+            return
+        with metricas.etapa('cache'):
+            gravar_cache(cache, sha256, config, paginas)
+        return
+    metricas.contar('paginas_cache', len(paginas))
+    for page_text in paginas:
+        page_text = normalizar_texto(page_text)
+        if page_text:
+            yield page_text
+
+def normalizar_texto(texto):
+    """
+    Troca quebras de linha e sequências de espaços por um único espaço, numa só passagem.
+    """
+    return _REGEX_ESPACOS.sub(' ', texto).strip()
+
+def _config_extracao(dpi, regioes, max_paginas=None, dpi_alto=None, parar_com=None):
+    # Tudo o que muda o texto produzido entra na chave do cache; `parar_com` são os campos da leitura sob demanda
+    chave = f"ocr={OCR_CONFIG}|dpi={dpi}|cinza"
+    if regioes:
+        chave += f"|regioes={list(regioes)}"
+    if max_paginas:
+        chave += f"|paginas={max_paginas}"
+    if dpi_alto:
+        chave += f"|dpi_alto={dpi_alto}"
+    if parar_com:
+        chave += f"|ate={','.join(parar_com)}"
+    return chave
+
+def _iterar_paginas(pdf_path, ocr_workers, dpi, regioes, max_paginas=None, antecipar=True, dpi_alto=None,
+                    campos=None):
+    """
+    Gera o texto bruto de cada página em ordem. Páginas digitalizadas vão para o pool de OCR
+    (no máximo 2 por thread aguardando) e as seguintes continuam sendo lidas enquanto isso;
+    com antecipar=False o OCR de cada página termina antes de a próxima ser carregada.
+    Com `dpi_alto` (OCR adaptativo), uma página digitalizada cujo OCR a `dpi` deixa algum dos `campos`
+    sem encontrar no texto lido até ali é renderizada de novo a `dpi_alto` e volta ao pool de OCR, enquanto
+    as páginas seguintes continuam sendo lidas. Depois da primeira página em que o OCR a `dpi_alto` não
+    encontra nenhum campo novo, as demais páginas do documento não são refeitas.
+    Uma página cujo OCR falha é registrada no log e gerada como None; as demais continuam valendo.
+    """
+    executor = ThreadPoolExecutor(max_workers=ocr_workers)
+    try:
+        with metricas.etapa('abrir'):
+            pdf_document = _abrir_pdf(pdf_path)
+        with pdf_document:
+            fila = deque()
+            em_ocr = 0
+            # Texto das páginas já entregues, para saber os campos que ainda faltam (só no modo adaptativo)
+            entregues = []
+            motor_carregado = False
+            erro_motor = None
+            refazer = bool(dpi_alto)
+
+            def entregar(parte):
+                # Gera o texto da página do início da fila, ou nada se ela voltou ao pool para o OCR a dpi_alto
+                nonlocal em_ocr, refazer
+                if isinstance(parte, tuple):
+                    em_ocr -= 1
+                    page_num, futuro, anterior = parte
+                    try:
+                        texto = futuro.result()
+                    except Exception as e:
+                        metricas.contar('paginas_ocr_falhas')
+                        logger.warning("Falha no OCR da página %d de %s: %s", page_num + 1,
+                                       _descrever_origem(pdf_path), e)
+                        if anterior is None:
+                            yield None
+                            return
+                        # Falhou o OCR a dpi_alto: fica o texto a dpi e as próximas páginas não são refeitas
+                        texto, anterior, refazer = anterior[0], None, False
+                    if anterior is not None:
+                        texto, refazer = _melhor_ocr(*anterior, texto, entregues, campos)
+                    elif refazer:
+                        faltando = _campos_faltando(" ".join(entregues + [texto]), campos)
+                        if faltando:
+                            # A renderização fica nesta thread (o documento não é thread-safe); o OCR vai para o pool
+                            metricas.contar('paginas_ocr_alta')
+                            with metricas.etapa('render'):
+                                pixmaps = _renderizar_para_ocr(pdf_document.load_page(page_num), dpi_alto, regioes)
+                            fila.appendleft((page_num, executor.submit(_ocr_pixmaps, pixmaps), (texto, faltando)))
+                            em_ocr += 1
+                            return
+                    parte = texto
+                if dpi_alto and parte is not None:
+                    entregues.append(parte)
+                yield parte
+
+            total = len(pdf_document)
+            if max_paginas and total > max_paginas:
+                metricas.contar('paginas_ignoradas', total - max_paginas)
+                total = max_paginas
+            for page_num in range(total):
+                with metricas.etapa('texto'):
+                    page = pdf_document.load_page(page_num)
+                    page_text = page.get_text()
+                if page_text.strip():
+                    metricas.contar('paginas_texto')
+                    fila.append(page_text)
+                else:
+                    metricas.contar('paginas_ocr')
+                    if not motor_carregado:
+                        motor_carregado = True
+                        try:
+                            # O motor de OCR é carregado aqui, na thread que lê o PDF e não nas do pool:
+                            # o tesserocr instala tratadores de sinal e só pode ser importado na thread principal
+                            from ocr import obter_motor
+                            obter_motor(OCR_CONFIG)
+                        except Exception as e:
+                            erro_motor = e
+                            logger.warning("OCR indisponível para %s: %s", _descrever_origem(pdf_path), e)
+                    if erro_motor is not None:
+                        # Sem motor, as páginas digitalizadas ficam sem texto e as de texto continuam valendo
+                        metricas.contar('paginas_ocr_falhas')
+                        fila.append(None)
+                    else:
+                        # Limita as imagens renderizadas aguardando OCR liberando as páginas mais antigas
+                        while em_ocr >= 2 * ocr_workers:
+                            yield from entregar(fila.popleft())
+                        # A renderização fica nesta thread: o documento do MuPDF não é thread-safe
+                        with metricas.etapa('render'):
+                            pixmaps = _renderizar_para_ocr(page, dpi, regioes)
+                        fila.append((page_num, executor.submit(_ocr_pixmaps, pixmaps), None))
+                        em_ocr += 1
+                # Entrega tudo o que já está pronto no início da fila (sem antecipar, espera o OCR da página)
+                while fila and (not isinstance(fila[0], tuple) or fila[0][1].done() or not antecipar):
+                    yield from entregar(fila.popleft())
+            while fila:
+                yield from entregar(fila.popleft())
+    finally:
+        # Se o consumidor parar antes do fim, o OCR ainda não iniciado é descartado
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _melhor_ocr(texto, faltando, texto_alto, entregues, campos):
+    """
+    OCR adaptativo de uma página: entre o texto a `dpi` (com o qual faltavam os campos `faltando`) e o
+    texto a `dpi_alto`, fica o que encontrou mais campos (no empate, o de `dpi_alto`).
+    Devolve (texto, se o OCR a `dpi_alto` encontrou algum campo novo).
+    """
+    faltando_alto = _campos_faltando(" ".join(entregues + [texto_alto]), campos)
+    if len(faltando_alto) <= len(faltando):
+        return texto_alto, len(faltando_alto) < len(faltando)
+    return texto, False
 
-    for row, (filename, extracted_text) in enumerate(text.items(), start=3):
-        data = extract_data_from_text(extracted_text)
-        for col, key in enumerate([
-            'cpf_cnpj', 'razao_social', 'uf', 'municipio', 'endereco','numero_documento', 'serie',            'data', 'valor_dos_servicos', 'valor_descontos', 'valor_contabil',
-            'base_calculo', 'aliquota_iss', 'valor_iss_normal', 'valor_iss_retido',
-            'valor_irrf', 'valor_pis', 'valor_cofins', 'valor_csll', 'valor_crf',
-            'valor_inss'], start=1):  # Ajustar as colunas conforme o Excel
-            sheet.cell(row=row, column=col, value=data.get(key, "Não Encontrado"))
+def _campos_faltando(texto, campos):
+    # Pelo leiaute da nota: os campos que ele não tem não disparam o OCR a dpi_alto
+    with metricas.etapa('campos'):
+        return campos_faltando(normalizar_texto(texto), campos)
 
-    wb.save(output_excel_path)
-    print(f"Excel preenchido salvo em {output_excel_path}")
+def _renderizar_para_ocr(page, dpi, regioes):
+    """
+    Renderiza a página (ou cada região dela) em tons de cinza, um byte por pixel e sem canal alfa.
+    """
+    import fitz  # PyMuPDF
+
+    if not regioes:
+        return [page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)]
+    area = page.rect
+    return [
+        page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False,
+                        clip=fitz.Rect(area.x0 + x0 * area.width, area.y0 + y0 * area.height,
+                                       area.x0 + x1 * area.width, area.y0 + y1 * area.height))
+        for x0, y0, x1, y1 in regioes
+    ]
+
+def _ocr_pixmaps(pixmaps):
+    from ocr import obter_motor
+
+    # O motor (ver ocr.py) fica carregado no processo; as regiões de uma página vão em um único lote
+    with metricas.etapa('ocr'):
+        return "\n".join(obter_motor(OCR_CONFIG).reconhecer(pixmaps))
+
+# Motor de extração de campos em passagem única.
+# Todos os rótulos ("âncoras") são localizados em uma só varredura do texto; cada campo é então lido
+# com sua expressão pré-compilada a partir das posições da sua âncora, na ordem em que aparecem,
+# o que equivale ao re.search de cada extract_* sem percorrer o texto inteiro a cada campo.
+# Nenhuma âncora contém o início de outra, então a varredura sem sobreposição não perde rótulos;
+# por isso 'Valor do ISS' para antes de 'ISS' (que também inicia 'ISS Retido na Fonte').
+_ANCORAS = {
+    'cpf_cnpj': r'CPF/CNPJ:',
+    'codigo_verificacao': r'Código de Verificação:',
+    'belo_horizonte': r'Belo Horizonte',
+    'mg': r'MG(?=\s|$)',
+    'cod_municipio': r'Cod/Município da incidência do ISSQN:',
+    'inscricao_municipal': r'Inscrição Municipal:',
+    'numero_documento': r'Nº:',
+    'serie': r'Série:',
+    'data': r'Emitida em',
+    'situacao': r'Situa[cç][aã]o:',
+    'acumulador': r'Acumulador:',
+    'cfop': r'CFOP:',
+    'valor_dos_servicos': r'Valor\s*dos\s*serviços',
+    'valor_descontos': r'Descontos',
+    'valor_contabil': r'Valor\s*Líquido',
+    'base_calculo': r'Base\s*de\s*Cálculo',
+    'aliquota_iss': r'Alíquota',
+    'valor_iss_normal': r'Valor\s*do\s*(?=ISS)',
+    'valor_iss_retido': r'ISS\s*Retido\s*na\s*Fonte',
+    'valor_irrf': r'IR',
+    'valor_pis': r'PIS',
+    'valor_cofins': r'COFINS',
+    'valor_csll': r'CSLL',
+    'chave_acesso': r'Chave de [Aa]cesso',
+}
+# O grupo nomeado vazio fica no fim de cada alternativa para que o módulo re ainda possa saltar
+# direto às posições que começam com a primeira letra de algum rótulo.
+_REGEX_ANCORAS = re.compile('|'.join(f'{padrao}(?P<{nome}>)' for nome, padrao in _ANCORAS.items()))
+# Fim da seção da nota: a Chave de acesso é o último campo do leiaute, e o rodapé e os anexos que vêm
+# depois não são varridos atrás de rótulos. Sem a chave, o texto inteiro é varrido.
+_REGEX_FIM_NOTA = re.compile(r'Chave de [Aa]cesso[^:]*:\s*\d{44,}')
+
+# Campos lidos diretamente após a âncora: campo -> (âncora, expressão a partir da âncora)
+_REGEX_CAMPOS = {campo: (ancora, re.compile(padrao)) for campo, (ancora, padrao) in {
+    'cpf_cnpj': ('cpf_cnpj', r'CPF/CNPJ:\s*([\d./-]+)'),
+    'uf': ('belo_horizonte', r'Belo Horizonte\s([\w\s]+)'),
+    'numero_documento': ('numero_documento', r'Nº:(\d+/[\d/]+)'),
+    'serie': ('serie', r'Série:\s*(\d+)'),
+    'data': ('data', r'Emitida em[:\s]*([\d/]+)'),
+    'situacao': ('situacao', r'Situa[cç][aã]o:\s*(\d)'),
+    'acumulador': ('acumulador', r'Acumulador:\s*([\w\s]+)'),
+    'cfop': ('cfop', r'CFOP:\s*(\d+)'),
+    'valor_dos_servicos': ('valor_dos_servicos', r'Valor\s*dos\s*serviços[:\s*R$ ]*([\d,.]+)'),
+    'valor_descontos': ('valor_descontos', r'Descontos[:\s*R$ ]*([\d,.]+)'),
+    'valor_contabil': ('valor_contabil', r'Valor\s*Líquido[:\s*R$ ]*([\d,.]+)'),
+    'base_calculo': ('base_calculo', r'Base\s*de\s*Cálculo[:\s*R$ ]*([\d,.]+)'),
+    'aliquota_iss': ('aliquota_iss', r'Alíquota[:\s]*([\d]+%)'),
+    'valor_iss_normal': ('valor_iss_normal', r'Valor\s*do\s*ISS[:\s*R$ ]*([\d,.]+)'),
+    'valor_iss_retido': ('valor_iss_retido', r'ISS\s*Retido\s*na\s*Fonte[:\s*R$ ]*([\d,.]+)'),
+    'valor_irrf': ('valor_irrf', r'IR[:\s*R$ ]*([\d,.]+)'),
+    'valor_pis': ('valor_pis', r'PIS[:\s*R$ ]*([\d,.]+)'),
+    'valor_cofins': ('valor_cofins', r'COFINS[:\s*R$ ]*([\d,.]+)'),
+    'valor_csll': ('valor_csll', r'CSLL[:\s*R$ ]*([\d,.]+)'),
+    'chave_acesso': ('chave_acesso', r'Chave de [Aa]cesso[^:]*:\s*(\d{44,})'),
+}.items()}
+
+_REGEX_CODIGO_VERIFICACAO = re.compile(r'Código de Verificação:\s*([\w\d]+)')
+_REGEX_CNPJ = re.compile(r'CPF/CNPJ:\s*\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}')
+_REGEX_UF = re.compile(r'(?<=\s)MG(?=\s|$)')
+_REGEX_MUNICIPIO = re.compile(r'Cod/Município da incidência do ISSQN:\s*(\d{7})\s*/\s*([^/]+)')
+_REGEX_ENDERECO = re.compile(r'Inscrição Municipal:\s*\d+[\w/-]*\s*(.*?)\s*-\s*Cep:\s*\d{5}-\d{3}', re.DOTALL)
+
+
+def _localizar_ancoras(text):
+    """
+    Varre o texto uma única vez, até o fim da seção da nota, e devolve {âncora: [posições]} em ordem crescente.
+    """
+    posicoes = {}
+    fim = _REGEX_FIM_NOTA.search(text)
+    for match in _REGEX_ANCORAS.finditer(text, 0, fim.end() if fim else len(text)):
+        posicoes.setdefault(match.lastgroup, []).append(match.start())
+    return posicoes
+
+def _primeira_ocorrencia(text, posicoes, ancora, regex):
+    for posicao in posicoes.get(ancora, ()):
+        match = regex.match(text, posicao)
+        if match:
+            return match
+    return None
+
+@lru_cache(maxsize=32)
+def extrair_campos(text):
+    """
+    Extrai todos os campos da NFS-e em uma passagem sobre o texto e devolve um DadosNFSe.
+    O resultado fica em cache por texto, de modo que chamar vários extract_* sobre o mesmo
+    documento não repete a varredura.
+    """
+    posicoes = _localizar_ancoras(text)
+    campos = {}
 
+    for campo, (ancora, regex) in _REGEX_CAMPOS.items():
+        match = _primeira_ocorrencia(text, posicoes, ancora, regex)
+        if match:
+            campos[campo] = match.group(1).strip()
 
+    # Razão Social: texto entre o Código de Verificação e o primeiro CNPJ
+    match_codigo_verificacao = _primeira_ocorrencia(text, posicoes, 'codigo_verificacao', _REGEX_CODIGO_VERIFICACAO)
+    match_cnpj = _primeira_ocorrencia(text, posicoes, 'cpf_cnpj', _REGEX_CNPJ)
+    if match_codigo_verificacao and match_cnpj:
+        text_between = text[match_codigo_verificacao.end():match_cnpj.start()].strip()
+        empresa_name = text_between.replace('\n', ' ').strip().upper()
+        campos['razao_social'] = empresa_name if empresa_name else "RAZÃO SOCIAL NÃO ENCONTRADA."
+
+    # Município da incidência do ISSQN, aceito apenas se a UF aparece no texto
+    match_municipio = _primeira_ocorrencia(text, posicoes, 'cod_municipio', _REGEX_MUNICIPIO)
+    if match_municipio and _primeira_ocorrencia(text, posicoes, 'mg', _REGEX_UF):
+        campos['municipio'] = match_municipio.group(2).strip().upper()
+
+    # Endereço: entre a Inscrição Municipal e o Cep
+    match_endereco = _primeira_ocorrencia(text, posicoes, 'inscricao_municipal', _REGEX_ENDERECO)
+    if match_endereco:
+        campos['endereco'] = match_endereco.group(1).strip().upper()
+
+    return DadosNFSe(**campos)
+
+# BH ISS Digital, o leiaute padrão do registro (ver leiautes.py)
+registrar_leiaute('bh_iss_digital', [
+    r'NFS-e\s*-\s*NOTA FISCAL DE SERVI[ÇC]OS ELETR[ÔO]NICA',
+    r'C[óo]digo de Verifica[çc][ãa]o',
+    r'Compet[êe]ncia',
+    r'Belo Horizonte|BELO HORIZONTE',
+])(extrair_campos)
+
+# Expressões de extract_data_from_text, que mantém o dicionário de sempre (estas chaves, sem diferenciar
+# maiúsculas de minúsculas); o Excel e as demais saídas usam extrair_campos. A razão social vem do motor:
+# a expressão antiga não tinha grupo e falhava (IndexError) em toda nota com CNPJ.
+_REGEX_DADOS_TEXTO = {campo: re.compile(padrao, re.IGNORECASE) if padrao else None for campo, padrao in {
+    'cpf_cnpj': r'CPF/CNPJ[:\s]*([\d./-]+)',
+    'razao_social': None,
+    'uf': r'(?<=Belo Horizonte\s)([\w\s]+)',
+    'municipio': r'\bMunicípio\s*:\s*(\w+)\b',
+    'endereco': r'(?<=RUA\s)([\w\s,]+)',
+    'numero_documento': r'Número Documento:\s*(\d+)',
+    'serie': r'Série:\s*(\d+)',
+    'data': r'Emitida em[:\s]*([\d/]+)',
+    'valor_dos_servicos': r'Valor dos serviços[:\s*R$ ]*([\d,.]+)',
+    'valor_descontos': r'Descontos[:\s*R$ ]*([\d,.]+)',
+    'valor_contabil': r'Valor Líquido[:\s*R$ ]*([\d,.]+)',
+    'base_calculo': r'Base de Cálculo[:\s*R$ ]*([\d,.]+)',
+    'aliquota_iss': r'Alíquota[:\s]*([\d]+%)',
+    'valor_iss_normal': r'Valor do ISS[:\s*R$ ]*([\d,.]+)',
+    'valor_iss_retido': r'ISS Retido na Fonte[:\s*R$ ]*([\d,.]+)',
+    'valor_irrf': r'IR[:\s*R$ ]*([\d,.]+)',
+    'valor_pis': r'PIS[:\s*R$ ]*([\d,.]+)',
+    'valor_cofins': r'COFINS[:\s*R$ ]*([\d,.]+)',
+    'valor_csll': r'CSLL[:\s*R$ ]*([\d,.]+)',
+}.items()}
 
+def extract_data_from_text(text):
+    """
+    Extrai dados específicos do texto extraído do PDF usando expressões regulares.
+    """
+    data = {}
+    for key, regex in _REGEX_DADOS_TEXTO.items():
+        if regex is None:
+            dados = extrair_campos(text)
+            data[key] = getattr(dados, key) if dados.campos_encontrados()[key] else "Não Encontrado"
+            continue
+        match = regex.search(text)
+        data[key] = match.group(1).strip() if match else "Não Encontrado"
+    return data
 
 def extract_cpf_cnpj(text):
-    match = re.search(r'CPF/CNPJ:\s*([\d./-]+)', text)
-    return match.group(1) if match else "Não Encontrado"
+    return extrair_campos(text).cpf_cnpj
 
 def extract_razao_social(text):
     """
     Extrai a Razão Social (nome da empresa) do texto extraído do PDF.
     O nome da empresa está localizado após o Código de Verificação e antes do CNPJ.
     """
-    # Padrão para identificar o Código de Verificação
-    codigo_verificacao_pattern = r'Código de Verificação:\s*([\w\d]+)'
-    
-    # Padrão para identificar o CNPJ
-    cnpj_pattern = r'CPF/CNPJ:\s*\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}'
-    
-    # Encontrar o texto após o Código de Verificação e antes do CNPJ
-    match_codigo_verificacao = re.search(codigo_verificacao_pattern, text)
-    match_cnpj = re.search(cnpj_pattern, text)
-    
-    if match_codigo_verificacao and match_cnpj:
-        start_index = match_codigo_verificacao.end()
-        end_index = match_cnpj.start()
-        
-        # Captura o texto entre o Código de Verificação e o CNPJ
-        text_between = text[start_index:end_index].strip()
-        
-        # Normaliza o texto para maiúsculas e remove possíveis quebras de linha
-        empresa_name = text_between.replace('\n', ' ').strip().upper()
-        
-        return empresa_name if empresa_name else "RAZÃO SOCIAL NÃO ENCONTRADA."
-    
-    return "CNPJ NÃO ENCONTRADO NO TEXTO."
-
-# Exemplo de uso
-text = """
-NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/9918 Emitida em: 15/07/2024 às 09:23:12 Competência: 15/07/2024 Código de Verificação: d18f199f PROTEGE PROTECAO E TRANSPORTE 
-DE VALORES LTDA CPF/CNPJ: 43.035.146/0061-16 Inscrição Municipal: 0827308/002-X AVE PRESIDENTE CARLOS LUZ, 695, Caiçaras - Cep: 31230-000 Belo Horizonte MG Telefone:  (11)3156-0800 Email:   Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52 Inscrição Municipal: Não Informado AGUIA V COMERCIO DE COMBUSTIVEIS LTDA AV V BARAO HOMEM DE MELO, 400, NOVA SUISSA - Cep: 30421-284 Belo Horizonte MG Telefone: Não Informado Email: Não Informado Discriminação do(s) Serviço(s) Servicos de processamento de numerario Nao incidencia de imposto na fonte conf. SC COSIT n 98 de 17/08/2018Vencimento da Fatura 20/08/2024 Valor aproximado de tributos:106.64 Código de Tributação do Município (CTISS) 1104-0/02-88 / Carga, descarga e arrumação de bens de qualquer espécie Subitem Lista de Serviços LC 116/03 / Descrição: 11.04 / Armazenamento, deposito, carga, descarga, arrumacao e guarda de bens de qualquer especie. Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte Natureza da Operação: Tributação no município Valor dos serviços: R$ 2.921,54 (-) Descontos: R$ 0,00 (-) Retenções Federais: R$ 0,00 (-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ 2.921,54 Valor dos serviços: R$ 2.921,54 (-) Deduções: R$ 0,00 (-) Desconto Incondicionado: R$ 0,00 (=) Base de Cálculo: R$ 2.921,54 (x) Alíquota: 5% (=)Valor do ISS: R$ 146,08 Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00 Outras retenções: R$ 0,00 Outras Informações: Chave de acesso no Ambiente de Dados Nacional: 31062001243035146006116240000000991824077484851314. Prefeitura de Belo Horizonte - Secretaria Municipal de Fazenda Rua Espírito Santo, 605 - 3º andar - Centro - CEP: 30160-919 - Belo Horizonte MG. Dúvidas: SIGESP 02/08/2024, 08:16 :: NFS-e - Nota Fiscal de Serviços eletrônica :: https://bhissdigital.pbh.gov.br/nfse/pages/exibicaoNFS-e.jsf 1/1
-"""
+    return extrair_campos(text).razao_social
 
 def extract_uf(text):
-    pattern = r'(?<=Belo Horizonte\s)([\w\s]+)'
-    match = re.search(pattern, text)
-    print(f"Texto para busca: {text}")  # Mensagem de depuração
-    print(f"Padrão de busca: {pattern}")  # Mensagem de depuração
-    if match:
-        print(f"Correspondência encontrada: {match.group(0)}")  # Mensagem de depuração
-        return match.group(0).strip()
+    result = extrair_campos(text).uf
+    logger.debug("Texto para busca: %s", text)
+    logger.debug("Padrão de busca: %s", _REGEX_CAMPOS['uf'][1].pattern)
+    if result != "Não Encontrado":
+        logger.debug("Correspondência encontrada: %s", result)
     else:
-        print("Nenhuma correspondência encontrada.")  # Mensagem de depuração
-        return "Não Encontrado"
-
-
+        logger.debug("Nenhuma correspondência encontrada.")
+    return result
 
 def extract_municipio(text):
     """
     Extrai o município do texto extraído do PDF.
     O município está localizado antes da UF.
     """
-    # Padrão para identificar a UF
-    uf_pattern = r'(?<=\s)MG(?=\s|$)'  # Ajuste o padrão se a UF puder variar
-    
-    # Padrão para identificar o município
-    municipio_pattern = r'Cod/Município da incidência do ISSQN:\s*(\d{7})\s*/\s*([^/]+)'
-
-    # Encontrar a UF
-    match_uf = re.search(uf_pattern, text)
-    
-    # Encontrar o município e o código do município
-    match_municipio = re.search(municipio_pattern, text)
-    
-    if match_municipio:
-        municipio_name = match_municipio.group(2).strip().upper()
-        
-        # Verifica se o município é encontrado antes da UF
-        if match_uf:
-            return municipio_name
-        
-    return "Município não encontrado."
-
-# Exemplo de uso
-text = """
-NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/9918 Emitida em: 15/07/2024 às 09:23:12 Competência: 15/07/2024 Código de Verificação: d18f199f PROTEGE PROTECAO E TRANSPORTE 
-DE VALORES LTDA CPF/CNPJ: 43.035.146/0061-16 Inscrição Municipal: 0827308/002-X AVE PRESIDENTE CARLOS LUZ, 695, Caiçaras - Cep: 31230-000 Belo Horizonte MG Telefone:  (11)3156-0800 Email:   Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52 Inscrição Municipal: Não Informado AGUIA V COMERCIO DE COMBUSTIVEIS LTDA AV V BARAO HOMEM DE MELO, 400, NOVA SUISSA - Cep: 30421-284 Belo Horizonte MG Telefone: Não Informado Email: Não Informado Discriminação do(s) Serviço(s) Servicos de processamento de numerario Nao incidencia de imposto na fonte conf. SC COSIT n 98 de 17/08/2018Vencimento da Fatura 20/08/2024 Valor aproximado de tributos:106.64 Código de Tributação do Município (CTISS) 1104-0/02-88 / Carga, descarga e arrumação de bens de qualquer espécie Subitem Lista de Serviços LC 116/03 / Descrição: 11.04 / Armazenamento, deposito, carga, descarga, arrumacao e guarda de bens de qualquer especie. Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte Natureza da Operação: Tributação no município Valor dos serviços: R$ 2.921,54 (-) Descontos: R$ 0,00 (-) Retenções Federais: R$ 0,00 (-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ 2.921,54 Valor dos serviços: R$ 2.921,54 (-) Deduções: R$ 0,00 (-) Desconto Incondicionado: R$ 0,00 (=) Base de Cálculo: R$ 2.921,54 (x) Alíquota: 5% (=)Valor do ISS: R$ 146,08 Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00 Outras retenções: R$ 0,00 Outras Informações: Chave de acesso no Ambiente de Dados Nacional: 31062001243035146006116240000000991824077484851314. Prefeitura de Belo Horizonte - Secretaria Municipal de Fazenda Rua Espírito Santo, 605 - 3º andar - Centro - CEP: 30160-919 - Belo Horizonte MG. Dúvidas: SIGESP 02/08/2024, 08:16 :: NFS-e - Nota Fiscal de Serviços eletrônica :: https://bhissdigital.pbh.gov.br/nfse/pages/exibicaoNFS-e.jsf 1/1
-"""
-
-print(extract_municipio(text))  # Esperado: "BELO HORIZONTE"
-
-
-import re
+    return extrair_campos(text).municipio
 
 def extract_endereco(text):
     """
     Extrai o endereço do texto extraído do PDF.
     O endereço está localizado entre a Inscrição Municipal e o Cep, excluindo o número da Inscrição Municipal e o número do CEP.
     """
-    # Padrão para identificar a Inscrição Municipal e o Cep, capturando apenas o endereço
-    pattern = r'Inscrição Municipal:\s*\d+[\w/-]*\s*(.*?)\s*-\s*Cep:\s*\d{5}-\d{3}'
-    
-    # Encontrar o endereço
-    match = re.search(pattern, text, re.DOTALL)
-    
-    if match:
-        endereco = match.group(1).strip()
-        return endereco.upper()
-    
-    return "Endereço não encontrado."
-
-# Exemplo de uso
-text = """
-NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/9918 Emitida em: 15/07/2024 às 09:23:12 Competência: 15/07/2024 Código de Verificação: d18f199f PROTEGE PROTECAO E TRANSPORTE DE VALORES LTDA CPF/CNPJ: 43.035.146/0061-16 Inscrição Municipal: 0827308/002-X AVE PRESIDENTE CARLOS LUZ, 695, Caiçaras - Cep: 31230-000 Belo Horizonte MG Telefone:  (11)3156-0800 Email:   Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52 Inscrição Municipal: Não Informado AGUIA V COMERCIO DE COMBUSTIVEIS LTDA AV V BARAO HOMEM DE MELO, 400, NOVA SUISSA - Cep: 30421-284 Belo Horizonte MG Telefone: Não Informado Email: Não Informado Discriminação do(s) Serviço(s) Servicos de processamento de numerario Nao incidencia de imposto na fonte conf. SC COSIT n 98 de 17/08/2018Vencimento da Fatura 20/08/2024 Valor aproximado de tributos:106.64 Código de Tributação do Município (CTISS) 1104-0/02-88 / Carga, descarga e arrumação de bens de qualquer espécie Subitem Lista de Serviços LC 116/03 / Descrição: 11.04 / Armazenamento, deposito, carga, descarga, arrumacao e guarda de bens de qualquer especie. Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte Natureza da Operação: Tributação no município Valor dos serviços: R$ 2.921,54 (-) Descontos: R$ 0,00 (-) Retenções Federais: R$ 0,00 (-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ 2.921,54 Valor dos serviços: R$ 2.921,54 (-) Deduções: R$ 0,00 (-) Desconto Incondicionado: R$ 0,00 (=) Base de Cálculo: R$ 2.921,54 (x) Alíquota: 5% (=)Valor do ISS: R$ 146,08 Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00 Outras retenções: R$ 0,00 Outras Informações: Chave de acesso no Ambiente de Dados Nacional: 31062001243035146006116240000000991824077484851314. Prefeitura de Belo Horizonte - Secretaria Municipal de Fazenda Rua Espírito Santo, 605 - 3º andar - Centro - CEP: 30160-919 - Belo Horizonte MG. Dúvidas: SIGESP 02/08/2024, 08:16 :: NFS-e - Nota Fiscal de Serviços eletrônica :: https://bhissdigital.pbh.gov.br/nfse/pages/exibicaoNFS-e.jsf 1/1
-"""
-
-print(extract_endereco(text))  # Esperado: "AVE PRESIDENTE CARLOS LUZ, 695, CAIÇARAS"
-
-import re
+    return extrair_campos(text).endereco
 
 def extract_numero_documento(text):
     """
     Extrai o número do documento do texto extraído do PDF.
     O número do documento está localizado antes da data de emissão e no formato Nº:XXXX/YYYY (com variáveis).
     """
-    # Padrão para identificar o número do documento com partes de comprimento variável
-    pattern = r'Nº:(\d+/[\d/]+)'
-    
-    # Encontrar o número do documento
-    match = re.search(pattern, text)
-    
-    if match:
-        numero_documento = match.group(1).strip()
-        return numero_documento
-    
-    return "Número do documento não encontrado."
-
-# Exemplo de uso
-text = """
-NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/9918 Emitida em: 15/07/2024 às 09:23:12 Competência: 15/07/2024 Código de Verificação: d18f199f PROTEGE PROTECAO E TRANSPORTE DE VALORES LTDA CPF/CNPJ: 43.035.146/0061-16 Inscrição Municipal: 0827308/002-X AVE PRESIDENTE CARLOS LUZ, 695, Caiçaras - Cep: 31230-000 Belo Horizonte MG Telefone:  (11)3156-0800 Email:   Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52 Inscrição Municipal: Não Informado AGUIA V COMERCIO DE COMBUSTIVEIS LTDA AV V BARAO HOMEM DE MELO, 400, NOVA SUISSA - Cep: 30421-284 Belo Horizonte MG Telefone: Não Informado Email: Não Informado Discriminação do(s) Serviço(s) Servicos de processamento de numerario Nao incidencia de imposto na fonte conf. SC COSIT n 98 de 17/08/2018Vencimento da Fatura 20/08/2024 Valor aproximado de tributos:106.64 Código de Tributação do Município (CTISS) 1104-0/02-88 / Carga, descarga e arrumação de bens de qualquer espécie Subitem Lista de Serviços LC 116/03 / Descrição: 11.04 / Armazenamento, deposito, carga, descarga, arrumacao e guarda de bens de qualquer especie. Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte Natureza da Operação: Tributação no município Valor dos serviços: R$ 2.921,54 (-) Descontos: R$ 0,00 (-) Retenções Federais: R$ 0,00 (-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ 2.921,54 Valor dos serviços: R$ 2.921,54 (-) Deduções: R$ 0,00 (-) Desconto Incondicionado: R$ 0,00 (=) Base de Cálculo: R$ 2.921,54 (x) Alíquota: 5% (=)Valor do ISS: R$ 146,08 Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00 Outras retenções: R$ 0,00 Outras Informações: Chave de acesso no Ambiente de Dados Nacional: 31062001243035146006116240000000991824077484851314. Prefeitura de Belo Horizonte - Secretaria Municipal de Fazenda Rua Espírito Santo, 605 - 3º andar - Centro - CEP: 30160-919 - Belo Horizonte MG. Dúvidas: SIGESP 02/08/2024, 08:16 :: NFS-e - Nota Fiscal de Serviços eletrônica :: https://bhissdigital.pbh.gov.br/nfse/pages/exibicaoNFS-e.jsf 1/1
-"""
-
-print(extract_numero_documento(text))  # Esperado: "2024/9918"
+    return extrair_campos(text).numero_documento
 
 
 def extract_serie(text):
-    pattern = r'Série:\s*(\d+)'
-    match = re.search(pattern, text)
-    return match.group(1).strip() if match else ""
-
+    return extrair_campos(text).serie
 
 def extract_data(text):
-    match = re.search(r'Emitida em[:\s]*([\d/]+)', text)
-    return match.group(1) if match else "Não Encontrado"
+    return extrair_campos(text).data
 
 def extract_situacao(text):
-    match = re.search(r'Situa[cç][aã]o:\s*(\d)', text)
-    return match.group(1) if match else "0"
+    return extrair_campos(text).situacao
 
 def extract_acumulador(text):
-    match = re.search(r'Acumulador:\s*([\w\s]+)', text)
-    result = match.group(1).strip() if match else ""
-    print("Acumulador:", result)
+    result = extrair_campos(text).acumulador
+    logger.debug("Acumulador: %s", result)
     return result
 
 def extract_cfop(text):
-    match = re.search(r'CFOP:\s*(\d+)', text)
-    result = match.group(1) if match else ""
-    print("CFOP:", result)
+    result = extrair_campos(text).cfop
+    logger.debug("CFOP: %s", result)
     return result
 
 def extract_valor_dos_servicos(text):
-    match = re.search(r'Valor\s*dos\s*serviços[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else "Não Encontrado"
-    print("Valor dos Serviços:", result)
+    result = extrair_campos(text).valor_dos_servicos
+    logger.debug("Valor dos Serviços: %s", result)
     return result
 
 def extract_valor_descontos(text):
-    match = re.search(r'Descontos[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else "Não Encontrado"
-    print("Valor Descontos:", result)
+    result = extrair_campos(text).valor_descontos
+    logger.debug("Valor Descontos: %s", result)
     return result
 
 def extract_valor_contabil(text):
-    match = re.search(r'Valor\s*Líquido[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else "Não Encontrado"
-    print("Valor Contábil:", result)
+    result = extrair_campos(text).valor_contabil
+    logger.debug("Valor Contábil: %s", result)
     return result
 
 def extract_base_calculo(text):
-    match = re.search(r'Base\s*de\s*Cálculo[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else "Não Encontrado"
-    print("Base de Calculo:", result)
+    result = extrair_campos(text).base_calculo
+    logger.debug("Base de Calculo: %s", result)
     return result
 
 def extract_aliquota_iss(text):
-    match = re.search(r'Alíquota[:\s]*([\d]+%)', text)
-    result = match.group(1) if match else ""
-    print("Alíquota ISS:", result)
+    result = extrair_campos(text).aliquota_iss
+    logger.debug("Alíquota ISS: %s", result)
     return result
 
 def extract_valor_iss_normal(text):
-    match = re.search(r'Valor\s*do\s*ISS[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor ISS Normal:", result)
+    result = extrair_campos(text).valor_iss_normal
+    logger.debug("Valor ISS Normal: %s", result)
     return result
 
 def extract_valor_iss_retido(text):
-    match = re.search(r'ISS\s*Retido\s*na\s*Fonte[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor ISS Retido:", result)
+    result = extrair_campos(text).valor_iss_retido
+    logger.debug("Valor ISS Retido: %s", result)
     return result
 
 def extract_valor_irrf(text):
-    match = re.search(r'IR[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor IRRF:", result)
+    result = extrair_campos(text).valor_irrf
+    logger.debug("Valor IRRF: %s", result)
     return result
 
 def extract_valor_pis(text):
-    match = re.search(r'PIS[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor PIS:", result)
+    result = extrair_campos(text).valor_pis
+    logger.debug("Valor PIS: %s", result)
     return result
 
 def extract_valor_cofins(text):
-    match = re.search(r'COFINS[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor COFINS:", result)
+    result = extrair_campos(text).valor_cofins
+    logger.debug("Valor COFINS: %s", result)
     return result
 
 def extract_valor_csll(text):
-    match = re.search(r'CSLL[:\s*R$ ]*([\d,.]+)', text)
-    result = match.group(1) if match else ""
-    print("Valor CSLL:", result)
+    result = extrair_campos(text).valor_csll
+    logger.debug("Valor CSLL: %s", result)
     return result
 
-
-
-
 def fill_excel_with_text_updated(text, template_excel_path, output_excel_path):
-    wb = openpyxl.load_workbook(template_excel_path)
-    sheet = wb.active
-
-    for row, (filename, extracted_text) in enumerate(text.items(), start=3):
-        sheet[f'A{row}'] = extract_cpf_cnpj(extracted_text)
-        sheet[f'B{row}'] = extract_razao_social(extracted_text)
-        sheet[f'C{row}'] = extract_uf(extracted_text)
-        sheet[f'D{row}'] = extract_municipio(extracted_text)
-        sheet[f'E{row}'] = extract_endereco(extracted_text)
-        sheet[f'F{row}'] = extract_numero_documento(extracted_text)
-        sheet[f'G{row}'] = extract_serie(extracted_text)
-        sheet[f'H{row}'] = extract_data(extracted_text)
-        sheet[f'I{row}'] = extract_situacao(extracted_text)
-        sheet[f'J{row}'] = extract_acumulador(extracted_text)
-        sheet[f'K{row}'] = extract_cfop(extracted_text)
-        sheet[f'L{row}'] = extract_valor_dos_servicos(extracted_text)
-        sheet[f'M{row}'] = extract_valor_descontos(extracted_text)
-        sheet[f'N{row}'] = extract_valor_contabil(extracted_text)
-        sheet[f'O{row}'] = extract_base_calculo(extracted_text)
-        sheet[f'P{row}'] = extract_aliquota_iss(extracted_text)
-        sheet[f'Q{row}'] = extract_valor_iss_normal(extracted_text)
-        sheet[f'R{row}'] = extract_valor_iss_retido(extracted_text)
-        sheet[f'S{row}'] = extract_valor_irrf(extracted_text)
-        sheet[f'T{row}'] = extract_valor_pis(extracted_text)
-        sheet[f'U{row}'] = extract_valor_cofins(extracted_text)
-        sheet[f'V{row}'] = extract_valor_csll(extracted_text)
- 
-
-    wb.save(output_excel_path)
-    print(f"Excel preenchido salvo em {output_excel_path}")
-
-
-def main(input_directory, template_excel_path, output_excel_path):
-    text_data = {}
-    for filename in os.listdir(input_directory):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(input_directory, filename)
-            print(f"Processando {pdf_path}...")
-            text = extract_text_from_pdf(pdf_path)
-            text_data[filename] = text
-
-            # Exibe o texto extraído para análise
-            print(f"Texto extraído de {filename}:")
-            print(text)
-            print("\n" + "="*50 + "\n")
-
-    # Após análise, continue com o preenchimento do Excel
-    fill_excel_with_text_updated(text_data, template_excel_path, output_excel_path)
-
-if __name__ == "__main__":
-    input_directory = 'c:\\Users\\jhennifer.nascimento\\nfs\\pdf\\st'
-    template_excel_path = 'c:\\Users\\jhennifer.nascimento\\nfs\\modelo.xlsx.xlsx'
-    output_excel_path = 'c:\\Users\\jhennifer.nascimento\\nfs\\output.xlsx'
+    """
+    Grava uma linha por documento no Excel de saída, mantendo as linhas de cabeçalho do modelo.
+    `text` pode ser o dicionário {arquivo: texto} ou qualquer iterável de pares (arquivo, texto),
+    como iter_pdfs; as linhas são acrescentadas pelo modo write-only do openpyxl à medida que
+    chegam, então a memória não cresce com o tamanho do lote.
+    """
+    registros = text.items() if isinstance(text, dict) else text
+    linhas = (_extrair_linha(filename, extracted_text) for filename, extracted_text in registros)
+    gravar_linhas_excel(linhas, template_excel_path, output_excel_path)
+
+def _extrair_linha(filename, text):
+    with metricas.etapa('campos'):
+        dados = extrair_dados(text)
+    metricas.registrar_campos(filename, dados.campos_encontrados())
+    return dados.linha_excel()
+
+@lru_cache(maxsize=32)
+def extrair_dados(text):
+    """
+    Extrai os campos da nota com o extrator do leiaute dela (ver leiautes.py; o BH ISS Digital, leiaute
+    padrão, é extrair_campos). É o que todas as saídas usam; o resultado fica em cache por texto.
+    """
+    return extrair_pelo_leiaute(text)[1]
 
-    main(input_directory, template_excel_path, output_excel_path)
+def gravar_linhas_excel(linhas, template_excel_path, output_excel_path):
+    """
+    Grava as linhas (listas de valores na ordem de COLUNAS_EXCEL) a partir de LINHA_INICIAL,
+    abaixo do cabeçalho copiado do modelo, em modo write-only.
+    """
+    import openpyxl
 
-print("Executando código 1")
+    wb = openpyxl.Workbook(write_only=True)
+    with metricas.etapa('excel'):
+        sheet = _copiar_cabecalho(template_excel_path, wb)
 
+    for linha in linhas:
+        with metricas.etapa('excel'):
+            sheet.append(linha)
 
-codigo2 = ""
-import fitz  # PyMuPDF
-import re
-import pandas as pd
+    with metricas.etapa('excel'):
+        wb.save(output_excel_path)
+    logger.info("Excel preenchido salvo em %s", output_excel_path)
 
+def _copiar_cabecalho(template_excel_path, wb):
+    """
+    Cria a planilha de saída com as linhas anteriores a LINHA_INICIAL do modelo (valores, estilos,
+    mesclagens e larguras de coluna). Só o cabeçalho do modelo é lido; o restante é ignorado.
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+
+    modelo = openpyxl.load_workbook(template_excel_path)
+    origem = modelo.active
+    sheet = wb.create_sheet(origem.title)
+
+    for letra, dimensao in origem.column_dimensions.items():
+        if dimensao.width:
+            sheet.column_dimensions[letra].width = dimensao.width
+    for faixa in origem.merged_cells.ranges:
+        if faixa.max_row < LINHA_INICIAL:
+            sheet.merged_cells.add(faixa.coord)
+    sheet.freeze_panes = origem.freeze_panes
+
+    for linha in origem.iter_rows(min_row=1, max_row=LINHA_INICIAL - 1):
+        celulas = []
+        for celula in linha:
+            nova = WriteOnlyCell(sheet, value=celula.value)
+            if celula.has_style:
+                nova.font = copy(celula.font)
+                nova.fill = copy(celula.fill)
+                nova.border = copy(celula.border)
+                nova.alignment = copy(celula.alignment)
+                nova.number_format = celula.number_format
+            celulas.append(nova)
+        sheet.append(celulas)
+
+    modelo.close()
+    return sheet
+
+
+def main(input_directory, template_excel_path, output_excel_path, workers=None, cache=CACHE_PADRAO,
+         metricas_jsonl=None, perfil=None, sob_demanda=False, max_paginas=MAX_PAGINAS,
+         dpi_alto=OCR_DPI_ALTO, armazem=None):
+    """
+    Extrai os PDFs do diretório e grava o Excel. Com `metricas_jsonl`, grava um evento JSON por linha
+    (documentos, campos não encontrados, erros e o resumo final); com `perfil`, salva as estatísticas do cProfile.
+    Com `sob_demanda`, cada PDF é lido só até CAMPOS_OBRIGATORIOS serem encontrados; com `dpi_alto`,
+    as páginas digitalizadas em que faltam campos são reconhecidas de novo nessa resolução.
+    Com `armazem` (caminho do arquivo SQLite), as notas também são gravadas no armazém local (ver armazem.py).
+    """
+    def exibir(registros):
+        for filename, text in registros:
+            # Texto extraído para análise (visível com o log em nível DEBUG)
+            logger.debug("Texto extraído de %s:\n%s", filename, text)
+            yield filename, text
+
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        # Cada documento vai para o Excel assim que termina de ser extraído
+        campos = CAMPOS_OBRIGATORIOS if sob_demanda else None
+        registros = iter_pdfs(input_directory, workers, cache, campos, max_paginas, dpi_alto)
+        if armazem:
+            from armazem import armazenar
+            registros = armazenar(registros, armazem, diretorio=input_directory)
+        fill_excel_with_text_updated(exibir(registros), template_excel_path, output_excel_path)
+    return resumo
+
+# Leiaute "domínio" (pares "Rótulo: valor"), gravado com o pandas
 def extrair_texto_pdf(pdf_path):
-    texto = ""
+    import fitz  # PyMuPDF
+
     with fitz.open(pdf_path) as pdf:
-        for pagina in pdf:
-            texto += pagina.get_text()
-    return texto
+        return "".join(pagina.get_text() for pagina in pdf)
 
 def extrair_dados_nfse(texto):
     # Expressões regulares para capturar diferentes partes dos dados
@@ -489,59 +927,120 @@ def extrair_dados_nfse(texto):
         "Valores": valores
     }
 
-def processar_pdf(pdf_path, excel_path):
-    texto = extrair_texto_pdf(pdf_path)
-    dados = extrair_dados_nfse(texto)
-    
+def _dados_para_dataframe(dados):
+    import pandas as pd
+
     # Transformando os valores financeiros em colunas separadas
     valores_df = pd.DataFrame([dados['Valores']])
-    dados.pop('Valores')
+    dados = {chave: valor for chave, valor in dados.items() if chave != 'Valores'}
     
     # Convertendo para DataFrame
     df_dados = pd.DataFrame([dados])
     
     # Combinando as informações em um único DataFrame
-    df_final = pd.concat([df_dados, valores_df], axis=1)
+    return pd.concat([df_dados, valores_df], axis=1)
+
+def processar_pdf(pdf_path, excel_path):
+    texto = extrair_texto_pdf(pdf_path)
+    dados = extrair_dados_nfse(texto)
+    df_final = _dados_para_dataframe(dados)
     
     # Exportando para o Excel
     df_final.to_excel(excel_path, index=False, mode='a', header=False)
 
-# Função principal para executar com subprocess
-def main():
-    pdf_path = 'C:\\Users\\jhennifer.nascimento\\nfs\\pdf\\st\\nfse_dominio.pdf'
-    excel_path = 'C:\\Users\\jhennifer.nascimento\\nfs\\output.xlsx'
-    
-    # Executando o processamento de PDF e exportação para Excel em paralelo
-    p1 = subprocess.Popen(['python', '-c', f'import sys; sys.path.append("."); from __main__ import processar_pdf; processar_pdf("{pdf_path}", "{excel_path}")'])
-    
-    # Se houver outro processo, adicione abaixo, por exemplo:
-    # p2 = subprocess.Popen(['python', 'outro_script.py'])
-    
-    # Aguardando a conclusão do subprocess
-    p1.wait()
-    # p2.wait()  # Caso outro processo tenha sido iniciado
+def extrair_dados_pdf(pdf_path):
+    return extrair_dados_nfse(extrair_texto_pdf(pdf_path))
+
+def processar_pdfs(pdf_paths, excel_path, workers=None):
+    """
+    Extrai e interpreta cada PDF em um processo do pool e grava todas as notas de uma vez no Excel,
+    na mesma ordem de `pdf_paths`. PDFs com erro ficam de fora sem interromper o lote.
+    """
+    import pandas as pd
+
+    resultados = executar_em_pool(extrair_dados_pdf, pdf_paths, workers)
+    frames = [_dados_para_dataframe(dados) for dados in resultados if dados is not None]
+    if not frames:
+        logger.warning("Nenhuma nota processada.")
+        return
+    pd.concat(frames, ignore_index=True).to_excel(excel_path, index=False)
+
+def main_dominio(pdf_paths, excel_path, workers=None):
+    """
+    Processa os PDFs do leiaute "domínio" em paralelo e grava o Excel com o pandas.
+    """
+    # Cada PDF é processado em um worker do pool
+    processar_pdfs(pdf_paths, excel_path, workers)
 
-if __name__ == "__main__":
-    main()
 
-# Código 2
-print("Executando código 2")
+# NFS-e de exemplo do BH ISS Digital, usada pelo subcomando `exemplo`
+TEXTO_EXEMPLO = """
+NFS-e - NOTA FISCAL DE SERVIÇOS ELETRÔNICA Nº:2024/9918 Emitida em: 15/07/2024 às 09:23:12 Competência: 15/07/2024 Código de Verificação: d18f199f PROTEGE PROTECAO E TRANSPORTE 
+DE VALORES LTDA CPF/CNPJ: 43.035.146/0061-16 Inscrição Municipal: 0827308/002-X AVE PRESIDENTE CARLOS LUZ, 695, Caiçaras - Cep: 31230-000 Belo Horizonte MG Telefone:  (11)3156-0800 Email:   Tomador do(s) Serviço(s) CPF/CNPJ: 39.609.220/0001-52 Inscrição Municipal: Não Informado AGUIA V COMERCIO DE COMBUSTIVEIS LTDA AV V BARAO HOMEM DE MELO, 400, NOVA SUISSA - Cep: 30421-284 Belo Horizonte MG Telefone: Não Informado Email: Não Informado Discriminação do(s) Serviço(s) Servicos de processamento de numerario Nao incidencia de imposto na fonte conf. SC COSIT n 98 de 17/08/2018Vencimento da Fatura 20/08/2024 Valor aproximado de tributos:106.64 Código de Tributação do Município (CTISS) 1104-0/02-88 / Carga, descarga e arrumação de bens de qualquer espécie Subitem Lista de Serviços LC 116/03 / Descrição: 11.04 / Armazenamento, deposito, carga, descarga, arrumacao e guarda de bens de qualquer especie. Cod/Município da incidência do ISSQN: 3106200 / Belo Horizonte Natureza da Operação: Tributação no município Valor dos serviços: R$ 2.921,54 (-) Descontos: R$ 0,00 (-) Retenções Federais: R$ 0,00 (-) ISS Retido na Fonte: R$ 0,00 Valor Líquido: R$ 2.921,54 Valor dos serviços: R$ 2.921,54 (-) Deduções: R$ 0,00 (-) Desconto Incondicionado: R$ 0,00 (=) Base de Cálculo: R$ 2.921,54 (x) Alíquota: 5% (=)Valor do ISS: R$ 146,08 Retenções Federais: PIS: R$ 0,00 COFINS: R$ 0,00 IR: R$ 0,00 CSLL: R$ 0,00 INSS: R$ 0,00 Outras retenções: R$ 0,00 Outras Informações: Chave de acesso no Ambiente de Dados Nacional: 31062001243035146006116240000000991824077484851314. Prefeitura de Belo Horizonte - Secretaria Municipal de Fazenda Rua Espírito Santo, 605 - 3º andar - Centro - CEP: 30160-919 - Belo Horizonte MG. Dúvidas: SIGESP 02/08/2024, 08:16 :: NFS-e - Nota Fiscal de Serviços eletrônica :: https://bhissdigital.pbh.gov.br/nfse/pages/exibicaoNFS-e.jsf 1/1
+"""
+
+# Caminhos usados quando a linha de comando não informa outros
+DIRETORIO_PADRAO = 'c:\\Users\\jhennifer.nascimento\\nfs\\pdf\\st'
+MODELO_PADRAO = 'c:\\Users\\jhennifer.nascimento\\nfs\\modelo.xlsx.xlsx'
+SAIDA_PADRAO = 'c:\\Users\\jhennifer.nascimento\\nfs\\output.xlsx'
+PDF_DOMINIO_PADRAO = 'C:\\Users\\jhennifer.nascimento\\nfs\\pdf\\st\\nfse_dominio.pdf'
 
 
+def _inteiro_do_ambiente(nome, padrao):
+    valor = os.environ.get(nome)
+    return int(valor) if valor else padrao
 
-# Executar ambos os códigos em subprocessos
-processo1 = subprocess.Popen(["python", "-c", codigo1], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-processo2 = subprocess.Popen(["python", "-c", codigo2], stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
+def linha_de_comando(argumentos=None):
+    """
+    Ponto de entrada da linha de comando (python modelos.py ...). Devolve o código de saída.
+    As variáveis NFSE_* continuam valendo como padrão das opções.
+    """
+    parser = argparse.ArgumentParser(description="Extrai NFS-e de PDFs e grava o Excel do modelo.")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    excel = subcomandos.add_parser('excel', help="extrai os PDFs de um diretório para o Excel do modelo")
+    excel.add_argument('input_directory', nargs='?', default=DIRETORIO_PADRAO)
+    excel.add_argument('template_excel_path', nargs='?', default=MODELO_PADRAO)
+    excel.add_argument('output_excel_path', nargs='?', default=SAIDA_PADRAO)
+    adicionar_opcoes_de_execucao(excel, verbose=False)
+    excel.set_defaults(metricas=os.environ.get('NFSE_METRICAS'), perfil=os.environ.get('NFSE_PERFIL'))
+    excel.add_argument('--sob-demanda', action='store_true', default=os.environ.get('NFSE_SOB_DEMANDA') == '1',
+                       help="para de ler cada PDF quando os campos obrigatórios são encontrados")
+    excel.add_argument('--max-paginas', type=int, default=_inteiro_do_ambiente('NFSE_MAX_PAGINAS', MAX_PAGINAS),
+                       help="páginas lidas no máximo por PDF")
+    excel.add_argument('--dpi-alto', type=int, default=_inteiro_do_ambiente('NFSE_DPI_ALTO', OCR_DPI_ALTO),
+                       help="reconhece de novo nesta resolução as páginas digitalizadas em que faltaram campos")
+    excel.add_argument('--armazem', default=os.environ.get('NFSE_ARMAZEM'),
+                       help="também grava as notas neste armazém SQLite (ver armazem.py)")
+    excel.add_argument('--log', default=os.environ.get('NFSE_LOG', 'WARNING'),
+                       help="nível do log: INFO mostra o andamento, DEBUG também o texto de cada documento")
+
+    dominio = subcomandos.add_parser('dominio', help="extrai PDFs do leiaute domínio para um Excel (pandas)")
+    dominio.add_argument('pdfs', nargs='*', default=[PDF_DOMINIO_PADRAO])
+    dominio.add_argument('--saida', default=SAIDA_PADRAO, help="Excel de saída")
+    dominio.add_argument('--workers', type=int, default=None, help="processos do pool (padrão: todos os núcleos)")
+
+    exemplo = subcomandos.add_parser('exemplo', help="mostra os campos extraídos da NFS-e de exemplo ou de um PDF")
+    exemplo.add_argument('pdf', nargs='?', default=None)
+    args = parser.parse_args(argumentos)
+
+    if args.comando == 'excel':
+        metricas.configurar_log(args.log)
+        main(args.input_directory, args.template_excel_path, args.output_excel_path, args.workers, args.cache,
+             args.metricas, args.perfil, args.sob_demanda, args.max_paginas, args.dpi_alto, args.armazem)
+    elif args.comando == 'dominio':
+        metricas.configurar_log()
+        main_dominio(args.pdfs, args.saida, args.workers)
+    else:
+        texto = extract_text_from_pdf(args.pdf) if args.pdf else TEXTO_EXEMPLO
+        for campo, valor in asdict(extrair_campos(normalizar_texto(texto))).items():
+            print(f"{campo}: {valor}")
+    return 0
 
-# Aguarda os dois processos terminarem e captura as saídas
-stdout1, stderr1 = processo1.communicate()
-stdout2, stderr2 = processo2.communicate()
 
-# Mostra os resultados de ambos os processos
-print("Saída do código 1:")
-print(stdout1.decode())
-print(stderr1.decode())
+if __name__ == "__main__":
+    # Executa pelo módulo importado: os módulos carregados depois (armazem, exportacao...) importam
+    # `modelos`, e uma segunda cópia deste arquivo como __main__ teria caches e registros próprios
+    import modelos
 
-print("Saída do código 2:")
-print(stdout2.decode())
-print(stderr2.decode())
+    raise SystemExit(modelos.linha_de_comando())
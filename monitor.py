@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import metricas
+from cache_texto import CACHE_PADRAO
+from incremental import (caminho_manifesto, carregar_manifesto, linhas_alteradas, mesclar_linhas_excel,
+                         salvar_manifesto, verificar_arquivo)
+from modelos import LINHA_INICIAL, adicionar_opcoes_de_execucao, extract_text_from_pdf
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+# Modo contínuo: vigia o diretório de entrada e processa cada PDF assim que ele termina de ser gravado.
+# Os eventos vêm do watchdog (inotify no Linux, ReadDirectoryChangesW no Windows) ou, sem ele, de uma
+# varredura periódica. Um PDF só entra na fila depois de ficar ESPERA_ESTAVEL segundos sem mudar de
+# tamanho nem de data. A fila tem tamanho limitado: com o pool ocupado, os PDFs prontos esperam no
+# diretório em vez de acumular em memória. Os resultados são mesclados no Excel de saída (com o
+# manifesto do modo incremental) em poucos segundos, sem esperar o lote inteiro.
+
+logger = logging.getLogger(__name__)
+
+# Segundos sem mudança de tamanho e data para considerar o PDF completo
+ESPERA_ESTAVEL = 2.0
+# Intervalo da varredura do diretório sem watchdog; com watchdog ela só serve de garantia
+INTERVALO_VARREDURA = 2.0
+INTERVALO_VARREDURA_WATCHDOG = 60.0
+# Tempo máximo entre um resultado e sua gravação no Excel
+INTERVALO_GRAVACAO = 5.0
+# Intervalo do laço que verifica os candidatos e os resultados
+PASSO = 0.5
+
+
+class _Eventos(FileSystemEventHandler):
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    def on_created(self, event):
+        self.monitor.sinalizar(event.src_path)
+
+    def on_modified(self, event):
+        self.monitor.sinalizar(event.src_path)
+
+    def on_moved(self, event):
+        self.monitor.sinalizar(event.dest_path)
+
+
+class Monitor:
+    """
+    Estado do modo contínuo: candidatos aguardando estabilidade, fila limitada para o pool de processos
+    e resultados aguardando a gravação no Excel.
+    """
+
+    def __init__(self, input_directory, template_excel_path, output_excel_path, workers=None, cache=CACHE_PADRAO,
+                 limite_fila=None, usar_watchdog=True):
+        self.input_directory = os.path.abspath(input_directory)
+        self.template_excel_path = template_excel_path
+        self.output_excel_path = output_excel_path
+        self.workers = workers or os.cpu_count() or 1
+        self.limite_fila = limite_fila or 2 * self.workers
+        self.usar_watchdog = usar_watchdog and Observer is not None
+        self.extrair = partial(metricas.medir_documento, partial(extract_text_from_pdf, cache=cache))
+
+        self.manifesto_path = caminho_manifesto(output_excel_path)
+        self.manifesto = carregar_manifesto(self.manifesto_path)
+        if not os.path.exists(output_excel_path):
+            self.manifesto = {'arquivos': {}, 'proxima_linha': LINHA_INICIAL}
+
+        # caminho -> ((tamanho, mtime_ns), momento da última mudança), ou None antes da primeira verificação
+        self.candidatos = {}
+        # PDFs na fila, em extração ou aguardando gravação
+        self.em_andamento = set()
+        # PDFs cuja extração falhou, com a assinatura (tamanho, mtime_ns) que falhou: só voltam se mudarem
+        self.falhas = {}
+        self.resultados = []
+        self.primeiro_resultado = None
+        self.executor = None
+        self._loop = None
+        self._lock_manifesto = None
+
+    def sinalizar(self, caminho):
+        # Chamado pela thread do watchdog
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._novo_candidato, caminho)
+
+    def _novo_candidato(self, caminho):
+        caminho = os.path.abspath(caminho)
+        if (caminho.lower().endswith('.pdf')
+                and os.path.normcase(os.path.dirname(caminho)) == os.path.normcase(self.input_directory)
+                and os.path.basename(caminho) not in self.em_andamento):
+            self.candidatos.setdefault(caminho, None)
+
+    def _varrer(self):
+        arquivos = self.manifesto['arquivos']
+        with os.scandir(self.input_directory) as entradas:
+            for entrada in entradas:
+                if not entrada.name.lower().endswith('.pdf') or entrada.name in self.em_andamento:
+                    continue
+                stat = entrada.stat()
+                conhecido = arquivos.get(entrada.name)
+                if conhecido and conhecido['tamanho'] == stat.st_size and conhecido['mtime'] == stat.st_mtime:
+                    continue
+                if self.falhas.get(entrada.name) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                self.candidatos.setdefault(entrada.path, None)
+
+    def _estaveis(self, agora):
+        prontos = []
+        for caminho, anterior in list(self.candidatos.items()):
+            try:
+                stat = os.stat(caminho)
+            except FileNotFoundError:
+                del self.candidatos[caminho]
+                continue
+            assinatura = (stat.st_size, stat.st_mtime_ns)
+            if anterior is None or anterior[0] != assinatura:
+                self.candidatos[caminho] = (assinatura, agora)
+            elif stat.st_size and agora - anterior[1] >= ESPERA_ESTAVEL and _pode_ler(caminho):
+                del self.candidatos[caminho]
+                prontos.append(caminho)
+        return prontos
+
+    async def _produzir(self, fila, parar):
+        intervalo = INTERVALO_VARREDURA_WATCHDOG if self.usar_watchdog else INTERVALO_VARREDURA
+        ultima_varredura = None
+        while not parar.is_set():
+            agora = time.monotonic()
+            if ultima_varredura is None or agora - ultima_varredura >= intervalo:
+                self._varrer()
+                ultima_varredura = agora
+            for caminho in self._estaveis(agora):
+                filename = os.path.basename(caminho)
+                async with self._lock_manifesto:
+                    alterado = await asyncio.to_thread(verificar_arquivo, filename, caminho, self.manifesto)
+                if alterado is None:
+                    continue
+                self.em_andamento.add(filename)
+                if fila.full():
+                    # Contrapressão: o pool está ocupado e este laço espera uma vaga na fila
+                    metricas.contar('fila_cheia')
+                await fila.put(alterado)
+                logger.info("%s na fila (%d aguardando)", filename, fila.qsize())
+            await asyncio.sleep(PASSO)
+
+    async def _consumir(self, fila):
+        while True:
+            alterado = await fila.get()
+            try:
+                texto = await self._extrair(alterado[1])
+                if not self.resultados:
+                    self.primeiro_resultado = time.monotonic()
+                self.resultados.append((alterado, texto))
+            finally:
+                fila.task_done()
+
+    async def _extrair(self, pdf_path):
+        executor = self.executor
+        try:
+            texto, registro = await self._loop.run_in_executor(executor, self.extrair, pdf_path)
+        except BrokenProcessPool:
+            # Um PDF derrubou o pool e todos os que estavam nele recebem o erro, sem dizer qual foi.
+            # Os próximos vão para um pool novo; cada PDF que estava em andamento é refeito sozinho em um
+            # processo próprio (como em modelos.iterar_em_pool), então só o defeituoso fica como falha.
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            metricas.contar('refeitos_isolados')
+            return await self._extrair_isolado(pdf_path)
+        except Exception as e:
+            metricas.registrar_erro(pdf_path, e)
+            return ""
+        metricas.registrar_documento(registro)
+        return texto
+
+    async def _extrair_isolado(self, pdf_path):
+        # O processo é criado aqui no laço, como os do pool: um fork feito ao mesmo tempo por outra thread
+        # herdaria o pipe do filho e o pool nunca perceberia que ele caiu.
+        executor = ProcessPoolExecutor(max_workers=1)
+        try:
+            texto, registro = await self._loop.run_in_executor(executor, self.extrair, pdf_path)
+        except Exception as e:
+            metricas.registrar_erro(pdf_path, e)
+            return ""
+        finally:
+            executor.shutdown(wait=False)
+        metricas.registrar_documento(registro)
+        return texto
+
+    async def _gravar(self, parar):
+        while True:
+            # Sem nada na fila nem em extração, o que chegou é gravado sem esperar o intervalo
+            ocioso = len(self.resultados) == len(self.em_andamento)
+            if self.resultados and (ocioso or time.monotonic() - self.primeiro_resultado >= INTERVALO_GRAVACAO):
+                await self._gravar_resultados()
+            elif ocioso and parar.is_set():
+                return
+            await asyncio.sleep(PASSO)
+
+    async def _gravar_resultados(self):
+        lote, self.resultados = self.resultados, []
+        async with self._lock_manifesto:
+            await asyncio.to_thread(self._gravar_lote, lote)
+        for (filename, _, stat, _), texto in lote:
+            self.em_andamento.discard(filename)
+            if not texto:
+                self.falhas[filename] = (stat.st_size, stat.st_mtime_ns)
+        logger.info("%d PDFs gravados em %s", len(lote), self.output_excel_path)
+
+    def _gravar_lote(self, lote):
+        alterados = [alterado for alterado, _ in lote]
+        textos = [texto for _, texto in lote]
+        primeira_execucao = not os.path.exists(self.output_excel_path)
+        mesclar_linhas_excel(linhas_alteradas(alterados, textos, self.manifesto), self.template_excel_path,
+                             self.output_excel_path, primeira_execucao)
+        salvar_manifesto(self.manifesto_path, self.manifesto)
+
+    async def executar(self, parar):
+        """
+        Vigia o diretório até `parar` ser sinalizado; então termina a fila e grava o que falta.
+        `parar` é um threading.Event para poder ser sinalizado de fora do laço (Ctrl+C, testes, outro serviço).
+        """
+        self._loop = asyncio.get_running_loop()
+        self._lock_manifesto = asyncio.Lock()
+        fila = asyncio.Queue(maxsize=self.limite_fila)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        observador = None
+        if self.usar_watchdog:
+            observador = Observer()
+            observador.schedule(_Eventos(self), self.input_directory, recursive=False)
+            observador.start()
+        logger.info("Vigiando %s (%s, fila de %d)", self.input_directory,
+                    'watchdog' if observador else f'varredura a cada {INTERVALO_VARREDURA}s', self.limite_fila)
+
+        consumidores = [asyncio.create_task(self._consumir(fila)) for _ in range(self.workers)]
+        gravador = asyncio.create_task(self._gravar(parar))
+        try:
+            await self._produzir(fila, parar)
+            await fila.join()
+            await gravador
+        finally:
+            for tarefa in consumidores + [gravador]:
+                tarefa.cancel()
+            if observador:
+                observador.stop()
+                observador.join()
+            self.executor.shutdown(cancel_futures=True)
+
+
+def _pode_ler(caminho):
+    # No Windows um arquivo ainda aberto para escrita por outro programa não pode ser aberto
+    try:
+        with open(caminho, 'rb'):
+            return True
+    except OSError:
+        return False
+
+def vigiar_pasta(input_directory, template_excel_path, output_excel_path, workers=None, cache=CACHE_PADRAO,
+                 limite_fila=None, parar=None, usar_watchdog=True, metricas_jsonl=None, perfil=None):
+    """
+    Processa continuamente os PDFs que chegam em `input_directory`, mesclando cada um no Excel de saída.
+    Roda até `parar` (threading.Event) ser sinalizado; sem ele, até Ctrl+C.
+    """
+    if parar is None:
+        parar = threading.Event()
+        signal.signal(signal.SIGINT, lambda *_: parar.set())
+    monitor = Monitor(input_directory, template_excel_path, output_excel_path, workers, cache, limite_fila,
+                      usar_watchdog)
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        asyncio.run(monitor.executar(parar))
+    return resumo
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vigia o diretório e processa cada PDF assim que ele chega.")
+    parser.add_argument('input_directory')
+    parser.add_argument('template_excel_path')
+    parser.add_argument('output_excel_path')
+    adicionar_opcoes_de_execucao(parser, verbose=False)
+    parser.add_argument('--fila', type=int, default=None, help="PDFs prontos aguardando o pool (padrão: 2 por worker)")
+    parser.add_argument('--varredura', action='store_true', help="usa varredura periódica mesmo com o watchdog instalado")
+    parser.add_argument('-v', '--verbose', action='store_true', help="mostra cada PDF recebido e gravado")
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    vigiar_pasta(args.input_directory, args.template_excel_path, args.output_excel_path, args.workers, args.cache,
+                 args.fila, usar_watchdog=not args.varredura, metricas_jsonl=args.metricas,
+                 perfil=args.perfil)
@@ -0,0 +1,188 @@
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+# As páginas já são reconhecidas em paralelo: o OpenMP do Tesseract em cada uma só disputaria os núcleos.
+# Precisa estar definido antes de a biblioteca ser carregada (vale também para o executável).
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+try:
+    # Importado aqui, na thread principal: o tesserocr instala tratadores de sinal e falha (ValueError)
+    # se importado pela primeira vez em outra thread; nesse caso fica só o pytesseract
+    import tesserocr
+except (ImportError, ValueError):
+    tesserocr = None
+
+# Motores de OCR para as páginas digitalizadas. Todos recebem uma lista de pixmaps (páginas ou regiões
+# já renderizadas em tons de cinza) e devolvem o texto de cada um, na mesma ordem.
+#
+# - MotorTesserocr mantém a API do Tesseract carregada no processo (tesserocr): o modelo de idioma é lido
+#   uma vez por handle e os handles são reaproveitados entre páginas e documentos do mesmo worker.
+# - MotorPytesseract chama o executável tesseract (pytesseract); um lote de várias imagens vai em uma
+#   única execução, pela lista de arquivos que o tesseract aceita como entrada.
+#
+# NFSE_OCR escolhe o motor: 'tesserocr', 'pytesseract' ou 'auto' (tesserocr se estiver instalado).
+# O pytesseract (que carrega o pandas, se instalado) e o PIL só são importados pelo MotorPytesseract.
+
+logger = logging.getLogger(__name__)
+
+MOTOR_OCR = os.environ.get('NFSE_OCR', 'auto')
+
+_REGEX_PSM = re.compile(r'--psm\s+(\d+)')
+
+
+def _pixmap_para_imagem(pix):
+    # A imagem PIL aponta para o buffer de amostras do pixmap, sem codificar e decodificar um PNG.
+    # O buffer pertence ao pixmap, que precisa continuar vivo enquanto a imagem for usada.
+    from PIL import Image
+
+    modo = 'L' if pix.n == 1 else 'RGB'
+    return Image.frombuffer(modo, (pix.width, pix.height), pix.samples_mv, 'raw', modo, pix.stride, 1)
+
+
+class MotorTesserocr:
+    """
+    OCR pela API do Tesseract carregada no processo. Cada handle (PyTessBaseAPI) atende uma thread por vez;
+    os handles livres ficam guardados e são reaproveitados, então o modelo só é carregado uma vez
+    para cada thread de OCR que trabalha ao mesmo tempo.
+    """
+
+    nome = 'tesserocr'
+
+    def __init__(self, config):
+        if tesserocr is None:
+            raise ImportError("tesserocr não está instalado")
+        match = _REGEX_PSM.search(config)
+        self._psm = int(match.group(1)) if match else tesserocr.PSM.AUTO
+        self._lock = threading.Lock()
+        self._livres = []
+        self._handles = []
+
+    def _emprestar(self):
+        with self._lock:
+            if self._livres:
+                return self._livres.pop()
+        api = tesserocr.PyTessBaseAPI(psm=self._psm)
+        with self._lock:
+            self._handles.append(api)
+        logger.debug("Handle do Tesseract carregado (%d no processo)", len(self._handles))
+        return api
+
+    def reconhecer(self, pixmaps):
+        api = self._emprestar()
+        try:
+            textos = []
+            for pix in pixmaps:
+                # Os bytes do pixmap vão direto para o Tesseract, sem passar por uma imagem PIL
+                api.SetImageBytes(pix.samples, pix.width, pix.height, pix.n, pix.stride)
+                textos.append(api.GetUTF8Text())
+            return textos
+        finally:
+            with self._lock:
+                self._livres.append(api)
+
+    def fechar(self):
+        with self._lock:
+            for api in self._handles:
+                api.End()
+            self._handles, self._livres = [], []
+
+
+class MotorPytesseract:
+    """
+    OCR pelo executável tesseract. Uma imagem vai direto ao pytesseract; várias vão em um só processo.
+    """
+
+    nome = 'pytesseract'
+
+    def __init__(self, config):
+        self.config = config
+
+    def reconhecer(self, pixmaps):
+        import pytesseract
+
+        imagens = [_pixmap_para_imagem(pix) for pix in pixmaps]
+        try:
+            if len(imagens) == 1:
+                return [pytesseract.image_to_string(imagens[0], config=self.config)]
+            return self._reconhecer_lote(imagens)
+        finally:
+            # As imagens soltam o buffer antes dos pixmaps serem liberados (o PyMuPDF recusa liberar um buffer em uso)
+            for img in imagens:
+                img.close()
+
+    def _reconhecer_lote(self, imagens):
+        import pytesseract
+
+        with tempfile.TemporaryDirectory(prefix='nfse_ocr_') as pasta:
+            caminhos = []
+            for indice, img in enumerate(imagens):
+                # PGM/PPM: gravação sem compressão, lida direto pelo Leptonica
+                caminho = os.path.join(pasta, f"{indice}.{'pgm' if img.mode == 'L' else 'ppm'}")
+                img.save(caminho)
+                caminhos.append(caminho)
+            lista = os.path.join(pasta, 'imagens.txt')
+            with open(lista, 'w', encoding='utf-8') as arquivo:
+                arquivo.write('\n'.join(caminhos) + '\n')
+            saida = pytesseract.image_to_string(lista, config=self.config)
+        # O tesseract separa as páginas da lista com form feed
+        textos = saida.split('\f')
+        if textos and not textos[-1].strip():
+            textos.pop()
+        if len(textos) != len(imagens):
+            logger.debug("Saída do lote com %d páginas para %d imagens; reconhecendo uma a uma", len(textos), len(imagens))
+            return [pytesseract.image_to_string(img, config=self.config) for img in imagens]
+        return textos
+
+    def fechar(self):
+        pass
+
+
+_motores = {}
+_lock_motores = threading.Lock()
+
+
+def obter_motor(config, nome=MOTOR_OCR):
+    """
+    Devolve o motor de OCR do processo para `config` (opções do tesseract, ex.: '--psm 3'), criando-o
+    na primeira chamada. Cada worker do pool tem o seu, que dura até o fim do processo.
+    """
+    with _lock_motores:
+        motor = _motores.get((nome, config))
+        if motor is None:
+            motor = _motores[(nome, config)] = _criar_motor(nome, config)
+    return motor
+
+def _criar_motor(nome, config):
+    if nome in ('auto', 'tesserocr'):
+        try:
+            motor = MotorTesserocr(config)
+            # Carrega já o primeiro handle: sem os dados de idioma (tessdata) o erro aparece aqui, não em cada página
+            motor.reconhecer([])
+            return motor
+        except (ImportError, RuntimeError) as e:
+            if nome == 'tesserocr':
+                raise
+            logger.info("tesserocr indisponível (%s); usando o executável tesseract pelo pytesseract", e)
+    return MotorPytesseract(config)
+
+def ocr_disponivel(config):
+    """
+    Indica se algum motor pode ser usado: cria o motor do processo para `config` (ver obter_motor), então o
+    tesserocr só conta se os dados de idioma (tessdata) forem encontrados; senão, o executável tesseract
+    precisa estar no PATH.
+    """
+    try:
+        motor = obter_motor(config)
+    except (ImportError, RuntimeError) as e:
+        logger.info("OCR indisponível: %s", e)
+        return False
+    if motor.nome == 'tesserocr':
+        return True
+    try:
+        import pytesseract
+    except ImportError:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
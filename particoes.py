@@ -0,0 +1,259 @@
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import asdict
+from functools import partial
+
+import metricas
+from cache_texto import CACHE_PADRAO, hash_arquivo
+from dados_nfse import DadosNFSe
+from modelos import (adicionar_opcoes_de_execucao, extract_text_from_pdf, extrair_dados, gravar_linhas_excel,
+                     iterar_em_pool, listar_pdfs)
+
+# Processamento em partições para lotes grandes demais para uma máquina só.
+# Cada PDF pertence a uma única partição i de N, escolhida por um hash estável do nome do arquivo (ou,
+# com por_conteudo, do SHA-256 do PDF), então N máquinas com a mesma pasta dividem o lote sem combinar
+# nada entre si. Cada partição grava as notas em JSON lines (ordenadas pelo nome do arquivo) e, por
+# último, um manifesto; partição sem manifesto é partição que não terminou.
+#
+# A mesclagem lê os parciais em ordem de nome de arquivo (heapq.merge), descarta notas repetidas pela
+# Chave de acesso (fica a do primeiro arquivo em ordem alfabética) e grava o Excel do modelo ou um
+# arquivo colunar; o resultado é o mesmo em qualquer ordem de término das partições.
+#
+#   python particoes.py executar pdfs/ parciais/ --shard 3/8        (em cada máquina, i de 1 a N)
+#   python particoes.py mesclar parciais/ saida.xlsx --modelo modelo.xlsx
+#   python particoes.py local pdfs/ parciais/ 4                     (as N partições como processos locais)
+
+logger = logging.getLogger(__name__)
+
+
+def interpretar_particao(texto):
+    """
+    Converte 'i/N' (i de 1 a N) em (i, N).
+    """
+    try:
+        indice, total = (int(parte) for parte in texto.split('/'))
+    except ValueError:
+        raise ValueError(f"Partição inválida: {texto!r} (use i/N, ex.: 3/8)")
+    if not 1 <= indice <= total:
+        raise ValueError(f"Partição inválida: {texto!r} (i deve ir de 1 a N)")
+    return indice, total
+
+def particao_do_arquivo(chave, total):
+    """
+    Partição (1 a `total`) de um arquivo pela sua chave (nome ou SHA-256). Usa SHA-1 em vez de hash(),
+    que muda a cada execução do Python.
+    """
+    return int.from_bytes(hashlib.sha1(chave.encode('utf-8')).digest()[:8], 'big') % total + 1
+
+def arquivos_da_particao(input_directory, indice, total, por_conteudo=False):
+    """
+    Lista, em ordem alfabética, os PDFs do diretório que pertencem à partição `indice` de `total`.
+    Com `por_conteudo` a chave é o SHA-256 (cópias do mesmo PDF caem na mesma partição), ao custo de
+    cada partição ler todos os arquivos para calcular o hash.
+    """
+    pdf_files = listar_pdfs(input_directory)
+    selecionados = []
+    for filename in pdf_files:
+        chave = hash_arquivo(os.path.join(input_directory, filename)) if por_conteudo else filename
+        if particao_do_arquivo(chave, total) == indice:
+            selecionados.append(filename)
+    return selecionados
+
+def caminhos_particao(saida_dir, indice, total):
+    base = os.path.join(saida_dir, f"particao-{indice:04d}-de-{total:04d}")
+    return base + '.jsonl', base + '.manifesto.json'
+
+def executar_particao(input_directory, saida_dir, indice, total, workers=None, cache=CACHE_PADRAO,
+                      por_conteudo=False, metricas_jsonl=None, perfil=None):
+    """
+    Extrai os PDFs da partição e grava o parcial (uma nota por linha) e o manifesto em `saida_dir`.
+    Devolve o manifesto. `metricas_jsonl` e `perfil` funcionam como em modelos.main.
+    """
+    os.makedirs(saida_dir, exist_ok=True)
+    parcial, manifesto_path = caminhos_particao(saida_dir, indice, total)
+    # Uma nova execução da partição invalida a anterior até terminar
+    if os.path.exists(manifesto_path):
+        os.remove(manifesto_path)
+
+    inicio = time.time()
+    with metricas.execucao(metricas_jsonl, perfil) as resumo:
+        pdf_files = arquivos_da_particao(input_directory, indice, total, por_conteudo)
+        logger.info("Partição %d/%d: %d PDFs", indice, total, len(pdf_files))
+        notas, falhas = _gravar_parcial(input_directory, pdf_files, parcial, workers, cache)
+
+    manifesto = {
+        'particao': indice, 'total': total, 'chave': 'conteudo' if por_conteudo else 'nome',
+        'notas': notas, 'sem_texto': falhas, 'parcial': os.path.basename(parcial),
+        'iniciado_em': inicio, 'concluido_em': time.time(), 'metricas': resumo,
+    }
+    # O manifesto é gravado por último: a existência dele indica que a partição terminou
+    temporario = manifesto_path + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=1)
+    os.replace(temporario, manifesto_path)
+    logger.info("Partição %d/%d concluída: %d notas em %s", indice, total, notas, parcial)
+    return manifesto
+
+def _gravar_parcial(input_directory, pdf_files, parcial, workers, cache):
+    pdf_paths = [os.path.join(input_directory, filename) for filename in pdf_files]
+    textos = iterar_em_pool(partial(extract_text_from_pdf, cache=cache), pdf_paths, workers, padrao="")
+    notas = falhas = 0
+    temporario = parcial + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as saida:
+        for filename, texto in zip(pdf_files, textos):
+            if not texto:
+                falhas += 1
+            with metricas.etapa('campos'):
+                dados = extrair_dados(texto)
+            metricas.registrar_campos(filename, dados.campos_encontrados())
+            saida.write(json.dumps(dict(asdict(dados), arquivo=filename), ensure_ascii=False) + '\n')
+            notas += 1
+    os.replace(temporario, parcial)
+    return notas, falhas
+
+def verificar_particoes(saida_dir, total=None):
+    """
+    Devolve (total, manifestos concluídos por índice, índices faltando). Sem `total`, usa o dos manifestos.
+    """
+    manifestos = {}
+    for nome in sorted(os.listdir(saida_dir)):
+        if nome.startswith('particao-') and nome.endswith('.manifesto.json'):
+            with open(os.path.join(saida_dir, nome), encoding='utf-8') as arquivo:
+                manifesto = json.load(arquivo)
+            if total is not None and manifesto['total'] != total:
+                continue
+            manifestos.setdefault(manifesto['total'], {})[manifesto['particao']] = manifesto
+    if total is None:
+        if len(manifestos) > 1:
+            raise ValueError(f"Parciais de divisões diferentes em {saida_dir} ({sorted(manifestos)} partições); "
+                             "informe o total")
+        if not manifestos:
+            raise ValueError(f"Nenhuma partição concluída em {saida_dir}")
+        total = next(iter(manifestos))
+    concluidas = manifestos.get(total, {})
+    chaves = {manifesto['chave'] for manifesto in concluidas.values()}
+    if len(chaves) > 1:
+        raise ValueError(f"Partições divididas por chaves diferentes em {saida_dir}: {sorted(chaves)}")
+    faltando = [indice for indice in range(1, total + 1) if indice not in concluidas]
+    return total, concluidas, faltando
+
+def _ler_parcial(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        for linha in arquivo:
+            registro = json.loads(linha)
+            arquivo_pdf = registro.pop('arquivo')
+            yield arquivo_pdf, DadosNFSe(**registro)
+
+def iter_notas_mescladas(saida_dir, concluidas):
+    """
+    Gera (arquivo, DadosNFSe) de todas as partições em ordem de nome de arquivo, sem as notas cuja
+    Chave de acesso já apareceu em um arquivo anterior.
+    """
+    parciais = [_ler_parcial(os.path.join(saida_dir, concluidas[indice]['parcial'])) for indice in sorted(concluidas)]
+    vistas = {}
+    for arquivo_pdf, dados in heapq.merge(*parciais, key=lambda registro: registro[0]):
+        chave = dados.chave_acesso
+        if chave:
+            if chave in vistas:
+                metricas.contar('duplicadas')
+                logger.warning("%s: nota duplicada de %s (Chave de acesso %s), ignorada", arquivo_pdf, vistas[chave], chave)
+                continue
+            vistas[chave] = arquivo_pdf
+        yield arquivo_pdf, dados
+
+def mesclar_particoes(saida_dir, output, template_excel_path=None, total=None, permitir_incompletas=False):
+    """
+    Junta os parciais em `output`: .xlsx (a partir de `template_excel_path`) ou .parquet/.csv/.jsonl.
+    Com partições faltando, nada é gravado e é lançado RuntimeError, salvo com `permitir_incompletas`.
+    Devolve a lista das partições que faltaram.
+    """
+    total, concluidas, faltando = verificar_particoes(saida_dir, total)
+    if faltando:
+        mensagem = f"{len(faltando)} de {total} partições sem manifesto: {', '.join(map(str, faltando))}"
+        if not permitir_incompletas:
+            raise RuntimeError(mensagem)
+        logger.warning("%s; mesclando só as concluídas", mensagem)
+
+    notas = iter_notas_mescladas(saida_dir, concluidas)
+    if output.lower().endswith('.xlsx'):
+        if not template_excel_path:
+            raise ValueError("A saída em Excel precisa do modelo (--modelo)")
+        gravar_linhas_excel((dados.linha_excel() for _, dados in notas), template_excel_path, output)
+    else:
+        # O pandas só é necessário para as saídas colunares
+        from exportacao import dataframe_de_registros, exportar, normalizar_dataframe
+        exportar(normalizar_dataframe(dataframe_de_registros(notas)), output)
+    logger.info("%d partições mescladas em %s", len(concluidas), output)
+    return faltando
+
+def executar_local(input_directory, saida_dir, total, workers_por_particao=1, cache=CACHE_PADRAO, por_conteudo=False,
+                   concorrencia=None):
+    """
+    Executa as `total` partições como processos locais (ver run.py) e devolve os Resultados de cada uma.
+    """
+    from run import executar_tarefas
+
+    tarefas = []
+    for indice in range(1, total + 1):
+        comando = [sys.executable, os.path.abspath(__file__), 'executar', input_directory, saida_dir,
+                   '--shard', f"{indice}/{total}", '--workers', str(workers_por_particao), '--cache', cache or '']
+        if por_conteudo:
+            comando.append('--conteudo')
+        tarefas.append((f"{indice}/{total}", comando))
+    return executar_tarefas(tarefas, concorrencia or total)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Divide o lote de PDFs em partições e junta os resultados.")
+    parser.add_argument('-v', '--verbose', action='store_true', help="mostra o andamento")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    executar = subcomandos.add_parser('executar', help="processa uma partição do lote")
+    executar.add_argument('input_directory')
+    executar.add_argument('saida_dir', help="pasta dos parciais e manifestos")
+    executar.add_argument('--shard', required=True, help="partição i/N, com i de 1 a N")
+    executar.add_argument('--conteudo', action='store_true', help="divide pelo SHA-256 do PDF em vez do nome")
+    adicionar_opcoes_de_execucao(executar, verbose=False)
+
+    mesclar = subcomandos.add_parser('mesclar', help="junta os parciais no Excel ou em um arquivo colunar")
+    mesclar.add_argument('saida_dir')
+    mesclar.add_argument('output', help="arquivo final (.xlsx, .parquet, .csv ou .jsonl)")
+    mesclar.add_argument('--modelo', default=None, help="modelo Excel (obrigatório para .xlsx)")
+    mesclar.add_argument('--total', type=int, default=None, help="número de partições esperado")
+    mesclar.add_argument('--incompleto', action='store_true', help="mescla mesmo com partições faltando")
+
+    local = subcomandos.add_parser('local', help="executa todas as partições como processos locais")
+    local.add_argument('input_directory')
+    local.add_argument('saida_dir')
+    local.add_argument('total', type=int)
+    local.add_argument('--conteudo', action='store_true', help="divide pelo SHA-256 do PDF em vez do nome")
+    local.add_argument('--workers', type=int, default=1, help="processos do pool em cada partição")
+    local.add_argument('--cache', default=CACHE_PADRAO, help="arquivo SQLite do cache de texto")
+    local.add_argument('-j', '--concorrencia', type=int, default=None, help="partições ao mesmo tempo (padrão: todas)")
+    args = parser.parse_args()
+
+    metricas.configurar_log('INFO' if args.verbose else 'WARNING')
+    if args.comando == 'executar':
+        indice, total = interpretar_particao(args.shard)
+        executar_particao(args.input_directory, args.saida_dir, indice, total, args.workers, args.cache,
+                          args.conteudo, args.metricas, args.perfil)
+    elif args.comando == 'mesclar':
+        try:
+            faltando = mesclar_particoes(args.saida_dir, args.output, args.modelo, args.total, args.incompleto)
+        except (RuntimeError, ValueError) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(2 if faltando else 0)
+    else:
+        from run import codigo_saida, imprimir_resumo
+
+        resultados = executar_local(args.input_directory, args.saida_dir, args.total, args.workers, args.cache,
+                                    args.conteudo, args.concorrencia)
+        imprimir_resumo(resultados)
+        sys.exit(codigo_saida(resultados))
@@ -1,27 +1,184 @@
+import argparse
+import os
+import signal
 import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+# Executa vários scripts de extração ao mesmo tempo, sem shell, até `concorrencia` de cada vez.
+# A saída de cada um é repassada linha a linha assim que é produzida, com o nome da tarefa na frente
+# ([nome] para stdout e [nome|erro] para stderr). Cada tarefa pode ter um tempo limite; ao estourar, o
+# processo e os filhos dele (ex.: os workers do pool de extração) são encerrados. No fim sai um resumo
+# com código de saída, tempo total e pico de memória (RSS) de cada tarefa.
+
+# Tarefas padrão quando nenhum script é informado na linha de comando
+TAREFAS_PADRAO = [
+    ('codigo1', [sys.executable, 'C:\\Users\\jhennifer.nascimento\\nfs\\novo.py']),
+    ('codigo2', [sys.executable, 'C:\\Users\\jhennifer.nascimento\\nfs\\novo.py']),
+]
+
+# Segundos que a saída ainda é lida depois que a tarefa termina: um processo que ela deixou para trás
+# (fora do grupo dela) pode manter os pipes abertos indefinidamente
+ESPERA_SAIDA = 5
+
+_POSIX = os.name == 'posix'
+
+
+@dataclass
+class Resultado:
+    """
+    Resultado de uma tarefa: código de saída (negativo quando encerrada por sinal), segundos do início ao fim
+    e pico de memória residente em KiB (None onde os.wait4 não existe, como no Windows).
+    """
+    nome: str
+    comando: list
+    codigo: int
+    segundos: float
+    pico_rss_kb: int = None
+    tempo_esgotado: bool = False
+
 
 def run_code(command):
-    # Run the command and capture the output
-    result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    """
+    Executa um comando (lista de argumentos ou caminho de script Python) sem shell e devolve (stdout, stderr).
+    """
+    if isinstance(command, str):
+        command = [sys.executable, command]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     return result.stdout, result.stderr
 
-# Código 1
-command1 = "C:\\Users\\jhennifer.nascimento\\nfs\\novo.py"  # Substitua pelo seu comando ou caminho do script
-output1, error1 = run_code(command1)
-
-# Código 2
-command2 = "C:\\Users\\jhennifer.nascimento\\nfs\\novo.py"  # Substitua pelo seu comando ou caminho do script
-output2, error2 = run_code(command2)
-
-# Exibindo os resultados
-print("Resultado do Código 1:")
-print(output1)
-if error1:
-    print("Erros no Código 1:")
-    print(error1)
-
-print("\nResultado do Código 2:")
-print(output2)
-if error2:
-    print("Erros no Código 2:")
-    print(error2)
+def executar_tarefas(tarefas, concorrencia=None, tempo_limite=None, saida=None):
+    """
+    Executa as tarefas [(nome, [programa, argumentos...]), ...] com no máximo `concorrencia` ao mesmo tempo
+    (None usa o número de núcleos) e devolve os Resultados na ordem das tarefas.
+    `tempo_limite` (segundos) vale para cada tarefa; `saida` recebe as linhas prefixadas (padrão: sys.stdout).
+    """
+    saida = saida or sys.stdout
+    lock_saida = threading.Lock()
+    concorrencia = concorrencia or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        futuros = [executor.submit(_executar_tarefa, nome, comando, tempo_limite, saida, lock_saida)
+                   for nome, comando in tarefas]
+        return [futuro.result() for futuro in futuros]
+
+def _executar_tarefa(nome, comando, tempo_limite, saida, lock_saida):
+    # Sem buffer no Python filho, para que as linhas cheguem enquanto ele roda
+    ambiente = dict(os.environ, PYTHONUNBUFFERED='1')
+    inicio = time.monotonic()
+    try:
+        # Em um grupo de processos próprio (POSIX) para encerrar também os filhos da tarefa
+        processo = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+                                    text=True, encoding='utf-8', errors='replace', bufsize=1, env=ambiente,
+                                    start_new_session=_POSIX)
+    except OSError as e:
+        _escrever(saida, lock_saida, f"[{nome}|erro] Não foi possível iniciar {comando[0]}: {e}\n")
+        return Resultado(nome, list(comando), 127, 0.0)
+
+    leitores = [threading.Thread(target=_repassar, args=(processo.stdout, f"[{nome}] ", saida, lock_saida), daemon=True),
+                threading.Thread(target=_repassar, args=(processo.stderr, f"[{nome}|erro] ", saida, lock_saida), daemon=True)]
+    for leitor in leitores:
+        leitor.start()
+
+    codigo, pico_rss_kb, esgotado = _aguardar(processo, tempo_limite)
+    segundos = time.monotonic() - inicio
+    prazo = time.monotonic() + ESPERA_SAIDA
+    for leitor in leitores:
+        leitor.join(max(0, prazo - time.monotonic()))
+    if esgotado:
+        _escrever(saida, lock_saida, f"[{nome}|erro] Tempo limite de {tempo_limite}s esgotado; tarefa encerrada\n")
+    if any(leitor.is_alive() for leitor in leitores):
+        _escrever(saida, lock_saida, f"[{nome}|erro] Um processo deixado pela tarefa mantém a saída aberta; "
+                                     f"ela deixou de ser aguardada {ESPERA_SAIDA}s depois do fim\n")
+    return Resultado(nome, list(comando), codigo, round(segundos, 3), pico_rss_kb, esgotado)
+
+def _aguardar(processo, tempo_limite=None):
+    """
+    Espera o processo terminar, encerrando-o com os filhos ao fim de `tempo_limite` segundos, e devolve
+    (código de saída, pico de RSS em KiB, se o tempo esgotou).
+    """
+    if not hasattr(os, 'wait4'):
+        try:
+            return processo.wait(timeout=tempo_limite), None, False
+        except subprocess.TimeoutExpired:
+            _encerrar(processo)
+            return processo.wait(), None, True
+    # os.wait4 recolhe o processo e devolve o uso de recursos dele, que o Popen.wait não expõe. O processo
+    # só é recolhido depois do encerramento: até lá o pid (e o grupo) não pode ser reutilizado por outro
+    prazo = time.monotonic() + tempo_limite if tempo_limite else None
+    esgotado = False
+    intervalo = 0.001
+    while True:
+        pid, status, uso = os.wait4(processo.pid, os.WNOHANG)
+        if pid:
+            break
+        if prazo is not None and not esgotado and time.monotonic() >= prazo:
+            _encerrar(processo)
+            esgotado = True
+        time.sleep(intervalo)
+        intervalo = min(intervalo * 2, 0.05)
+    processo.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss vem em KiB no Linux e em bytes no macOS
+    pico = uso.ru_maxrss // 1024 if sys.platform == 'darwin' else uso.ru_maxrss
+    return processo.returncode, pico, esgotado
+
+def _encerrar(processo):
+    try:
+        if _POSIX:
+            os.killpg(processo.pid, signal.SIGKILL)
+        else:
+            processo.kill()
+    except (ProcessLookupError, PermissionError):
+        # Já terminou
+        pass
+
+def _repassar(stream, prefixo, saida, lock_saida):
+    with stream:
+        for linha in stream:
+            _escrever(saida, lock_saida, prefixo + (linha if linha.endswith('\n') else linha + '\n'))
+
+def _escrever(saida, lock_saida, texto):
+    # Uma linha inteira por vez, para que as saídas das tarefas não se misturem no meio da linha
+    with lock_saida:
+        saida.write(texto)
+        saida.flush()
+
+def codigo_saida(resultados):
+    """
+    Código de saída do lote: 0 se todas as tarefas terminaram bem, senão o da primeira que falhou
+    (1 quando ela foi encerrada por sinal ou tempo limite).
+    """
+    for resultado in resultados:
+        if resultado.codigo != 0:
+            return resultado.codigo if resultado.codigo > 0 else 1
+    return 0
+
+def imprimir_resumo(resultados, saida=None):
+    saida = saida or sys.stdout
+    saida.write(f"\n{'tarefa':<20} {'código':>7} {'segundos':>9} {'pico RSS':>11}\n")
+    for resultado in resultados:
+        codigo = 'tempo' if resultado.tempo_esgotado else str(resultado.codigo)
+        rss = f"{resultado.pico_rss_kb / 1024:.1f} MiB" if resultado.pico_rss_kb is not None else '-'
+        saida.write(f"{resultado.nome:<20} {codigo:>7} {resultado.segundos:>9.2f} {rss:>11}\n")
+
+def _tarefas_de_scripts(scripts):
+    # O nome da tarefa é o do script; nomes repetidos recebem o número da posição
+    nomes = [os.path.splitext(os.path.basename(script))[0] for script in scripts]
+    return [(nome if nomes.count(nome) == 1 else f"{nome}#{indice}", [sys.executable, script])
+            for indice, (nome, script) in enumerate(zip(nomes, scripts), 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Executa scripts Python em paralelo com a saída de cada um prefixada.")
+    parser.add_argument('scripts', nargs='*', help="scripts a executar (padrão: os códigos 1 e 2)")
+    parser.add_argument('-j', '--concorrencia', type=int, default=None,
+                        help="tarefas ao mesmo tempo (padrão: número de núcleos)")
+    parser.add_argument('--tempo-limite', type=float, default=None, help="segundos por tarefa antes de encerrá-la")
+    args = parser.parse_args()
+
+    tarefas = _tarefas_de_scripts(args.scripts) if args.scripts else TAREFAS_PADRAO
+    resultados = executar_tarefas(tarefas, args.concorrencia, args.tempo_limite)
+    imprimir_resumo(resultados)
+    sys.exit(codigo_saida(resultados))
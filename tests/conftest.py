@@ -0,0 +1,70 @@
+import os
+import sys
+
+# Os módulos ficam na raiz do repositório, sem pacote
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def gerar_pdf(caminho, paginas, tamanho_fonte=9, largura=523):
+    """
+    Grava um PDF com uma página de texto por item de `paginas`, com o texto quebrado em linhas na
+    `largura` (pontos) como um leitor de PDF o mostraria.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open() as pdf:
+        for texto in paginas:
+            pagina = pdf.new_page()
+            pagina.insert_textbox(fitz.Rect(36, 36, 36 + largura, 806), texto.strip(), fontsize=tamanho_fonte)
+        pdf.save(str(caminho))
+    return str(caminho)
+
+def nota(numero, cnpj='43.035.146/0061-16', data='15/07/2024', chave=None):
+    """
+    Texto de uma NFS-e no leiaute de TEXTO_EXEMPLO com número, CNPJ do prestador, data de emissão e
+    Chave de acesso trocados (a chave padrão é derivada do número, então cada nota tem a sua).
+    """
+    from modelos import TEXTO_EXEMPLO
+
+    chave = chave or f"{31062001243035146006116240000000991824077484800000 + int(numero):050d}"
+    return (TEXTO_EXEMPLO.replace('Nº:2024/9918', f'Nº:2024/{numero}')
+            .replace('43.035.146/0061-16', cnpj)
+            .replace('Emitida em: 15/07/2024', f'Emitida em: {data}')
+            .replace('31062001243035146006116240000000991824077484851314', chave))
+
+def nota_dominio(numero, cnpj='43.035.146/0061-16'):
+    """
+    Texto de uma NFS-e no leiaute "domínio" (pares "Rótulo: valor") com número e CNPJ trocados.
+    """
+    return (f"CNPJ: {cnpj}\nRazão Social: Comercial Dominio Ltda\nUF: SP\nMunicípio: Campinas\n"
+            f"Endereço: Rua das Flores, 10\nNúmero do Documento: {numero}\nSérie: 1\nData: 01/08/2024\n"
+            "Situação: 0\nCFOP: 5933\nValor Serviços: R$ 1.000,00\nValor Descontos: R$ 0,00\n"
+            "Valor Contábil: R$ 1.000,00\nValor ISS: R$ 50,00\n")
+
+def gerar_modelo(caminho):
+    """
+    Grava um modelo Excel com as duas linhas de cabeçalho que antecedem LINHA_INICIAL.
+    """
+    import openpyxl
+
+    from dados_nfse import COLUNAS_EXCEL
+
+    wb = openpyxl.Workbook()
+    wb.active.append(['Notas de serviço'])
+    wb.active.append(list(COLUNAS_EXCEL))
+    wb.save(str(caminho))
+    return str(caminho)
+
+def linhas_excel(caminho):
+    """
+    Linhas de dados (a partir de LINHA_INICIAL) do Excel gravado, como tuplas.
+    """
+    import openpyxl
+
+    from modelos import LINHA_INICIAL
+
+    wb = openpyxl.load_workbook(str(caminho), read_only=True)
+    try:
+        return [tuple(linha) for linha in wb.active.iter_rows(min_row=LINHA_INICIAL, values_only=True)]
+    finally:
+        wb.close()
@@ -0,0 +1,44 @@
+import pytest
+
+from armazem import armazenar, consultar, exportar_do_armazem, intervalo_do_mes, resumo_armazem
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from dados_nfse import COLUNAS_EXCEL
+from modelos import main
+
+
+def _sem_chave(numero):
+    return nota(numero).replace('Chave de acesso', 'Chave')
+
+
+def test_notas_sem_chave_com_o_mesmo_nome_em_pastas_diferentes_nao_se_substituem(tmp_path):
+    armazem = str(tmp_path / 'notas.sqlite')
+    modelo = gerar_modelo(tmp_path / 'modelo.xlsx')
+    for numero, pasta in ((100, 'julho'), (101, 'agosto')):
+        entrada = tmp_path / pasta
+        entrada.mkdir()
+        gerar_pdf(entrada / 'nota.pdf', [_sem_chave(numero)])
+        # PDF sem texto: nada é extraído e nada vai para o armazém
+        gerar_pdf(entrada / 'vazio.pdf', [''])
+        main(str(entrada), modelo, str(tmp_path / f'{pasta}.xlsx'), workers=1, cache=None, armazem=armazem)
+
+    assert resumo_armazem(armazem)['notas'] == 2
+    assert sorted(dados.numero_documento for _, dados in consultar(armazem)) == ['2024/100', '2024/101']
+
+    # Gravar de novo a mesma nota substitui a anterior
+    list(armazenar([('nota.pdf', _sem_chave(102))], armazem, diretorio=str(tmp_path / 'julho')))
+    assert sorted(dados.numero_documento for _, dados in consultar(armazem)) == ['2024/101', '2024/102']
+
+    saida = tmp_path / 'exportado.xlsx'
+    assert exportar_do_armazem(armazem, str(saida), modelo) == 2
+    numeros = [linha[COLUNAS_EXCEL.index('numero_documento')] for linha in linhas_excel(saida)]
+    assert sorted(numeros) == ['2024/101', '2024/102']
+
+
+def test_intervalo_do_mes_termina_no_ultimo_dia():
+    assert intervalo_do_mes('2024-02') == ('2024-02-01', '2024-02-29')
+    assert intervalo_do_mes('2023-02') == ('2023-02-01', '2023-02-28')
+    assert intervalo_do_mes('04/2024') == ('2024-04-01', '2024-04-30')
+    assert intervalo_do_mes('2024-12') == ('2024-12-01', '2024-12-31')
+    for mes in ('2024-13', '2024-00', '2024-1', '13/2024', 'julho'):
+        with pytest.raises(ValueError):
+            intervalo_do_mes(mes)
@@ -0,0 +1,79 @@
+import shutil
+import sqlite3
+
+import metricas
+from cache_texto import gravar_cache, hash_arquivo, invalidar_cache, ler_cache, resumo_cache
+from conftest import gerar_pdf, nota
+from modelos import extract_text_from_pdf
+
+
+def test_ler_e_gravar_pela_chave(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    assert ler_cache(cache, 'abc', 'dpi=200') is None
+
+    gravar_cache(cache, 'abc', 'dpi=200', ['página 1', 'página 2'])
+    assert ler_cache(cache, 'abc', 'dpi=200') == ['página 1', 'página 2']
+    # Outra configuração de extração ou outro conteúdo não reaproveitam o texto
+    assert ler_cache(cache, 'abc', 'dpi=300') is None
+    assert ler_cache(cache, 'def', 'dpi=200') is None
+
+
+def test_documento_incompleto_nao_e_lido(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    gravar_cache(cache, 'abc', 'dpi=200', ['página 1', 'página 2'])
+    with sqlite3.connect(cache) as conexao:
+        conexao.execute('DELETE FROM paginas WHERE pagina = 1')
+    assert ler_cache(cache, 'abc', 'dpi=200') is None
+
+
+def test_chave_e_o_conteudo_do_pdf(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    original = gerar_pdf(tmp_path / 'original.pdf', [nota(100)])
+    copia = str(tmp_path / 'renomeado.pdf')
+    shutil.copy(original, copia)
+    alterado = gerar_pdf(tmp_path / 'alterado.pdf', [nota(101)])
+    assert hash_arquivo(original) == hash_arquivo(copia) != hash_arquivo(alterado)
+    with open(original, 'rb') as arquivo:
+        assert hash_arquivo(arquivo.read()) == hash_arquivo(original)
+
+    metricas.iniciar()
+    texto = extract_text_from_pdf(original, cache=cache)
+    assert 'paginas_cache' not in metricas.resumo()['contadores']
+
+    # O PDF renomeado tem o mesmo conteúdo: o texto vem do cache
+    metricas.iniciar()
+    assert extract_text_from_pdf(copia, cache=cache) == texto
+    assert metricas.resumo()['contadores']['paginas_cache'] == 1
+
+    metricas.iniciar()
+    assert '2024/101' in extract_text_from_pdf(alterado, cache=cache)
+    assert 'paginas_cache' not in metricas.resumo()['contadores']
+
+
+def test_excesso_descarta_os_menos_acessados(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    for sha256 in ('a', 'b', 'c'):
+        gravar_cache(cache, sha256, 'cfg', ['x' * 100], tamanho_maximo=1000)
+    # Acessar "a" o torna mais recente que "b"
+    assert ler_cache(cache, 'a', 'cfg') == ['x' * 100]
+
+    gravar_cache(cache, 'd', 'cfg', ['x' * 100], tamanho_maximo=350)
+    # 400 bytes passam do limite: sai o acessado há mais tempo até ficar em 90% (315 bytes)
+    assert ler_cache(cache, 'b', 'cfg') is None
+    assert [ler_cache(cache, sha256, 'cfg') is not None for sha256 in ('a', 'c', 'd')] == [True, True, True]
+    assert resumo_cache(cache) == {'documentos': 3, 'paginas': 3, 'tamanho': 300}
+
+
+def test_invalidar_um_documento_ou_todos(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    for config in ('dpi=200', 'dpi=300'):
+        gravar_cache(cache, 'a', config, ['página'])
+    gravar_cache(cache, 'b', 'dpi=200', ['página', 'outra'])
+
+    assert invalidar_cache(cache, 'a') == 2
+    assert ler_cache(cache, 'a', 'dpi=200') is None
+    assert ler_cache(cache, 'b', 'dpi=200') == ['página', 'outra']
+    assert invalidar_cache(cache, 'inexistente') == 0
+
+    assert invalidar_cache(cache) == 1
+    assert resumo_cache(cache) == {'documentos': 0, 'paginas': 0, 'tamanho': 0}
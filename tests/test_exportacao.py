@@ -0,0 +1,33 @@
+import json
+
+import pandas as pd
+
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from exportacao import main_exportacao
+
+
+def test_exporta_as_notas_com_tipos_e_o_excel_na_mesma_passagem(tmp_path):
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    gerar_pdf(entrada / 'a.pdf', [nota(100, data='01/08/2024')])
+    gerar_pdf(entrada / 'b.pdf', [nota(101, cnpj='12.345.678/0001-90')])
+    # Sem texto: a linha sai com os campos ausentes, não com "Não Encontrado"
+    gerar_pdf(entrada / 'c.pdf', [''])
+    parquet, jsonl, excel = tmp_path / 'notas.parquet', tmp_path / 'notas.jsonl', tmp_path / 'saida.xlsx'
+
+    df = main_exportacao(str(entrada), [str(parquet), str(jsonl)], gerar_modelo(tmp_path / 'modelo.xlsx'),
+                         str(excel), workers=1, cache=None)
+
+    assert list(df['arquivo']) == ['a.pdf', 'b.pdf', 'c.pdf']
+    assert df['valor_dos_servicos'].tolist()[:2] == [2921.54, 2921.54]
+    assert df['data'].iloc[0] == pd.Timestamp(2024, 8, 1)
+    assert list(df['cpf_cnpj'])[:2] == ['43035146006116', '12345678000190']
+    assert df[['numero_documento', 'valor_dos_servicos', 'data']].iloc[2].isna().all()
+
+    lido = pd.read_parquet(parquet)
+    assert lido['valor_dos_servicos'].dtype == 'float64'
+    assert lido['numero_documento'].tolist()[:2] == ['2024/100', '2024/101']
+    with open(jsonl, encoding='utf-8') as arquivo:
+        primeira = json.loads(arquivo.readline())
+    assert primeira['data'].startswith('2024-08-01')
+    assert len(linhas_excel(excel)) == 3
@@ -0,0 +1,75 @@
+import pytest
+
+from conftest import gerar_pdf
+from dados_nfse import DadosNFSe
+from extracao_espacial import IndicePagina, combinar_campos, extrair_campos_espaciais, extrair_dados_pdf_espacial
+from modelos import TEXTO_EXEMPLO, extrair_campos, normalizar_texto
+
+RAZAO_SOCIAL = 'PROTEGE PROTECAO E TRANSPORTE DE VALORES LTDA'
+ENDERECO = 'AVE PRESIDENTE CARLOS LUZ, 695, CAIÇARAS'
+
+
+def _indice(caminho):
+    import fitz
+
+    with fitz.open(caminho) as pdf:
+        return IndicePagina(pdf[0].get_text("words"))
+
+
+# Em 8 pt e 523 pt de largura o rótulo "Código de Verificação" quebra entre duas linhas e o primeiro Cep
+# fica na mesma linha do CPF/CNPJ do prestador
+@pytest.mark.parametrize('tamanho_fonte, largura', [(8, 523), (8, 560), (9, 523), (10, 400), (11, 450)])
+def test_razao_social_e_endereco_do_prestador(tmp_path, tamanho_fonte, largura):
+    caminho = gerar_pdf(tmp_path / 'nota.pdf', [TEXTO_EXEMPLO], tamanho_fonte, largura)
+    campos = extrair_campos_espaciais([_indice(caminho)])
+    assert campos['razao_social'] == RAZAO_SOCIAL
+    assert campos['endereco'] == ENDERECO
+    assert campos['cpf_cnpj'] == '43.035.146/0061-16'
+    assert campos['valor_dos_servicos'] == '2.921,54'
+
+
+def test_rotulo_quebrado_entre_linhas_nao_entra_no_valor(tmp_path):
+    indice = _indice(gerar_pdf(tmp_path / 'nota.pdf', [TEXTO_EXEMPLO], 8, 523))
+    linha, _, _ = indice.rotulos['codigo_verificacao'][0]
+    assert indice.linhas[linha][0][4] == 'Verificação:'
+    assert all(palavra not in indice.buscar('razao_social') for palavra in ('VERIFICAÇÃO', 'D18F199F'))
+
+
+@pytest.mark.parametrize('tamanho_fonte, largura', [(8, 523), (9, 523), (10, 400)])
+def test_nao_piora_o_motor_de_texto(tmp_path, tamanho_fonte, largura):
+    caminho = gerar_pdf(tmp_path / 'nota.pdf', [TEXTO_EXEMPLO], tamanho_fonte, largura)
+    esperado = extrair_campos(normalizar_texto(TEXTO_EXEMPLO))
+    dados = extrair_dados_pdf_espacial(caminho)
+    # Só a UF muda: "MG Telefone" não tem o formato de UF e a posição encontra "MG"
+    assert dados.uf == 'MG'
+    assert dados.razao_social == esperado.razao_social == RAZAO_SOCIAL
+    assert dados.endereco == esperado.endereco == ENDERECO
+    assert {campo: valor for campo, valor in vars(dados).items() if campo != 'uf'} == \
+        {campo: valor for campo, valor in vars(esperado).items() if campo != 'uf'}
+
+
+def test_valor_abaixo_do_rotulo(tmp_path):
+    import fitz
+
+    caminho = tmp_path / 'tabela.pdf'
+    with fitz.open() as pdf:
+        pagina = pdf.new_page()
+        pagina.insert_text((50, 100), 'Valor dos serviços', fontsize=10)
+        pagina.insert_text((200, 100), 'CFOP', fontsize=10)
+        pagina.insert_text((50, 114), '1.234,56', fontsize=10)
+        pagina.insert_text((200, 114), '5933', fontsize=10)
+        pdf.save(str(caminho))
+    dados = extrair_dados_pdf_espacial(str(caminho))
+    assert dados.valor_dos_servicos == '1.234,56'
+    assert dados.cfop == '5933'
+
+
+def test_combinar_prefere_o_texto_nos_campos_livres():
+    dados = DadosNFSe(razao_social='EMPRESA LTDA', uf='MG Telefone', valor_pis='0,00')
+    combinado = combinar_campos(dados, {'razao_social': 'OUTRA', 'uf': 'MG', 'valor_pis': '1,00', 'cfop': '5933'})
+    assert combinado.razao_social == 'EMPRESA LTDA'
+    assert combinado.uf == 'MG'
+    # Os dois valores têm o formato do campo: fica o do texto
+    assert combinado.valor_pis == '0,00'
+    # Campo que o texto não encontrou
+    assert combinado.cfop == '5933'
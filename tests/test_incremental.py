@@ -0,0 +1,45 @@
+import os
+
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from incremental import caminho_manifesto, carregar_manifesto, main_incremental
+from dados_nfse import COLUNAS_EXCEL
+from modelos import LINHA_INICIAL
+
+
+def _numeros(caminho):
+    coluna = COLUNAS_EXCEL.index('numero_documento')
+    return [linha[coluna] for linha in linhas_excel(caminho)]
+
+
+def _regravar(caminho, texto, deslocamento):
+    # Data de modificação posterior garantida, mesmo com o mesmo tamanho de arquivo
+    gerar_pdf(caminho, [texto])
+    mtime = os.stat(caminho).st_mtime + deslocamento
+    os.utime(caminho, (mtime, mtime))
+
+
+def test_arquivo_que_vira_duplicata_tem_a_linha_esvaziada_e_depois_reaproveitada(tmp_path):
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    gerar_pdf(entrada / 'a.pdf', [nota(100)])
+    gerar_pdf(entrada / 'b.pdf', [nota(101)])
+    modelo = gerar_modelo(tmp_path / 'modelo.xlsx')
+    saida = str(tmp_path / 'saida.xlsx')
+
+    main_incremental(str(entrada), modelo, saida, workers=1, cache=None)
+    assert _numeros(saida) == ['2024/100', '2024/101']
+
+    # b.pdf passa a ter a mesma nota (mesma Chave de acesso) que a.pdf
+    _regravar(entrada / 'b.pdf', nota(100), 10)
+    main_incremental(str(entrada), modelo, saida, workers=1, cache=None)
+    assert _numeros(saida) == ['2024/100', None]
+    manifesto = carregar_manifesto(caminho_manifesto(saida))
+    assert manifesto['arquivos']['b.pdf']['duplicada_de'] == 'a.pdf'
+
+    # Com uma nota própria de novo, b.pdf volta para a mesma linha
+    _regravar(entrada / 'b.pdf', nota(102), 20)
+    main_incremental(str(entrada), modelo, saida, workers=1, cache=None)
+    assert _numeros(saida) == ['2024/100', '2024/102']
+    manifesto = carregar_manifesto(caminho_manifesto(saida))
+    assert manifesto['arquivos']['b.pdf']['linha'] == LINHA_INICIAL + 1
+    assert manifesto['proxima_linha'] == LINHA_INICIAL + 2
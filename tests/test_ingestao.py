@@ -0,0 +1,59 @@
+import json
+import tarfile
+import zipfile
+
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from ingestao import listar_fonte, main_ingestao, membros_de_bytes
+
+
+def test_le_pdfs_de_zip_tar_e_pastas_sem_descompactar(tmp_path):
+    pdfs = tmp_path / 'pdfs'
+    pdfs.mkdir()
+    for numero in range(100, 106):
+        gerar_pdf(pdfs / f'{numero}.pdf', [nota(numero)])
+
+    compactado = tmp_path / 'notas.zip'
+    with zipfile.ZipFile(compactado, 'w', zipfile.ZIP_DEFLATED) as arquivo_zip:
+        arquivo_zip.write(pdfs / '100.pdf', 'julho/100.pdf')
+        arquivo_zip.write(pdfs / '101.pdf', '__MACOSX/julho/._101.pdf')
+        arquivo_zip.writestr('leia-me.txt', 'sem notas')
+    with tarfile.open(tmp_path / 'notas.tar', 'w') as tar:
+        tar.add(pdfs / '101.pdf', '101.pdf')
+    with tarfile.open(tmp_path / 'notas.tar.gz', 'w:gz') as tar:
+        tar.add(pdfs / '102.pdf', '102.pdf')
+    pasta = tmp_path / 'pasta'
+    pasta.mkdir()
+    (pdfs / '103.pdf').rename(pasta / '103.pdf')
+    (pdfs / '104.pdf').rename(pasta / '104.pdf')
+    fontes = [str(compactado), str(tmp_path / 'notas.tar'), str(tmp_path / 'notas.tar.gz'), str(pasta),
+              str(pdfs / '105.pdf')]
+
+    assert [str(documento) for documento in listar_fonte(str(compactado))] == [f'{compactado}!julho/100.pdf']
+
+    saida = tmp_path / 'notas.jsonl'
+    resumo = main_ingestao(fontes, str(saida), workers=2, cache=None)
+    with open(saida, encoding='utf-8') as arquivo:
+        notas = [json.loads(linha) for linha in arquivo]
+    assert [nota_lida['numero_documento'] for nota_lida in notas] == [f'2024/{numero}' for numero in range(100, 106)]
+    assert notas[0]['arquivo'] == f'{compactado}!julho/100.pdf'
+    assert resumo['contadores']['documentos'] == 6
+
+    excel = tmp_path / 'notas.xlsx'
+    main_ingestao(fontes, str(excel), gerar_modelo(tmp_path / 'modelo.xlsx'), workers=1, cache=None)
+    assert len(linhas_excel(excel)) == 6
+
+
+def test_membros_de_um_conteudo_em_memoria(tmp_path):
+    caminho = gerar_pdf(tmp_path / 'nota.pdf', [nota(100)])
+    with open(caminho, 'rb') as arquivo:
+        dados = arquivo.read()
+    assert [membro.nome for membro in membros_de_bytes(dados)] == ['documento.pdf']
+
+    compactado = tmp_path / 'anexo.zip'
+    with zipfile.ZipFile(compactado, 'w') as arquivo_zip:
+        arquivo_zip.writestr('a.pdf', dados)
+        arquivo_zip.writestr('b.PDF', dados)
+    membros = list(membros_de_bytes(compactado.read_bytes(), 'email'))
+    assert [str(membro) for membro in membros] == ['email!a.pdf', 'email!b.PDF']
+    assert membros[0].dados == dados
+    assert list(membros_de_bytes(b'texto qualquer')) == []
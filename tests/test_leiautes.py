@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import leiautes
+import metricas
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota, nota_dominio
+from dados_nfse import COLUNAS_EXCEL
+from extracao_espacial import extrair_dados_pdf_espacial
+from modelos import extrair_dados, main
+
+CNPJ = '43.035.146/0061-16'
+
+
+@pytest.fixture(autouse=True)
+def _sem_emitentes_guardados():
+    leiautes._leiautes_por_emitente.clear()
+    extrair_dados.cache_clear()
+    yield
+    leiautes._leiautes_por_emitente.clear()
+    extrair_dados.cache_clear()
+
+
+def _coluna(linha, campo):
+    return linha[COLUNAS_EXCEL.index(campo)]
+
+
+def test_main_usa_o_extrator_do_leiaute_de_cada_pdf(tmp_path):
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    gerar_pdf(entrada / 'a_bh.pdf', [nota(100)])
+    gerar_pdf(entrada / 'b_dominio.pdf', [nota_dominio(555, cnpj='12.345.678/0001-90')])
+    saida = tmp_path / 'saida.xlsx'
+
+    resumo = main(str(entrada), gerar_modelo(tmp_path / 'modelo.xlsx'), str(saida), workers=1, cache=None)
+
+    bh, dominio = linhas_excel(saida)
+    assert _coluna(bh, 'numero_documento') == '2024/100'
+    assert _coluna(bh, 'valor_dos_servicos') == '2.921,54'
+    assert _coluna(dominio, 'cpf_cnpj') == '12.345.678/0001-90'
+    assert _coluna(dominio, 'razao_social') == 'COMERCIAL DOMINIO LTDA'
+    assert _coluna(dominio, 'numero_documento') == '555'
+    assert _coluna(dominio, 'valor_iss_normal') == '50,00'
+    assert resumo['contadores']['leiaute_bh_iss_digital'] == 1
+    assert resumo['contadores']['leiaute_nfse_dominio'] == 1
+
+
+def test_emitente_que_muda_de_leiaute_e_identificado_de_novo():
+    metricas.iniciar()
+    assert leiautes.extrair_pelo_leiaute(nota(100))[0] == 'bh_iss_digital'
+
+    # Mesmo CNPJ: o leiaute guardado é tentado primeiro e deixa campos obrigatórios sem encontrar
+    nome, dados = leiautes.extrair_pelo_leiaute(nota_dominio(555))
+    assert nome == 'nfse_dominio'
+    assert dados.numero_documento == '555'
+    assert dados.valor_contabil == '1.000,00'
+    assert leiautes._leiautes_por_emitente[CNPJ] == 'nfse_dominio'
+    assert metricas.resumo()['contadores']['leiaute_trocado'] == 1
+
+    # E a próxima nota do emitente já sai pelo leiaute novo, sem nova comparação
+    assert leiautes.extrair_pelo_leiaute(nota_dominio(556))[0] == 'nfse_dominio'
+    assert metricas.resumo()['contadores']['leiaute_trocado'] == 1
+
+
+def test_extracao_espacial_usa_o_extrator_do_leiaute(tmp_path):
+    dados = extrair_dados_pdf_espacial(gerar_pdf(tmp_path / 'dominio.pdf', [nota_dominio(555)]))
+    assert dados.numero_documento == '555'
+    assert dados.valor_contabil == '1.000,00'
+    assert dados.razao_social == 'COMERCIAL DOMINIO LTDA'
+
+
+def test_registro_de_leiautes_nao_importa_modelos():
+    # Sob `python modelos.py`, importar modelos de novo criaria uma segunda cópia do motor e dos tipos
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    saida = subprocess.run([sys.executable, '-c', "import sys, leiautes; print('modelos' in sys.modules)"],
+                           cwd=raiz, capture_output=True, text=True, check=True).stdout
+    assert saida.strip() == 'False'
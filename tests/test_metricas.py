@@ -0,0 +1,19 @@
+import json
+
+import pytest
+
+import metricas
+
+
+def test_execucao_que_falha_grava_o_resumo_e_fecha_o_arquivo(tmp_path):
+    caminho = tmp_path / 'metricas.jsonl'
+    with pytest.raises(RuntimeError):
+        with metricas.execucao(str(caminho)) as resumo:
+            metricas.registrar_erro('a.pdf', ValueError("PDF corrompido"))
+            raise RuntimeError("falha no meio do lote")
+
+    assert resumo['contadores'] == {'erros': 1}
+    assert metricas._saida_jsonl is None
+    with open(caminho, encoding='utf-8') as arquivo:
+        eventos = [json.loads(linha) for linha in arquivo]
+    assert [evento['tipo'] for evento in eventos] == ['erro', 'resumo']
@@ -0,0 +1,137 @@
+import pytest
+
+import metricas
+import modelos
+from conftest import gerar_pdf, nota, nota_dominio
+from dados_nfse import CAMPOS_OBRIGATORIOS
+from modelos import (OCR_CONFIG, TEXTO_EXEMPLO, extract_data_from_text, extract_text_from_pdf, extrair_campos,
+                     normalizar_texto)
+from ocr import ocr_disponivel
+
+precisa_ocr = pytest.mark.skipif(not ocr_disponivel(OCR_CONFIG), reason="sem motor de OCR")
+
+
+def gerar_pdf_digitalizado(caminho, paginas, dpi=100):
+    """
+    Grava um PDF só com imagens: cada texto de `paginas` é renderizado a `dpi` e inserido como figura,
+    como faria um scanner.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open() as pdf:
+        for texto in paginas:
+            with fitz.open() as rascunho:
+                rascunho.new_page().insert_textbox(fitz.Rect(36, 36, 559, 806), texto, fontsize=11)
+                pix = rascunho[0].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            pagina = pdf.new_page()
+            pagina.insert_image(pagina.rect, pixmap=pix)
+        pdf.save(str(caminho))
+    return str(caminho)
+
+
+@precisa_ocr
+def test_ocr_adaptativo_para_depois_de_uma_pagina_sem_ganho(tmp_path):
+    # Anexos sem nenhum campo da nota: refazer a primeira a dpi_alto não acrescenta nada, e as outras não são refeitas
+    anexos = [f"ANEXO {numero}\ncomprovante de pagamento referente ao boleto {numero}" for numero in range(1, 5)]
+    caminho = gerar_pdf_digitalizado(tmp_path / 'anexos.pdf', anexos)
+
+    metricas.iniciar()
+    texto = extract_text_from_pdf(caminho, dpi_alto=150)
+
+    contadores = metricas.resumo()['contadores']
+    assert contadores['paginas_ocr'] == 4
+    assert contadores['paginas_ocr_alta'] == 1
+    assert [f"ANEXO {numero}" in texto for numero in range(1, 5)] == [True] * 4
+
+
+def test_falha_no_ocr_de_um_anexo_mantem_o_texto_da_nota(tmp_path, monkeypatch):
+    import fitz  # PyMuPDF
+
+    caminho = gerar_pdf(tmp_path / 'nota.pdf', [nota(100)])
+    anexo = gerar_pdf_digitalizado(tmp_path / 'anexo.pdf', ["ANEXO 1 comprovante"])
+    with fitz.open(caminho) as pdf, fitz.open(anexo) as digitalizado:
+        pdf.insert_pdf(digitalizado)
+        pdf.saveIncr()
+
+    def ocr_com_falha(pixmaps):
+        raise RuntimeError("falha simulada do Tesseract")
+
+    monkeypatch.setattr(modelos, '_ocr_pixmaps', ocr_com_falha)
+    cache = str(tmp_path / 'cache.sqlite')
+    for modo in ({}, {'campos': ('numero_documento', 'cfop')}):
+        metricas.iniciar()
+        texto = extract_text_from_pdf(caminho, cache=cache, **modo)
+        assert extrair_campos(texto).numero_documento == '2024/100'
+        assert metricas.resumo()['contadores']['paginas_ocr_falhas'] == 1
+        # O documento incompleto não vai para o cache: na próxima vez o anexo passa pelo OCR de novo
+        assert 'paginas_cache' not in metricas.resumo()['contadores']
+
+
+def test_extract_data_from_text_mantem_o_dicionario_de_sempre():
+    dados = extract_data_from_text(TEXTO_EXEMPLO.lower())
+    assert list(dados) == [
+        'cpf_cnpj', 'razao_social', 'uf', 'municipio', 'endereco', 'numero_documento', 'serie', 'data',
+        'valor_dos_servicos', 'valor_descontos', 'valor_contabil', 'base_calculo', 'aliquota_iss',
+        'valor_iss_normal', 'valor_iss_retido', 'valor_irrf', 'valor_pis', 'valor_cofins', 'valor_csll',
+    ]
+    # Rótulos em minúsculas continuam sendo encontrados
+    assert dados['valor_dos_servicos'] == '2.921,54'
+    assert dados['cpf_cnpj'] == '43.035.146/0061-16'
+    assert extract_data_from_text(TEXTO_EXEMPLO)['razao_social'] == 'PROTEGE PROTECAO E TRANSPORTE  DE VALORES LTDA'
+    assert extract_data_from_text("")['serie'] == "Não Encontrado"
+
+
+def test_rotulos_dos_anexos_depois_da_chave_de_acesso_sao_ignorados():
+    anexo = " ANEXO 1 Série: 7 CFOP: 5933 recibo de pagamento"
+    assert extrair_campos(TEXTO_EXEMPLO + anexo).serie == extrair_campos(TEXTO_EXEMPLO).serie
+    # Sem a Chave de acesso, o texto inteiro é varrido
+    sem_chave = TEXTO_EXEMPLO.replace('Chave de acesso', 'Chave') + anexo
+    assert extrair_campos(sem_chave).serie == '7'
+    assert extrair_campos(sem_chave).cfop == '5933'
+
+
+def test_leitura_sob_demanda_para_pelos_campos_do_leiaute(tmp_path):
+    # O domínio não traz a Base de Cálculo: a leitura para na nota, sem abrir o anexo
+    caminho = gerar_pdf(tmp_path / 'dominio.pdf', [nota_dominio(555), "ANEXO 1 comprovante"])
+    metricas.iniciar()
+    texto = extract_text_from_pdf(caminho, campos=CAMPOS_OBRIGATORIOS)
+    assert 'Número do Documento: 555' in texto
+    assert 'ANEXO' not in texto
+    assert metricas.resumo()['contadores']['parada_antecipada'] == 1
+
+
+def test_leitura_sob_demanda_usa_o_cache_na_segunda_vez(tmp_path):
+    cache = str(tmp_path / 'cache.sqlite')
+    nota_com_anexo = gerar_pdf(tmp_path / 'anexo.pdf', [nota(100), "ANEXO 1 comprovante"])
+    uma_pagina = gerar_pdf(tmp_path / 'nota.pdf', [nota(101)])
+    for caminho, paginas in ((nota_com_anexo, 1), (uma_pagina, 1)):
+        metricas.iniciar()
+        primeiro = extract_text_from_pdf(caminho, cache=cache, campos=CAMPOS_OBRIGATORIOS)
+        assert 'paginas_cache' not in metricas.resumo()['contadores']
+
+        metricas.iniciar()
+        assert extract_text_from_pdf(caminho, cache=cache, campos=CAMPOS_OBRIGATORIOS) == primeiro
+        contadores = metricas.resumo()['contadores']
+        assert contadores['paginas_cache'] == paginas
+        assert 'paginas_texto' not in contadores
+
+    # As páginas lidas sob demanda não valem como o documento inteiro
+    metricas.iniciar()
+    assert 'ANEXO 1' in extract_text_from_pdf(nota_com_anexo, cache=cache)
+    assert 'paginas_cache' not in metricas.resumo()['contadores']
+
+
+def test_ocr_adaptativo_considera_os_campos_do_leiaute():
+    assert modelos._campos_faltando(nota_dominio(555), CAMPOS_OBRIGATORIOS) == []
+    assert modelos._campos_faltando(nota_dominio(555).replace('Valor Serviços', 'Serviços'),
+                                    CAMPOS_OBRIGATORIOS) == ['valor_dos_servicos']
+
+
+@precisa_ocr
+def test_nota_dominio_digitalizada_nao_e_refeita_a_dpi_alto(tmp_path):
+    # Sem cedilha: o modelo de OCR em inglês lê "Serviços" como "Servigos"
+    caminho = gerar_pdf_digitalizado(tmp_path / 'dominio.pdf', [nota_dominio(555).replace('ç', 'c')], dpi=200)
+    metricas.iniciar()
+    texto = extract_text_from_pdf(caminho, dpi=200, dpi_alto=300)
+    assert modelos.extrair_dados(normalizar_texto(texto)).numero_documento == '555'
+    assert 'paginas_ocr_alta' not in metricas.resumo()['contadores']
@@ -0,0 +1,56 @@
+import asyncio
+import os
+import threading
+import time
+from functools import partial
+
+import metricas
+import monitor
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from modelos import extract_text_from_pdf
+
+
+def extrair_ou_derrubar(pdf_path):
+    # Roda no worker: o "crash.pdf" derruba o processo como uma falha nativa do MuPDF
+    if os.path.basename(pdf_path).startswith('crash'):
+        os._exit(1)
+    # Os demais demoram o bastante para ainda estarem no pool quando ele cai
+    time.sleep(1.0)
+    return extract_text_from_pdf(pdf_path)
+
+
+def _executar_ate(vigia, condicao, limite=30):
+    parar = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(vigia.executar(parar),), daemon=True)
+    thread.start()
+    try:
+        fim = time.monotonic() + limite
+        while not condicao() and time.monotonic() < fim:
+            time.sleep(0.1)
+    finally:
+        parar.set()
+        thread.join(limite)
+    assert condicao()
+
+
+def test_pool_derrubado_so_marca_o_pdf_defeituoso(tmp_path, monkeypatch):
+    monkeypatch.setattr(monitor, 'ESPERA_ESTAVEL', 0.0)
+    monkeypatch.setattr(monitor, 'INTERVALO_VARREDURA', 0.1)
+    monkeypatch.setattr(monitor, 'PASSO', 0.1)
+    entrada = tmp_path / 'entrada'
+    entrada.mkdir()
+    for numero, nome in enumerate(['a.pdf', 'b.pdf', 'crash.pdf', 'c.pdf'], 100):
+        gerar_pdf(entrada / nome, [nota(numero)])
+    saida = tmp_path / 'saida.xlsx'
+
+    metricas.iniciar()
+    vigia = monitor.Monitor(entrada, gerar_modelo(tmp_path / 'modelo.xlsx'), str(saida), workers=4, cache=None,
+                            usar_watchdog=False)
+    vigia.extrair = partial(metricas.medir_documento, extrair_ou_derrubar)
+    _executar_ate(vigia, lambda: len(vigia.manifesto['arquivos']) == 3 and 'crash.pdf' in vigia.falhas)
+
+    assert set(vigia.falhas) == {'crash.pdf'}
+    assert set(vigia.manifesto['arquivos']) == {'a.pdf', 'b.pdf', 'c.pdf'}
+    numeros = sorted(linha[5] for linha in linhas_excel(saida))
+    assert numeros == ['2024/100', '2024/101', '2024/103']
+    assert metricas.resumo()['contadores'].get('refeitos_isolados', 0) >= 1
@@ -0,0 +1,32 @@
+import pytest
+
+from conftest import gerar_modelo, gerar_pdf, linhas_excel, nota
+from dados_nfse import COLUNAS_EXCEL
+from particoes import arquivos_da_particao, executar_particao, mesclar_particoes
+
+
+def test_particoes_dividem_o_lote_e_a_mescla_junta_tudo_sem_duplicadas(tmp_path):
+    entrada, saida_dir = tmp_path / 'entrada', str(tmp_path / 'parciais')
+    entrada.mkdir()
+    for numero in range(100, 106):
+        gerar_pdf(entrada / f'{numero}.pdf', [nota(numero)])
+    # Cópia da nota 100 com outro nome: mesma Chave de acesso
+    gerar_pdf(entrada / 'copia.pdf', [nota(100)])
+    modelo = gerar_modelo(tmp_path / 'modelo.xlsx')
+    saida = str(tmp_path / 'saida.xlsx')
+
+    particoes = [arquivos_da_particao(str(entrada), indice, 3) for indice in (1, 2, 3)]
+    assert sorted(sum(particoes, [])) == sorted(f.name for f in entrada.iterdir())
+
+    executar_particao(str(entrada), saida_dir, 1, 3, workers=1, cache=None)
+    executar_particao(str(entrada), saida_dir, 2, 3, workers=1, cache=None)
+    with pytest.raises(RuntimeError):
+        mesclar_particoes(saida_dir, saida, modelo)
+    assert mesclar_particoes(saida_dir, saida, modelo, permitir_incompletas=True) == [3]
+
+    manifesto = executar_particao(str(entrada), saida_dir, 3, 3, workers=1, cache=None)
+    assert manifesto['notas'] == len(particoes[2])
+    assert manifesto['metricas']['contadores']['documentos'] == len(particoes[2])
+    assert mesclar_particoes(saida_dir, saida, modelo) == []
+    numeros = [linha[COLUNAS_EXCEL.index('numero_documento')] for linha in linhas_excel(saida)]
+    assert numeros == [f'2024/{numero}' for numero in range(100, 106)]
@@ -0,0 +1,93 @@
+import io
+import os
+import signal
+import sys
+import time
+
+import run
+
+
+def _python(codigo):
+    return [sys.executable, '-c', codigo]
+
+# Cada tarefa imprime o instante em que começou e o em que terminou
+_INTERVALO = "import time; print(time.time()); time.sleep(0.3); print(time.time())"
+
+
+def _intervalos(saida, nomes):
+    linhas = saida.getvalue().splitlines()
+    intervalos = []
+    for nome in nomes:
+        valores = [float(linha.split('] ', 1)[1]) for linha in linhas if linha.startswith(f"[{nome}] ")]
+        intervalos.append(tuple(valores))
+    return sorted(intervalos)
+
+
+def test_concorrencia_limita_as_tarefas_simultaneas():
+    nomes = ['a', 'b', 'c']
+    tarefas = [(nome, _python(_INTERVALO)) for nome in nomes]
+
+    saida = io.StringIO()
+    run.executar_tarefas(tarefas, concorrencia=1, saida=saida)
+    intervalos = _intervalos(saida, nomes)
+    assert all(fim <= inicio for (_, fim), (inicio, _) in zip(intervalos, intervalos[1:]))
+
+    saida = io.StringIO()
+    run.executar_tarefas(tarefas, concorrencia=3, saida=saida)
+    intervalos = _intervalos(saida, nomes)
+    assert any(fim > inicio for (_, fim), (inicio, _) in zip(intervalos, intervalos[1:]))
+
+
+def test_codigos_de_saida_sao_coletados_na_ordem_das_tarefas():
+    tarefas = [('ok', _python("pass")),
+               ('falha', _python("raise SystemExit(3)")),
+               ('inexistente', ['/nao/existe/programa'])]
+    resultados = run.executar_tarefas(tarefas, concorrencia=2, saida=io.StringIO())
+
+    assert [resultado.nome for resultado in resultados] == ['ok', 'falha', 'inexistente']
+    assert [resultado.codigo for resultado in resultados] == [0, 3, 127]
+    assert run.codigo_saida(resultados) == 3
+    assert run.codigo_saida(resultados[:1]) == 0
+
+
+def test_saida_repassada_com_o_nome_da_tarefa():
+    codigo = "import sys; print('linha 1'); print('problema', file=sys.stderr); print('linha 2', end='')"
+    saida = io.StringIO()
+    run.executar_tarefas([('tarefa', _python(codigo))], saida=saida)
+
+    linhas = saida.getvalue().splitlines()
+    assert [linha for linha in linhas if linha.startswith('[tarefa] ')] == ['[tarefa] linha 1', '[tarefa] linha 2']
+    assert linhas.count('[tarefa|erro] problema') == 1
+
+
+def test_tempo_limite_encerra_a_tarefa_e_os_filhos():
+    # O filho herda os pipes; sem encerrar o grupo inteiro a leitura da saída ficaria presa nele
+    codigo = ("import subprocess, sys, time; "
+              "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)']); time.sleep(30)")
+    saida = io.StringIO()
+    inicio = time.monotonic()
+    [resultado] = run.executar_tarefas([('lenta', _python(codigo))], tempo_limite=0.5, saida=saida)
+
+    assert time.monotonic() - inicio < 10
+    assert resultado.tempo_esgotado
+    assert resultado.codigo == -signal.SIGKILL
+    assert run.codigo_saida([resultado]) == 1
+    assert '[lenta|erro] Tempo limite de 0.5s esgotado' in saida.getvalue()
+
+
+def test_processo_deixado_pela_tarefa_nao_prende_a_leitura(monkeypatch):
+    monkeypatch.setattr(run, 'ESPERA_SAIDA', 0.5)
+    # Um neto em outra sessão escapa do encerramento do grupo e mantém os pipes abertos
+    codigo = ("import subprocess, sys; "
+              "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'], start_new_session=True); "
+              "print(p.pid)")
+    saida = io.StringIO()
+    inicio = time.monotonic()
+    [resultado] = run.executar_tarefas([('deixa', _python(codigo))], saida=saida)
+    try:
+        assert time.monotonic() - inicio < 10
+        assert resultado.codigo == 0 and not resultado.tempo_esgotado
+        assert 'mantém a saída aberta' in saida.getvalue()
+    finally:
+        neto = int(saida.getvalue().splitlines()[0].split('] ', 1)[1])
+        os.kill(neto, signal.SIGKILL)